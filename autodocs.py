@@ -1,17 +1,62 @@
 # -*- coding: utf-8 -*-
-import tkinter as tk
-from tkinter import messagebox
-import gspread
-from google.oauth2.service_account import Credentials
-from gspread.utils import rowcol_to_a1
-from docx import Document
+# Tkinter é importado apenas nas funções da interface: o modo linha de comando roda sem display.
+# gspread, python-docx, lxml e openpyxl são importados no primeiro uso (ver _ModuloTardio): a janela abre sem esperar por eles.
+import time
+_INICIO_MODULO = time.perf_counter()
 from pathlib import Path
 import re
 import os
 import sys
-import time
-import openpyxl                     # Para manipular arquivos Excel .xlsx
-from openpyxl.utils.exceptions import InvalidFileException # Para tratar erros de arquivo Excel inválido
+import io
+import collections.abc
+import contextlib
+import copy
+import datetime
+import functools
+import hashlib
+import importlib
+import sqlite3
+import struct
+import zipfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import multiprocessing
+import threading
+import queue
+import argparse
+import bisect
+import json
+import logging
+
+# --- Importação tardia dos módulos pesados ---
+_tempos_importacao = {} # módulo -> segundos gastos na importação (relatório do --profile-startup)
+
+def _importar(nome):
+    """Importa `nome` registrando o tempo gasto (só a primeira importação custa algo)."""
+    inicio = time.perf_counter()
+    ja_carregado = nome in sys.modules
+    modulo = importlib.import_module(nome)
+    if not ja_carregado: _tempos_importacao[nome] = time.perf_counter() - inicio
+    return modulo
+
+class _ModuloTardio:
+    """Representa um módulo que só é importado no primeiro acesso a um atributo."""
+    def __init__(self, nome):
+        self._nome = nome
+        self._modulo = None
+
+    def __getattr__(self, atributo):
+        if self._modulo is None: self._modulo = _importar(self._nome)
+        return getattr(self._modulo, atributo)
+
+gspread = _ModuloTardio("gspread")     # Planilhas (só ao carregar/gravar)
+docx = _ModuloTardio("docx")           # python-docx (só ao gerar DOCX)
+etree = _ModuloTardio("lxml.etree")    # XML dos templates (só ao gerar)
+openpyxl = _ModuloTardio("openpyxl")   # Para manipular arquivos Excel .xlsx (só no motor openpyxl)
+
+def qn(tag): return docx.oxml.ns.qn(tag)
+def parse_xml(xml): return docx.oxml.parse_xml(xml)
+def serialize_part_xml(elemento): return docx.opc.oxml.serialize_part_xml(elemento)
 
 # ==============================================================================
 # 1. FUNÇÃO AUXILIAR PARA CAMINHOS (PyInstaller)
@@ -34,6 +79,17 @@ def resource_path(relative_path):
 # 2. CONFIGURAÇÕES GLOBAIS E CONSTANTES
 # ==============================================================================
 DEBUG_MODE = False # Mude para True para ver mais logs detalhados no console
+MODO_GUI = False # Ligado ao abrir a interface; fora dela os avisos vão para o log (sem messagebox)
+PERFIL_PARTIDA = False # --profile-startup: imprime no stderr o tempo de partida, de extração e de importação por módulo
+
+# --- Códigos de saída (modo linha de comando) ---
+SAIDA_OK = 0
+SAIDA_ERRO_FATAL = 1     # Credenciais, rede, erro inesperado
+SAIDA_USO = 2            # Argumentos inválidos (mesmo código do argparse)
+SAIDA_ERRO_PLANILHA = 3  # Planilha/aba não encontrada ou cabeçalho inválido
+SAIDA_COM_ERROS = 4      # Concluído, mas com registros/status que falharam
+
+log = logging.getLogger("autodocs")
 
 # --- Caminhos e Arquivos ---
 PASTA_SAIDA = "docs_gerados" # Será criada onde o script/exe rodar
@@ -55,6 +111,17 @@ PJ_TAB_NAME = "Respostas ao formulário PJ"
 TEMPLATE_PF_DOCX = [PASTA_TEMPLATES / f"PF{i}- {name}.docx" for i, name in enumerate(["FICHA DE INSCRICAO", "INSTRUMENTO", "PROPOSTA DE ADMISSAO", "TERMO DE ADESAO"], 1)]
 TEMPLATE_PJ_DOCX = [PASTA_TEMPLATES / f"PJ{i}- {name}.docx" for i, name in enumerate(["FICHA DE INSCRICAO", "INSTRUMENTO", "PROPOSTA DE ADMISSAO", "TERMO DE ADESAO"], 1)]
 
+# --- Motor de geração DOCX ---
+# "python-docx": abre o template com python-docx (em cache) e salva o pacote inteiro.
+# "zip": reescreve só as partes XML com placeholders e copia o resto do zip byte a byte (lotes grandes).
+MOTOR_DOCX = "python-docx"
+
+# --- Motor de geração XLSX ---
+# "zip": altera só xl/sharedStrings.xml (e abas com strings inline) e copia o resto do pacote byte a byte.
+#        Templates que ele não suporta (ex.: placeholder dentro de fórmula) caem automaticamente no openpyxl.
+# "openpyxl": carrega e salva o workbook inteiro com openpyxl a cada registro.
+MOTOR_XLSX = "zip"
+
 # --- Templates XLSX ---
 TEMPLATE_PF_XLSX = [PASTA_TEMPLATES / "PF - FORMULARIO DE MOBILIZAÇÃO.xlsx"]
 TEMPLATE_PJ_XLSX = [PASTA_TEMPLATES / "PJ - FORMULARIO DE MOBILIZAÇÃO.xlsx"]
@@ -68,14 +135,155 @@ COL_PJ_ID_TRIGGER = "CNPJ - (SOMENTE NÚMERO)"
 COL_PJ_ID_COMPARISON = "CNPJ (somente número)"
 STATUS_COL = "Status" # Coluna para marcar como "GERADO"
 
+# ==============================================================================
+# 2.1 INSTRUMENTAÇÃO (spans por etapa, contadores, log JSON-lines, resumo p50/p95)
+# ==============================================================================
+# `with medir("etapa"):` cronometra um trecho e `contar("nome", n)` soma um contador. Os spans, contadores, avisos e
+# logs viram eventos JSON (um por linha, com nível) em ARQUIVO_LOG_JSON, e o resumo do fim da execução mostra
+# p50/p95 por etapa. Nos processos de geração, spans e eventos ficam em memória e voltam ao processo principal
+# junto com o resultado de cada registro (drenar_instrumentacao / mesclar_instrumentacao).
+ARQUIVO_LOG_JSON = None # --log-json ARQUIVO: eventos estruturados (nível info; debug com --debug)
+MEDIR_MEMORIA = False   # --tracemalloc: pico de memória no resumo (deixa a execução mais lenta)
+NIVEIS_LOG = {'debug': logging.DEBUG, 'info': logging.INFO, 'aviso': logging.WARNING, 'erro': logging.ERROR}
+
+_trava_instrumentacao = threading.Lock()
+_duracoes = {}      # Etapa -> [segundos de cada ocorrência]
+_contadores = {}    # Nome -> total
+_arquivo_log_json = None # Aberto por iniciar_instrumentacao, no processo principal
+_eventos_worker = None   # Nos processos de geração: eventos guardados para o processo principal gravar
+_em_worker = False
+_pico_memoria_workers = 0
+
+def _emitir_evento(nivel, evento, /, **campos):
+    """Grava um evento no log JSON (ou guarda, num worker); abaixo do nível configurado, descarta."""
+    if _arquivo_log_json is None and _eventos_worker is None: return
+    if NIVEIS_LOG[nivel] < (logging.DEBUG if DEBUG_MODE else logging.INFO): return
+    linha = {'ts': round(time.time(), 6), 'nivel': nivel, 'evento': evento, 'pid': os.getpid(),
+             **{chave: valor for chave, valor in campos.items() if valor is not None}}
+    with _trava_instrumentacao:
+        if _eventos_worker is not None: _eventos_worker.append(linha)
+        else: _arquivo_log_json.write(json.dumps(linha, ensure_ascii=False, default=str) + "\n")
+
+def registrar_duracao(etapa, segundos, nivel='info', /, **campos):
+    with _trava_instrumentacao:
+        _duracoes.setdefault(etapa, []).append(segundos)
+    _emitir_evento(nivel, 'span', etapa=etapa, ms=round(segundos * 1000, 3), **campos)
+
+@contextlib.contextmanager
+def medir(etapa, nivel='info', /, **campos):
+    """Span: cronometra o bloco (também quando ele levanta exceção, que vai no evento)."""
+    inicio = time.perf_counter()
+    erro = None
+    try:
+        yield
+    except BaseException as e:
+        erro = type(e).__name__
+        raise
+    finally:
+        registrar_duracao(etapa, time.perf_counter() - inicio, nivel, erro=erro, **campos)
+
+def contar(nome, quantidade=1):
+    if not quantidade: return
+    with _trava_instrumentacao:
+        _contadores[nome] = _contadores.get(nome, 0) + quantidade
+    _emitir_evento('debug', 'contador', nome=nome, quantidade=quantidade)
+
+class _ManipuladorLogJSON(logging.Handler):
+    """Repassa o logger do autodocs para o log JSON."""
+    def emit(self, registro):
+        nivel = 'erro' if registro.levelno >= logging.ERROR else 'aviso' if registro.levelno >= logging.WARNING else 'info' if registro.levelno >= logging.INFO else 'debug'
+        _emitir_evento(nivel, 'log', mensagem=registro.getMessage())
+
+def iniciar_instrumentacao():
+    """Abre o log JSON e liga o tracemalloc, conforme a configuração (processo principal)."""
+    global _arquivo_log_json
+    if ARQUIVO_LOG_JSON and _arquivo_log_json is None:
+        _arquivo_log_json = open(ARQUIVO_LOG_JSON, 'a', encoding='utf-8', buffering=1) # Uma linha por evento, já no disco
+        log.addHandler(_ManipuladorLogJSON())
+        _emitir_evento('info', 'inicio', argv=sys.argv[1:])
+    if MEDIR_MEMORIA:
+        import tracemalloc
+        if not tracemalloc.is_tracing(): tracemalloc.start()
+
+def drenar_instrumentacao():
+    """Entrega e zera o que foi medido neste processo (o worker manda isso junto com o resultado do registro)."""
+    global _eventos_worker
+    with _trava_instrumentacao:
+        dados = {'duracoes': dict(_duracoes), 'contadores': dict(_contadores), 'eventos': _eventos_worker or []}
+        _duracoes.clear(); _contadores.clear()
+        if _eventos_worker is not None: _eventos_worker = []
+    if MEDIR_MEMORIA:
+        import tracemalloc
+        dados['pico_memoria'] = tracemalloc.get_traced_memory()[1]
+    return dados
+
+def mesclar_instrumentacao(dados):
+    """Soma no processo principal o que um worker mediu e grava os eventos dele."""
+    global _pico_memoria_workers
+    with _trava_instrumentacao:
+        for etapa, valores in dados['duracoes'].items(): _duracoes.setdefault(etapa, []).extend(valores)
+        for nome, quantidade in dados['contadores'].items(): _contadores[nome] = _contadores.get(nome, 0) + quantidade
+        _pico_memoria_workers = max(_pico_memoria_workers, dados.get('pico_memoria', 0))
+        if _arquivo_log_json is not None:
+            for evento in dados['eventos']: _arquivo_log_json.write(json.dumps(evento, ensure_ascii=False, default=str) + "\n")
+
+def _percentil(valores_ordenados, p):
+    """Percentil pelo método do posto mais próximo."""
+    return valores_ordenados[max(0, -(-len(valores_ordenados) * p // 100) - 1)]
+
+def resumo_instrumentacao():
+    """Etapas (ocorrências, total, p50/p95/máx em ms), contadores e, com MEDIR_MEMORIA, picos de memória em MB."""
+    with _trava_instrumentacao:
+        duracoes = {etapa: sorted(valores) for etapa, valores in _duracoes.items()}
+        resumo = {'etapas': {etapa: {'n': len(v), 'total_s': round(sum(v), 3), 'p50_ms': round(_percentil(v, 50) * 1000, 2),
+                                     'p95_ms': round(_percentil(v, 95) * 1000, 2), 'max_ms': round(v[-1] * 1000, 2)}
+                             for etapa, v in duracoes.items()},
+                  'contadores': dict(_contadores)}
+    if MEDIR_MEMORIA:
+        import tracemalloc
+        if tracemalloc.is_tracing():
+            resumo['memoria_pico_mb'] = round(tracemalloc.get_traced_memory()[1] / 2 ** 20, 1)
+        if _pico_memoria_workers: resumo['memoria_pico_worker_mb'] = round(_pico_memoria_workers / 2 ** 20, 1)
+    return resumo
+
+def imprimir_resumo_instrumentacao(titulo="Resumo por etapa"):
+    """Tabela do fim da execução (e evento 'resumo' no log JSON)."""
+    resumo = resumo_instrumentacao()
+    if not resumo['etapas'] and not resumo['contadores']: return
+    print(f"\n--- {titulo} ---")
+    print(f" {'Etapa':<34} {'n':>6} {'total s':>9} {'p50 ms':>9} {'p95 ms':>9} {'máx ms':>9}")
+    for etapa, d in sorted(resumo['etapas'].items(), key=lambda item: -item[1]['total_s']):
+        print(f" {etapa:<34} {d['n']:>6} {d['total_s']:>9.2f} {d['p50_ms']:>9.1f} {d['p95_ms']:>9.1f} {d['max_ms']:>9.1f}")
+    if resumo['contadores']:
+        print(" Contadores: " + ", ".join(f"{nome}={valor}" for nome, valor in sorted(resumo['contadores'].items())))
+    for chave, rotulo in (('memoria_pico_mb', "Pico de memória (processo principal)"), ('memoria_pico_worker_mb', "Pico de memória (maior worker)")):
+        if chave in resumo: print(f" {rotulo}: {resumo[chave]} MB")
+    _emitir_evento('info', 'resumo', **resumo)
+
 # ==============================================================================
 # 3. FUNÇÕES AUXILIARES (Formatação, Substituição)
 # ==============================================================================
+_fila_gui = None # Fila de mensagens para a thread da interface (criada no modo GUI)
+
+def notificar(nivel, titulo, mensagem):
+    """Avisa o usuário: messagebox no modo GUI, logging no modo linha de comando. nivel: 'erro' | 'aviso' | 'info'."""
+    if MODO_GUI and _fila_gui is not None and threading.current_thread() is not threading.main_thread():
+        _fila_gui.put(('notificar', nivel, titulo, mensagem)) # Tkinter só pode ser usado pela thread principal
+    elif MODO_GUI:
+        _emitir_evento(nivel, 'notificacao', titulo=titulo, mensagem=mensagem)
+        from tkinter import messagebox
+        {'erro': messagebox.showerror, 'aviso': messagebox.showwarning, 'info': messagebox.showinfo}[nivel](titulo, mensagem)
+    else:
+        log.log({'erro': logging.ERROR, 'aviso': logging.WARNING, 'info': logging.INFO}[nivel], "%s: %s", titulo, mensagem)
+
+NAO_DIGITOS = re.compile(r'\D')
+SO_DIGITOS = re.compile(r'\d+')
+
 def formatar_cpf(cpf_input):
     """Formata CPF para xxx.xxx.xxx-xx."""
     if cpf_input is None: return ""
     cpf = str(cpf_input).strip().lstrip("'") # Remove apóstrofo inicial comum em planilhas
-    cpf_limpo = re.sub(r'\D', '', cpf).zfill(11) # Remove não-dígitos e preenche com zeros à esquerda
+    cpf_limpo = NAO_DIGITOS.sub('', cpf).zfill(11) # Remove não-dígitos e preenche com zeros à esquerda
     if len(cpf_limpo) == 11: return f'{cpf_limpo[:3]}.{cpf_limpo[3:6]}.{cpf_limpo[6:9]}-{cpf_limpo[9:]}'
     # if DEBUG_MODE: print(f"DBG: CPF inválido para formatação: '{cpf_input}'")
     return str(cpf_input) # Retorna original se inválido
@@ -84,90 +292,110 @@ def formatar_cnpj(cnpj_input):
     """Formata CNPJ para xx.xxx.xxx/xxxx-xx."""
     if cnpj_input is None: return ""
     cnpj = str(cnpj_input).strip().lstrip("'")
-    cnpj_limpo = re.sub(r'\D', '', cnpj).zfill(14)
+    cnpj_limpo = NAO_DIGITOS.sub('', cnpj).zfill(14)
     if len(cnpj_limpo) == 14: return f'{cnpj_limpo[:2]}.{cnpj_limpo[2:5]}.{cnpj_limpo[5:8]}/{cnpj_limpo[8:12]}-{cnpj_limpo[12:]}'
     # if DEBUG_MODE: print(f"DBG: CNPJ inválido para formatação: '{cnpj_input}'")
     return str(cnpj_input)
 
+# Colunas com formatação específica (chave em maiúsculas, como nos placeholders)
+FORMATADORES_COLUNA = {
+    COL_PF_ID_COMPARISON.upper(): formatar_cpf,
+    COL_PJ_ID_COMPARISON.upper(): formatar_cnpj,
+    COL_PF_ID_TRIGGER.upper(): formatar_cpf,
+    COL_PJ_ID_TRIGGER.upper(): formatar_cnpj,
+    # Adicione outras colunas que precisam de formatação específica aqui
+    # Ex: 'TELEFONE'.upper(): formatar_telefone,
+}
+CHAVES_INTERNAS = ("tipo", "linha") # Adicionadas pelo script: não viram placeholder
+
+class ContextoRender(dict):
+    """Placeholders {CHAVE_MAIUSCULA} -> valor já formatado, prontos para os templates."""
+    __slots__ = ()
+
+def _formatar_valor_placeholder(valor, formatador):
+    valor_fmt = str(valor).strip() if valor is not None else "" # Valor como string sem espaços extras
+    if formatador: return formatador(valor_fmt) # Aplica formatação específica
+    # Aplica UPPERCASE apenas se não for puramente numérico
+    return valor_fmt if SO_DIGITOS.fullmatch(valor_fmt) else valor_fmt.upper()
+
 def _criar_dicionario_placeholders(dados):
-    """Cria o dicionário de placeholders {CHAVE_MAIUSCULA} -> valor formatado."""
-    # Mapeia colunas específicas para suas funções de formatação
-    formatadores = {
-        COL_PF_ID_COMPARISON.upper(): formatar_cpf,
-        COL_PJ_ID_COMPARISON.upper(): formatar_cnpj,
-        COL_PF_ID_TRIGGER.upper(): formatar_cpf,
-        COL_PJ_ID_TRIGGER.upper(): formatar_cnpj,
-        # Adicione outras colunas que precisam de formatação específica aqui
-        # Ex: 'TELEFONE'.upper(): formatar_telefone,
-    }
-    placeholders = {}
+    """Cria o dicionário de placeholders {CHAVE_MAIUSCULA} -> valor formatado a partir de um dict qualquer."""
+    placeholders = ContextoRender()
     for chave, valor in dados.items():
         # Ignora chaves internas adicionadas pelo script
-        if str(chave).lower() in ["tipo", "linha"]:
+        if str(chave).lower() in CHAVES_INTERNAS:
             continue
         chave_fmt = str(chave).strip().upper() # Chave sempre maiúscula e sem espaços extras
-        valor_fmt = str(valor).strip() if valor is not None else "" # Valor como string sem espaços extras
-
-        formatador = formatadores.get(chave_fmt)
-        if formatador:
-            valor_fmt = formatador(valor_fmt) # Aplica formatação específica
-        # Aplica UPPERCASE apenas se não foi formatado E não for puramente numérico
-        elif not formatador and not re.fullmatch(r'\d+', valor_fmt):
-             valor_fmt = valor_fmt.upper() # Converte para maiúsculas textos não formatados
-
-        placeholders[f"{{{chave_fmt}}}"] = valor_fmt # Cria a chave no formato {NOME_COLUNA}
+        placeholders[f"{{{chave_fmt}}}"] = _formatar_valor_placeholder(valor, FORMATADORES_COLUNA.get(chave_fmt))
     return placeholders
 
-def substituir_placeholders(document, dados):
+def contexto_render(dados):
+    """Placeholders de `dados`: um ContextoRender pronto, um Registro (seção 3.4) ou um dict {coluna: valor}."""
+    if isinstance(dados, ContextoRender): return dados
+    if isinstance(dados, Registro): return dados.contexto()
+    return _criar_dicionario_placeholders(dados)
+
+# Padrão único para qualquer token {CHAVE}: compilado uma vez e reaproveitado em todas as substituições.
+# Cada texto é varrido uma única vez e cada token é resolvido por consulta direta ao dicionário,
+# em vez de um str.replace por placeholder (custo proporcional ao nº de colunas da planilha).
+PADRAO_PLACEHOLDER = re.compile(r'\{[^{}\r\n]+\}')
+
+def substituir_texto(texto, placeholders, nao_resolvidos=None):
+    """Resolve todos os {CHAVE} de `texto` em uma única varredura. Retorna (texto_novo, modificado)."""
+    if not texto or '{' not in texto:
+        return texto, False # Otimização: sem chave aberta não há placeholder possível
+    modificado = False
+
+    def resolver(match):
+        nonlocal modificado
+        token = match.group(0)
+        valor = placeholders.get(token)
+        if valor is None:
+            # Token com formato de placeholder, mas sem coluna correspondente: mantém e reporta
+            if nao_resolvidos is not None: nao_resolvidos.add(token)
+            return token
+        modificado = True
+        return str(valor)
+
+    novo_texto = PADRAO_PLACEHOLDER.sub(resolver, texto)
+    return novo_texto, modificado
+
+def substituir_em_runs(runs, placeholders, nao_resolvidos=None):
+    """Substitui placeholders em uma sequência de runs (python-docx Run ou elemento w:r), unindo o texto no primeiro run."""
+    # Concatena o texto de todos os runs para encontrar placeholders que podem estar divididos
+    full_text = "".join(run.text for run in runs)
+    # Resolve todos os placeholders do texto concatenado em uma única passada
+    modified_text, modified = substituir_texto(full_text, placeholders, nao_resolvidos)
+    if not modified:
+         return False # Indica que não houve modificação (runs ficam intactos)
+
+    # Limpa os runs originais e reescreve o texto modificado no primeiro run da sequência
+    # Isso geralmente preserva a formatação do primeiro run para todo o texto substituído
+    for run in runs:
+        run.text = ""
+    runs[0].text = modified_text
+    return True
+
+def substituir_placeholders(document, dados, nao_resolvidos=None):
     """Substitui placeholders {CHAVE} no documento DOCX, tentando preservar formatação."""
-    placeholders = _criar_dicionario_placeholders(dados)
+    placeholders = contexto_render(dados)
     if DEBUG_MODE: print("  -- Substituindo placeholders em DOCX --")
 
-    # Função interna para processar 'runs' (partes de texto com a mesma formatação)
-    def substituir_em_runs(runs):
-        # Concatena o texto de todos os runs para encontrar placeholders que podem estar divididos
-        full_text = "".join(run.text for run in runs)
-        # Otimização: Se nenhum placeholder está presente no texto concatenado, não faz nada
-        if not any(ph in full_text for ph in placeholders):
-             return False # Indica que não houve modificação
-
-        modified = False
-        current_text = ""
-        # Concatena o texto e limpa os runs originais
-        for run in runs:
-            current_text += run.text
-            run.text = ""
-
-        # Aplica as substituições no texto completo concatenado
-        modified_text = current_text
-        for ph, val in placeholders.items():
-             # Usa replace para substituir todas as ocorrências do placeholder
-             new_text = modified_text.replace(ph, str(val))
-             if new_text != modified_text:
-                 modified = True
-                 modified_text = new_text
-
-        # Reescreve o texto modificado no primeiro run da sequência
-        # Isso geralmente preserva a formatação do primeiro run para todo o texto substituído
-        if runs:
-            runs[0].text = modified_text
-        return modified
-
     # Itera sobre parágrafos no corpo principal do documento
     for paragraph in document.paragraphs:
-        substituir_em_runs(paragraph.runs)
+        substituir_em_runs(paragraph.runs, placeholders, nao_resolvidos)
 
     # Itera sobre tabelas, células e parágrafos dentro das células
     for table in document.tables:
         for row in table.rows:
             for cell in row.cells:
                 for paragraph in cell.paragraphs:
-                    substituir_em_runs(paragraph.runs)
+                    substituir_em_runs(paragraph.runs, placeholders, nao_resolvidos)
 
 
-def substituir_placeholders_excel(workbook, dados):
+def substituir_placeholders_excel(workbook, dados, nao_resolvidos=None):
     """Substitui placeholders {CHAVE} nas células do workbook Excel."""
-    placeholders = _criar_dicionario_placeholders(dados)
+    placeholders = contexto_render(dados)
     if DEBUG_MODE: print("  -- Substituindo placeholders em EXCEL --")
     modificado_geral = False # Flag para indicar se alguma célula foi alterada no workbook
 
@@ -180,16 +408,10 @@ def substituir_placeholders_excel(workbook, dados):
             for cell in row:
                 # Verifica se a célula contém uma string (placeholders só funcionam em texto)
                 if cell.value and isinstance(cell.value, str):
-                    original_value = cell.value
-                    modified_value = original_value
-                    # Itera sobre os placeholders e substitui se encontrar na string da célula
-                    for ph, val in placeholders.items():
-                        if ph in modified_value:
-                            # Substitui todas as ocorrências do placeholder
-                            modified_value = modified_value.replace(ph, str(val))
-
+                    # Resolve todos os placeholders da célula em uma única passada
+                    modified_value, modificado = substituir_texto(cell.value, placeholders, nao_resolvidos)
                     # Se o valor foi modificado, atualiza a célula
-                    if modified_value != original_value:
+                    if modificado:
                         cell.value = modified_value
                         modificado_sheet = True # Marca que esta planilha foi modificada
         if modificado_sheet:
@@ -201,11 +423,411 @@ def substituir_placeholders_excel(workbook, dados):
     return workbook # Retorna o workbook modificado
 
 
+# ==============================================================================
+# 3.1 CACHE DE TEMPLATES (parse único por sessão)
+# ==============================================================================
+# Cada template é lido e interpretado uma única vez por sessão; os registros seguintes só clonam
+# a árvore já pronta. A entrada é invalidada quando o arquivo muda em disco (mtime/tamanho e hash),
+# então editar um modelo em templates/ vale para o próximo registro sem reiniciar o programa.
+# Observação: as entradas são compartilhadas e não são thread-safe; cada processo gera de forma sequencial.
+_cache_templates = {} # (motor, caminho absoluto) -> dict da entrada carregada
+
+def _assinatura_arquivo(caminho):
+    """Assinatura barata para detectar alteração do arquivo (mtime em ns, tamanho)."""
+    info = Path(caminho).stat()
+    return (info.st_mtime_ns, info.st_size)
+
+def obter_template_cache(motor, caminho, carregador):
+    """Retorna a entrada em cache do template, recarregando com `carregador(bytes)` se o arquivo mudou."""
+    caminho = Path(caminho)
+    chave = (motor, str(caminho.resolve()))
+    assinatura = _assinatura_arquivo(caminho)
+    entrada = _cache_templates.get(chave)
+    if entrada is not None and entrada['assinatura'] == assinatura:
+        return entrada
+
+    conteudo = caminho.read_bytes()
+    hash_conteudo = hashlib.sha256(conteudo).hexdigest()
+    if entrada is not None and entrada['hash'] == hash_conteudo:
+        entrada['assinatura'] = assinatura # Só o mtime mudou (arquivo "tocado"): reaproveita o parse
+        return entrada
+
+    if DEBUG_MODE: print(f"  [cache] Carregando template '{caminho.name}' ({motor})")
+    entrada = carregador(conteudo)
+    entrada['assinatura'] = assinatura
+    entrada['hash'] = hash_conteudo
+    _cache_templates[chave] = entrada
+    return entrada
+
+def _caminho_elemento(raiz, elemento):
+    """Caminho de índices de filhos da `raiz` até `elemento` (ex.: (0, 3, 1))."""
+    caminho = []
+    while elemento is not raiz:
+        pai = elemento.getparent()
+        caminho.append(pai.index(elemento))
+        elemento = pai
+    return tuple(reversed(caminho))
+
+def _seguir_caminho(raiz, caminho):
+    """Inverso de _caminho_elemento: navega pelos índices a partir da `raiz`."""
+    elemento = raiz
+    for indice in caminho:
+        elemento = elemento[indice]
+    return elemento
+
+def _indexar_paragrafos_docx(raiz):
+    """Lista os caminhos dos parágrafos (w:p) cujo texto contém algum token {...}."""
+    caminhos = []
+    for paragrafo in raiz.iter(qn('w:p')):
+        texto = "".join(run.text for run in paragrafo.r_lst)
+        if '{' in texto and PADRAO_PLACEHOLDER.search(texto):
+            caminhos.append(_caminho_elemento(raiz, paragrafo))
+    return caminhos
+
+# Partes do DOCX com texto do usuário: corpo, cabeçalhos e rodapés
+PARTES_TEXTO_DOCX = re.compile(r'^word/(document|header\d*|footer\d*)\.xml$')
+
+def _carregar_template_docx(conteudo):
+    """Carrega o DOCX uma vez e indexa, por parte (corpo/cabeçalhos/rodapés), os parágrafos com placeholders."""
+    documento = docx.Document(io.BytesIO(conteudo))
+    partes = []
+    for parte in documento.part.package.iter_parts():
+        if not PARTES_TEXTO_DOCX.match(str(parte.partname).lstrip('/')): continue
+        caminhos = _indexar_paragrafos_docx(parte._element)
+        # Árvore original da parte: nunca é alterada, só clonada
+        if caminhos: partes.append((parte, parte._element, caminhos))
+    return {'documento': documento, 'partes': partes}
+
+def _renderizar_docx_python_docx(template_path, placeholders, caminho_saida, nao_resolvidos):
+    """Motor python-docx: clona as partes indexadas do template em cache, altera e salva o pacote."""
+    entrada = obter_template_cache('docx', template_path, _carregar_template_docx)
+    try:
+        with medir('docx.renderizar', 'debug'):
+            for parte, original, caminhos in entrada['partes']:
+                clone = copy.deepcopy(original)
+                parte._element = clone # A parte serializa o clone; demais partes (imagens, estilos) são reaproveitadas
+                for caminho in caminhos:
+                    substituir_em_runs(_seguir_caminho(clone, caminho).r_lst, placeholders, nao_resolvidos)
+        with medir('docx.salvar', 'debug'):
+            entrada['documento'].save(caminho_saida)
+    finally:
+        for parte, original, _ in entrada['partes']:
+            parte._element = original # Restaura o original para o próximo registro
+
+
+# ==============================================================================
+# 3.2 RENDERIZAÇÃO DIRETA NO ZIP (sem modelo de objetos do python-docx)
+# ==============================================================================
+# A cópia bruta dos membros usa atributos internos do zipfile (fp, filelist, NameToInfo, start_dir, _didModify), estáveis
+# nas versões do Python abaixo. Fora delas, o membro é descomprimido e gravado pela API pública: mais lento, mesmo resultado.
+VERSOES_PYTHON_COPIA_BRUTA = ((3, 9), (3, 13)) # Faixa suportada (inclusive), a mesma do README
+
+def _bytes_comprimidos(conteudo, info):
+    """Fatia os bytes ainda comprimidos de um membro do zip (sem descomprimir)."""
+    inicio = info.header_offset
+    # Cabeçalho local: 30 bytes fixos + nome + campo extra (tamanhos nos offsets 26 e 28)
+    if conteudo[inicio:inicio + 4] != b'PK\x03\x04':
+        raise zipfile.BadZipFile(f"Cabeçalho local inválido para '{info.filename}'")
+    tam_nome, tam_extra = struct.unpack('<HH', conteudo[inicio + 26:inicio + 30])
+    inicio_dados = inicio + 30 + tam_nome + tam_extra
+    return conteudo[inicio_dados:inicio_dados + info.compress_size]
+
+def _gravar_membro_bruto(zip_saida, info, dados_comprimidos):
+    """Copia um membro já comprimido para o zip de saída, sem descomprimir/recomprimir."""
+    novo = copy.copy(info)
+    if not VERSOES_PYTHON_COPIA_BRUTA[0] <= sys.version_info[:2] <= VERSOES_PYTHON_COPIA_BRUTA[1]:
+        if info.compress_type == zipfile.ZIP_STORED: dados = dados_comprimidos
+        elif info.compress_type == zipfile.ZIP_DEFLATED: dados = zlib.decompress(dados_comprimidos, -15) # Deflate sem cabeçalho zlib
+        else: raise zipfile.BadZipFile(f"Compressão não suportada em '{info.filename}': {info.compress_type}")
+        zip_saida.writestr(novo, dados)
+        return
+    novo.flag_bits &= ~0x08 # CRC e tamanhos vão no cabeçalho local (sem 'data descriptor')
+    novo.header_offset = zip_saida.fp.tell()
+    zip_saida.fp.write(novo.FileHeader())
+    zip_saida.fp.write(dados_comprimidos)
+    # Registra o membro para o diretório central escrito no close()
+    zip_saida.filelist.append(novo)
+    zip_saida.NameToInfo[novo.filename] = novo
+    zip_saida.start_dir = zip_saida.fp.tell()
+    zip_saida._didModify = True
+
+def _gravar_membro_xml(zip_saida, info, xml_bytes):
+    """Grava uma parte XML reescrita (comprimida), mantendo nome, data e atributos do original."""
+    novo = zipfile.ZipInfo(info.filename, date_time=info.date_time)
+    novo.compress_type = zipfile.ZIP_DEFLATED
+    novo.external_attr = info.external_attr
+    zip_saida.writestr(novo, xml_bytes)
+
+def _ler_template_zip(conteudo, indexar_parte):
+    """Lê o zip do template uma vez. `indexar_parte(nome, xml_bytes)` devolve o índice da parte ou None (cópia bruta)."""
+    membros = [] # (ZipInfo, bytes comprimidos, índice da parte ou None), na ordem original
+    with zipfile.ZipFile(io.BytesIO(conteudo)) as zf:
+        for info in zf.infolist():
+            if info.flag_bits & 0x1:
+                raise zipfile.BadZipFile(f"Membro criptografado não suportado: '{info.filename}'")
+            indice = indexar_parte(info.filename, zf.read(info)) if info.filename.endswith('.xml') else None
+            membros.append((info, _bytes_comprimidos(conteudo, info), indice))
+    return {'membros': membros}
+
+def _escrever_zip(caminho_saida, membros, renderizar_parte, formato):
+    """Escreve o pacote de saída: partes indexadas passam por `renderizar_parte(indice)`, o resto é copiado bruto."""
+    with medir(f'{formato}.renderizar', 'debug'): # Renderiza antes de abrir a saída, para medir as duas fases separadas
+        renderizadas = {i: renderizar_parte(indice) for i, (_, _, indice) in enumerate(membros) if indice is not None}
+    with medir(f'{formato}.salvar', 'debug'), zipfile.ZipFile(caminho_saida, 'w') as zip_saida:
+        for i, (info, dados_comprimidos, indice) in enumerate(membros):
+            if indice is None:
+                _gravar_membro_bruto(zip_saida, info, dados_comprimidos)
+            else:
+                _gravar_membro_xml(zip_saida, info, renderizadas[i])
+
+def _indexar_parte_docx(nome, xml_bytes):
+    """Índice de uma parte DOCX: (árvore original, caminhos dos parágrafos com placeholders) ou None."""
+    if not PARTES_TEXTO_DOCX.match(nome) or b'{' not in xml_bytes:
+        return None
+    raiz = parse_xml(xml_bytes)
+    caminhos = _indexar_paragrafos_docx(raiz)
+    return (raiz, caminhos) if caminhos else None
+
+def _carregar_template_docx_zip(conteudo):
+    """Lê o zip do DOCX uma vez, indexando corpo/cabeçalhos/rodapés com placeholders."""
+    return _ler_template_zip(conteudo, _indexar_parte_docx)
+
+def _renderizar_docx_zip(template_path, placeholders, caminho_saida, nao_resolvidos):
+    """Motor zip: reescreve só corpo/cabeçalhos/rodapés com placeholders e copia os demais membros brutos."""
+    entrada = obter_template_cache('docx-zip', template_path, _carregar_template_docx_zip)
+
+    def renderizar_parte(indice):
+        original, caminhos = indice
+        clone = copy.deepcopy(original)
+        for caminho in caminhos:
+            # Mesma semântica de substituir_em_runs do motor python-docx (runs w:r diretos do parágrafo)
+            substituir_em_runs(_seguir_caminho(clone, caminho).r_lst, placeholders, nao_resolvidos)
+        return serialize_part_xml(clone)
+
+    _escrever_zip(caminho_saida, entrada['membros'], renderizar_parte, 'docx')
+
+# --- XLSX ---
+NS_PLANILHA = {'m': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'}
+PARTE_SHARED_STRINGS_XLSX = re.compile(r'^xl/sharedStrings\.xml$', re.IGNORECASE)
+PARTES_ABAS_XLSX = re.compile(r'^xl/worksheets/[^/]+\.xml$', re.IGNORECASE)
+ATRIBUTO_XML_SPACE = '{http://www.w3.org/XML/1998/namespace}space'
+
+def _textos_string_xlsx(elemento):
+    """Elementos <t> de uma string do Excel (<si> ou <is>), simples ou rich text, em ordem (ignora fonética <rPh>)."""
+    return elemento.xpath('m:t | m:r/m:t', namespaces=NS_PLANILHA)
+
+def _contem_placeholder(texto):
+    return bool(texto) and '{' in texto and PADRAO_PLACEHOLDER.search(texto) is not None
+
+def _indexar_parte_xlsx(nome, xml_bytes):
+    """Índice de uma parte XLSX: (árvore original, caminhos das strings com placeholders) ou None (cópia bruta)."""
+    eh_shared_strings = PARTE_SHARED_STRINGS_XLSX.match(nome)
+    if not (eh_shared_strings or PARTES_ABAS_XLSX.match(nome)) or b'{' not in xml_bytes:
+        return None
+    raiz = etree.fromstring(xml_bytes)
+    if etree.QName(raiz).namespace != NS_PLANILHA['m']:
+        raise ValueError(f"'{nome}' não usa o namespace SpreadsheetML transitional (ex.: OOXML Strict)")
+
+    if eh_shared_strings:
+        # Strings compartilhadas: alterar o <si> equivale a alterar todas as células que apontam para ele
+        strings = raiz.findall('m:si', NS_PLANILHA)
+    else:
+        # Abas: o openpyxl também substituiria em fórmulas e strings de fórmula; o caminho rápido não cobre isso
+        for elemento in raiz.xpath('.//m:c/m:f | .//m:c[@t="str"]/m:v', namespaces=NS_PLANILHA):
+            if _contem_placeholder(elemento.text):
+                raise ValueError(f"Placeholder dentro de fórmula em '{nome}'")
+        strings = raiz.xpath('.//m:c[@t="inlineStr"]/m:is', namespaces=NS_PLANILHA)
+
+    caminhos = [_caminho_elemento(raiz, string) for string in strings
+                if _contem_placeholder("".join(t.text or "" for t in _textos_string_xlsx(string)))]
+    return (raiz, caminhos) if caminhos else None
+
+def _carregar_template_xlsx_zip(conteudo):
+    """Indexa o XLSX uma vez; se o template não for suportado, marca a entrada para usar o openpyxl."""
+    try:
+        return _ler_template_zip(conteudo, _indexar_parte_xlsx)
+    except (ValueError, etree.LxmlError, zipfile.BadZipFile) as e:
+        print(f"  Aviso: template XLSX será processado com openpyxl (caminho rápido indisponível): {e}")
+        return {'motivo_fallback': str(e)}
+
+def _renderizar_xlsx_zip(entrada, placeholders, caminho_saida, nao_resolvidos):
+    """Motor zip: reescreve só as strings indexadas e copia os demais membros brutos."""
+    def renderizar_parte(indice):
+        original, caminhos = indice
+        clone = copy.deepcopy(original)
+        for caminho in caminhos:
+            textos = _textos_string_xlsx(_seguir_caminho(clone, caminho))
+            novo_texto, modificado = substituir_texto("".join(t.text or "" for t in textos), placeholders, nao_resolvidos)
+            if not modificado: continue
+            # Como no rich text do openpyxl, o texto final fica no primeiro trecho
+            for t in textos: t.text = ""
+            textos[0].text = novo_texto
+            textos[0].set(ATRIBUTO_XML_SPACE, 'preserve')
+        return etree.tostring(clone, xml_declaration=True, encoding='UTF-8', standalone=True)
+
+    _escrever_zip(caminho_saida, entrada['membros'], renderizar_parte, 'xlsx')
+
+def renderizar_xlsx(template_path, dados, caminho_saida, nao_resolvidos=None):
+    """Gera um XLSX a partir do template usando MOTOR_XLSX (com openpyxl como alternativa)."""
+    if MOTOR_XLSX == "zip":
+        entrada = obter_template_cache('xlsx-zip', template_path, _carregar_template_xlsx_zip)
+        if 'motivo_fallback' not in entrada:
+            _renderizar_xlsx_zip(entrada, contexto_render(dados), caminho_saida, nao_resolvidos)
+            return
+    with medir('xlsx.abrir', 'debug'):
+        workbook = openpyxl.load_workbook(template_path)
+    with medir('xlsx.renderizar', 'debug'):
+        workbook_modificado = substituir_placeholders_excel(workbook, dados, nao_resolvidos)
+    with medir('xlsx.salvar', 'debug'):
+        workbook_modificado.save(caminho_saida)
+
+def renderizar_docx(template_path, dados, caminho_saida, nao_resolvidos=None):
+    """Gera um DOCX a partir do template em cache usando o motor configurado em MOTOR_DOCX."""
+    placeholders = contexto_render(dados)
+    if MOTOR_DOCX == "zip":
+        _renderizar_docx_zip(template_path, placeholders, caminho_saida, nao_resolvidos)
+    else:
+        _renderizar_docx_python_docx(template_path, placeholders, caminho_saida, nao_resolvidos)
+
+
+# ==============================================================================
+# 3.3 PLACEHOLDERS DOS TEMPLATES (projeção de colunas da planilha)
+# ==============================================================================
+# Só as colunas citadas nos templates (mais as de controle) são baixadas da planilha; ver sincronizar_aba.
+PROJETAR_COLUNAS = True # False = baixa todas as colunas das abas de respostas
+
+def _carregar_placeholders_template(conteudo):
+    """Tokens {...} de um template DOCX/XLSX, procurados no texto de cada parágrafo/string (com os runs juntos)."""
+    tokens = set()
+    with zipfile.ZipFile(io.BytesIO(conteudo)) as zf:
+        for nome in zf.namelist():
+            if PARTES_TEXTO_DOCX.match(nome):
+                raiz = etree.fromstring(zf.read(nome))
+                textos = (''.join(t.text or '' for t in p.iter(qn('w:t'))) for p in raiz.iter(qn('w:p')))
+            elif PARTE_SHARED_STRINGS_XLSX.match(nome) or PARTES_ABAS_XLSX.match(nome):
+                raiz = etree.fromstring(zf.read(nome))
+                textos = (''.join(t.text or '' for t in _textos_string_xlsx(s)) for s in raiz.xpath('//m:si | //m:is', namespaces=NS_PLANILHA))
+            else:
+                continue
+            for texto in textos:
+                if '{' in texto: tokens.update(PADRAO_PLACEHOLDER.findall(texto))
+    return {'tokens': tokens}
+
+def placeholders_dos_templates(tipo):
+    """{nome do template: tokens {...}} dos templates DOCX/XLSX do tipo (PF/PJ) que existem."""
+    templates = (TEMPLATE_PF_DOCX + TEMPLATE_PF_XLSX) if tipo == "PF" else (TEMPLATE_PJ_DOCX + TEMPLATE_PJ_XLSX)
+    resultado = {}
+    for caminho in templates:
+        if not Path(caminho).exists(): continue # A geração reporta o template ausente
+        try:
+            resultado[Path(caminho).name] = obter_template_cache('placeholders', caminho, _carregar_placeholders_template)['tokens']
+        except (zipfile.BadZipFile, etree.XMLSyntaxError, OSError) as e:
+            print(f"⚠️ Não foi possível ler os placeholders de '{Path(caminho).name}': {e}")
+    return resultado
+
+def colunas_usadas(tipo, placeholders_templates):
+    """Nomes de coluna (maiúsculos, como nos placeholders) que o tipo precisa: os dos templates e os de controle."""
+    id_col_trigger, id_col_comparison = PLANILHAS_POR_TIPO[tipo][2:]
+    controle = [COL_CADASTRO, id_col_trigger, id_col_comparison, STATUS_COL, "NOME COMPLETO", "RAZÃO SOCIAL", "PLACA"]
+    nomes = {coluna.strip().upper() for coluna in controle}
+    for tokens in placeholders_templates.values(): nomes.update(token[1:-1] for token in tokens)
+    return nomes
+
+# ==============================================================================
+# 3.4 REGISTROS COMPACTOS (cabeçalho compartilhado, linhas com __slots__, contexto de render único)
+# ==============================================================================
+# Cada linha da aba era copiada como dict várias vezes (to_records, clean_row do pré-preenchimento,
+# dict(row, tipo=, linha=) e o dict em maiúsculas da geração), repetindo as mesmas chaves em todas as linhas, e os
+# placeholders eram refeitos a cada template (5x por registro). Agora cada aba tem uma TabelaRegistros: nomes de
+# coluna internados, índice nome -> posição e, por coluna, a chave {COLUNA} e o formatador (CPF/CNPJ ou maiúsculas),
+# calculados uma vez na carga. Cada linha é um Registro: só a lista de valores e o número da linha. O Registro se
+# comporta como dict para o resto do código (get, [], in, items, dict(registro)); o contexto de render é montado
+# uma vez por registro na geração e compartilhado pelos templates e pelo hash do manifesto.
+class TabelaRegistros:
+    """Cabeçalho de uma aba, compartilhado por todos os Registros dela."""
+    __slots__ = ('tipo', 'colunas', 'indice', 'indice_maiusculo', 'chaves', 'placeholders')
+
+    def __init__(self, colunas, tipo=None):
+        self.tipo = tipo
+        self.colunas = tuple(sys.intern(str(coluna).strip()) for coluna in colunas)
+        self.indice = {} # Nome -> posição; nome repetido fica com a última coluna, como num dict
+        for i, nome in enumerate(self.colunas):
+            if nome: self.indice[nome] = i
+        self.indice_maiusculo = {nome.upper(): i for nome, i in self.indice.items()}
+        # 'tipo' e 'linha' do script têm precedência sobre colunas de mesmo nome (como em dict(row, tipo=, linha=))
+        self.chaves = tuple(nome for nome in self.indice if nome not in CHAVES_INTERNAS) + CHAVES_INTERNAS
+        # (posição, {COLUNA}, formatador) das colunas que viram placeholder
+        self.placeholders = tuple((i, sys.intern(f"{{{nome.upper()}}}"), FORMATADORES_COLUNA.get(nome.upper()))
+                                  for nome, i in self.indice.items() if nome.lower() not in CHAVES_INTERNAS)
+
+class Registro(collections.abc.MutableMapping):
+    """Uma linha da aba: valores na ordem das colunas da tabela, mais 'tipo' (da tabela) e 'linha'."""
+    __slots__ = ('tabela', 'valores', 'linha')
+
+    def __init__(self, tabela, valores, linha=None):
+        self.tabela = tabela
+        self.valores = valores
+        self.linha = linha
+
+    def __getitem__(self, chave):
+        if chave == 'linha': return self.linha
+        if chave == 'tipo': return self.tabela.tipo
+        return self.valores[self.tabela.indice[chave]] # KeyError para coluna inexistente
+
+    def __setitem__(self, chave, valor):
+        if chave == 'linha': self.linha = valor
+        elif chave == 'tipo': raise KeyError("'tipo' é da tabela inteira: use TabelaRegistros.tipo")
+        else: self.valores[self.tabela.indice[chave]] = valor # Só colunas existentes
+
+    def __delitem__(self, chave):
+        raise KeyError(f"As colunas de um Registro não podem ser removidas: {chave!r}")
+
+    def __iter__(self):
+        return iter(self.tabela.chaves)
+
+    def __len__(self):
+        return len(self.tabela.chaves)
+
+    def __contains__(self, chave):
+        return chave in CHAVES_INTERNAS or chave in self.tabela.indice
+
+    def __repr__(self):
+        return f"Registro({self.tabela.tipo} L{self.linha}: {dict(self)!r})"
+
+    def __reduce__(self): # Para os workers: a tabela vai junto; o contexto é montado lá
+        return (Registro, (self.tabela, self.valores, self.linha))
+
+    def campo(self, nome, padrao=None):
+        """Valor pelo nome da coluna em maiúsculas (como nos placeholders)."""
+        i = self.tabela.indice_maiusculo.get(nome)
+        return padrao if i is None else self.valores[i]
+
+    def limpar_valores(self):
+        """Valores como texto sem espaços nas pontas (None vira ""), como o pré-preenchimento compara e grava."""
+        self.valores = [str(v).strip() if v is not None else "" for v in self.valores]
+
+    def contexto(self):
+        """Placeholders do registro; usa a chave e o formatador pré-calculados de cada coluna."""
+        valores = self.valores
+        return ContextoRender((chave, _formatar_valor_placeholder(valores[i], formatador))
+                              for i, chave, formatador in self.tabela.placeholders)
+
+def registro_de_dict(dados):
+    """Registro avulso a partir de um dict {coluna: valor, 'tipo':, 'linha':} (o próprio Registro, se já for um)."""
+    if isinstance(dados, Registro): return dados
+    colunas = [chave for chave in dados if chave and str(chave).lower() not in CHAVES_INTERNAS]
+    return Registro(TabelaRegistros(colunas, dados.get('tipo')), [dados[chave] for chave in colunas], dados.get('linha'))
+
 # ==============================================================================
 # 4. FUNÇÃO DE PRÉ-PREENCHIMENTO
 # ==============================================================================
-def preencher_e_atualizar_planilha(sheet, headers, dados_originais, id_col_trigger, id_col_comparison, col_cadastro, trigger_value):
-    """Preenche dados baseados em cadastros anteriores e atualiza planilha via API."""
+def preencher_e_atualizar_planilha(sheet, headers, dados_originais, id_col_trigger, id_col_comparison, col_cadastro, trigger_value, buffer=None, colunas=None):
+    """Preenche dados baseados em cadastros anteriores e atualiza planilha via API.
+
+    Com `buffer` (BufferEscrita), as células só são agendadas: quem chamou envia PF e PJ juntos com enviar_pre_preenchimento.
+    Com o estado salvo da carga anterior (seção 4.1), só as linhas novas e os alvos pendentes são processados;
+    `colunas` (as baixadas da planilha, ver registros_da_fonte) entra na assinatura desse estado.
+    """
     if not dados_originais:
         print(f"Aviso Pré-preenchimento: Planilha '{sheet.title}' vazia ou sem dados.")
         return []
@@ -222,91 +844,266 @@ def preencher_e_atualizar_planilha(sheet, headers, dados_originais, id_col_trigg
         # Define colunas que podem ser copiadas da linha fonte (ignora as de controle, status, etc.)
         cols_to_fill = { name: index for name, index in col_indices.items()
                          if name not in [col_cadastro, id_col_trigger, id_col_comparison, STATUS_COL, "Timestamp", "Carimbo de data/hora"] }
+        # Com a projeção (PROJETAR_COLUNAS), as colunas que os templates não usam não foram baixadas: elas vêm das linhas
+        # completas das fontes e alvos envolvidos (fonte.ler_linhas), e o pré-preenchimento copia tudo, como sem projeção
+        fora_da_projecao = set() if colunas is None else {name for name, index in cols_to_fill.items()
+                                                          if index > 1 and name.strip().upper() not in colunas}
         if DEBUG_MODE: print(f" Colunas a preencher da fonte (se vazias na linha alvo): {list(cols_to_fill.keys())}")
 
     except ValueError as e:
-        messagebox.showerror("Erro Config Pré-preenchimento", f"{e} na planilha '{sheet.title}'. Verifique nomes das colunas.")
+        notificar('erro', "Erro Config Pré-preenchimento", f"{e} na planilha '{sheet.title}'. Verifique nomes das colunas.")
         return dados_originais # Retorna dados originais se houve erro nos headers
 
-    source_data_map = {} # Dicionário para guardar a primeira linha fonte encontrada para cada ID
-    dados_modificados = [] # Lista para guardar os dados como lidos, mas potencialmente atualizados em memória
-    linhas_para_buscar = [] # Lista de tuplas (índice_lista, trigger_id, linha_planilha) para linhas alvo
-
-    print(" Mapeando dados de origem e identificando alvos...")
-    for i, row_dict in enumerate(dados_originais):
-        # Limpa chaves e valores (remove espaços, None vira "", ignora chaves vazias)
-        clean_row = {str(k).strip(): str(v).strip() if v is not None else "" for k, v in row_dict.items() if k}
-        dados_modificados.append(clean_row) # Adiciona o dict limpo
-        row_num = i + 2 # Número da linha na planilha (1-based + cabeçalho)
-        cadastro_status = clean_row.get(col_cadastro, "")
-        comp_id = clean_row.get(id_col_comparison, "") # ID da linha (pode ser fonte)
-        trig_id = clean_row.get(id_col_trigger, "")   # ID que a linha alvo usa para buscar a fonte
-
-        # Se não for linha de trigger e tiver ID de comparação, é uma potencial fonte
-        if cadastro_status != trigger_value and comp_id:
-            if comp_id not in source_data_map: # Guarda apenas a primeira ocorrência como fonte
-                 source_data_map[comp_id] = clean_row
-        # Se for linha de trigger e tiver ID de trigger, é um alvo
-        elif cadastro_status == trigger_value and trig_id:
-            linhas_para_buscar.append((i, trig_id, row_num))
-        elif cadastro_status == trigger_value and not trig_id:
-            print(f" Aviso Pré-preenchimento: Linha {row_num} ({sheet.title}) com trigger ('{trigger_value}') mas sem ID em '{id_col_trigger}'. Não será pré-preenchida.")
-
-    batch_updates = [] # Lista para guardar as atualizações a serem enviadas para a API do Google Sheets
-    print(f" Processando {len(linhas_para_buscar)} linha(s) alvo para pré-preenchimento...")
-    for list_idx, trigger_id, row_num in linhas_para_buscar:
-        if list_idx >= len(dados_modificados): continue # Segurança
-        target_row = dados_modificados[list_idx] # Pega o dicionário da linha alvo
-        row_needs_api_update = False # Flag para saber se esta linha precisa de update via API
-
-        # Passo 1: Preencher ID de Comparação na linha Alvo (se estiver vazio) com o ID Trigger
-        current_comparison_val = target_row.get(id_col_comparison, "")
-        if not current_comparison_val and trigger_id:
-            target_row[id_col_comparison] = trigger_id # Atualiza em memória
-            cell_a1 = rowcol_to_a1(row_num, idx_col_comparison) # Converte para A1 notation
-            batch_updates.append({'range': cell_a1, 'values': [[str(trigger_id)]]}) # Prepara API update
-            row_needs_api_update = True
-            if DEBUG_MODE: print(f"  L{row_num}: Preenchendo '{id_col_comparison}' com ID Trigger '{trigger_id}'")
-
-        # Passo 2: Preencher outros campos da linha Alvo (se vazios) buscando da linha Fonte
-        if trigger_id in source_data_map:
-            source_row = source_data_map[trigger_id]
-            if DEBUG_MODE and not row_needs_api_update: print(f"  L{row_num}: Fonte encontrada para ID '{trigger_id}'. Verificando campos...")
-            campos_preenchidos_da_fonte = 0
-            for col_name, col_idx in cols_to_fill.items():
-                # Verifica se o campo está VAZIO na linha Alvo
-                if not target_row.get(col_name, ""):
-                    source_value = source_row.get(col_name, "")
-                    # Verifica se o campo tem valor na linha Fonte
-                    if source_value:
-                        target_row[col_name] = source_value # Atualiza em memória
-                        cell_a1 = rowcol_to_a1(row_num, col_idx)
-                        batch_updates.append({'range': cell_a1, 'values': [[str(source_value)]]}) # Prepara API update
-                        row_needs_api_update = True
-                        campos_preenchidos_da_fonte += 1
-            if DEBUG_MODE and campos_preenchidos_da_fonte > 0:
-                 print(f"    L{row_num}: Preenchidos {campos_preenchidos_da_fonte} campos a partir da fonte.")
-
-        elif DEBUG_MODE and not row_needs_api_update: # Se não achou fonte E não preencheu o ID no passo 1
-             print(f"  L{row_num}: Fonte não encontrada para ID '{trigger_id}' e coluna de comparação já estava preenchida. Nenhum pré-preenchimento realizado.")
-
-    # Envia as atualizações em lote para a API, se houver alguma
-    if batch_updates:
-        print(f" Enviando {len(batch_updates)} atualizações de pré-preenchimento para '{sheet.title}'...")
-        try:
-            sheet.batch_update(batch_updates, value_input_option='USER_ENTERED')
-            print(" Pré-preenchimento salvo com sucesso na planilha!")
-        except gspread.exceptions.APIError as e:
-            print(f"ERRO de API ao salvar pré-preenchimento em '{sheet.title}': {e}")
-            messagebox.showerror("Erro API Google (Pré-preenchimento)", f"Falha ao salvar pré-preenchimento em '{sheet.title}':\n{e}")
-        except Exception as e:
-             print(f"ERRO inesperado ao salvar pré-preenchimento em '{sheet.title}': {e}")
-             messagebox.showerror("Erro Inesperado (Pré-preenchimento)", f"Falha ao salvar pré-preenchimento em '{sheet.title}':\n{e}")
+    dados_modificados = dados_originais # Os próprios Registros são limpos e atualizados em memória (sem cópia)
+    # Todas as linhas são limpas, mesmo as anteriores à marca d'água: o render e o manifesto não dependem do estado salvo
+    for registro in dados_modificados: registro.limpar_valores()
+    buffer_envio = buffer if buffer is not None else BufferEscrita() # Células a gravar na planilha
+    assinatura = assinatura_pre_preenchimento(headers, id_col_trigger, id_col_comparison, col_cadastro, trigger_value, colunas)
+    colunas_conferencia = [headers[0], col_cadastro, id_col_trigger] # Colunas que o pré-preenchimento não altera
+
+    def linha_fonte(trigger_id, source_num):
+        """Registro da linha fonte indicada pelo estado, ou None se a linha não é mais a fonte desse ID."""
+        if not 2 <= source_num <= len(dados_modificados) + 1: return None
+        source_row = dados_modificados[source_num - 2]
+        if source_row.get(col_cadastro, "") == trigger_value or source_row.get(id_col_comparison, "") != trigger_id: return None
+        return source_row
+
+    linhas_completas = {} # Linha -> valores de todas as colunas (só com projeção), lidos uma vez por carga
+
+    def buscar_completas(numeros):
+        """Lê de uma vez as linhas completas ainda não lidas, se há colunas fora da projeção."""
+        faltam = sorted({n for n in numeros if 2 <= n <= len(dados_modificados) + 1 and n not in linhas_completas})
+        if not fora_da_projecao or not faltam: return
+        lidas = sheet.ler_linhas(faltam)
+        for n in faltam: # Limpas como os Registros (numericise + texto sem espaços nas pontas)
+            linhas_completas[n] = [str(v).strip() for v in gspread.utils.numericise_all(list(lidas.get(n, [])))]
+        print(f" {len(faltam)} linha(s) completa(s) lida(s) para as colunas que os templates não usam.")
+
+    def valor_celula(registro, row_num, col_name):
+        """Valor da célula: do Registro, ou da linha completa se a coluna ficou fora da projeção."""
+        if col_name in fora_da_projecao: return _celula(linhas_completas.get(row_num, []), col_indices[col_name] - 1)
+        return registro.get(col_name, "")
+
+    def definir(target_row, row_num, col_name, novo):
+        target_row[col_name] = novo
+        if col_name in fora_da_projecao and row_num in linhas_completas:
+            linha = linhas_completas[row_num]
+            linha.extend([""] * (col_indices[col_name] - len(linha)))
+            linha[col_indices[col_name] - 1] = novo
+
+    def agendar(alteracoes, target_row, row_num, col_name, col_idx, novo):
+        """Grava o valor em memória e guarda a célula em `alteracoes` (vai para o buffer só se a passada terminar)."""
+        alteracoes.append((target_row, row_num, col_name, col_idx, valor_celula(target_row, row_num, col_name), novo))
+        definir(target_row, row_num, col_name, novo)
+
+    def processar(estado, alteracoes):
+        """Mapeia as linhas a partir da marca d'água e resolve os alvos novos e pendentes. False = estado desatualizado."""
+        source_data_map = estado['fontes'] # ID -> linha da primeira linha fonte encontrada para esse ID
+        linhas_para_buscar = [] # Lista de tuplas (índice_lista, trigger_id, linha_planilha) para linhas alvo
+
+        print(" Mapeando dados de origem e identificando alvos...")
+        # Alvos de cargas anteriores cuja fonte ainda não tinha aparecido
+        for row_num in estado['pendentes']:
+            target_row = dados_modificados[row_num - 2]
+            trig_id = target_row.get(id_col_trigger, "")
+            if target_row.get(col_cadastro, "") == trigger_value and trig_id: linhas_para_buscar.append((row_num - 2, trig_id, row_num))
+        for i in range(estado['marca_agua'] - 1, len(dados_modificados)): # Só as linhas novas desde a última carga
+            clean_row = dados_modificados[i] # Já limpa (valores sem espaços, None vira "")
+            row_num = i + 2 # Número da linha na planilha (1-based + cabeçalho)
+            cadastro_status = clean_row.get(col_cadastro, "")
+            comp_id = clean_row.get(id_col_comparison, "") # ID da linha (pode ser fonte)
+            trig_id = clean_row.get(id_col_trigger, "")   # ID que a linha alvo usa para buscar a fonte
+
+            # Se não for linha de trigger e tiver ID de comparação, é uma potencial fonte
+            if cadastro_status != trigger_value and comp_id:
+                if comp_id not in source_data_map: # Guarda apenas a primeira ocorrência como fonte
+                     source_data_map[comp_id] = row_num
+            # Se for linha de trigger e tiver ID de trigger, é um alvo
+            elif cadastro_status == trigger_value and trig_id:
+                linhas_para_buscar.append((i, trig_id, row_num))
+            elif cadastro_status == trigger_value and not trig_id:
+                print(f" Aviso Pré-preenchimento: Linha {row_num} ({sheet.title}) com trigger ('{trigger_value}') mas sem ID em '{id_col_trigger}'. Não será pré-preenchida.")
+        estado['pendentes'] = []
+        estado['marca_agua'] = len(dados_modificados) + 1
+        buscar_completas([n for _, _, n in linhas_para_buscar] + [source_data_map[t] for _, t, _ in linhas_para_buscar if t in source_data_map])
+
+        print(f" Processando {len(linhas_para_buscar)} linha(s) alvo para pré-preenchimento...")
+        for list_idx, trigger_id, row_num in linhas_para_buscar:
+            if list_idx >= len(dados_modificados): continue # Segurança
+            target_row = dados_modificados[list_idx] # Pega o registro da linha alvo
+            row_needs_api_update = False # Flag para saber se esta linha precisa de update via API
+
+            # Passo 1: Preencher ID de Comparação na linha Alvo (se estiver vazio) com o ID Trigger
+            current_comparison_val = target_row.get(id_col_comparison, "")
+            if not current_comparison_val and trigger_id:
+                agendar(alteracoes, target_row, row_num, id_col_comparison, idx_col_comparison, trigger_id) # Memória + API update
+                row_needs_api_update = True
+                if DEBUG_MODE: print(f"  L{row_num}: Preenchendo '{id_col_comparison}' com ID Trigger '{trigger_id}'")
+
+            # Passo 2: Preencher outros campos da linha Alvo (se vazios) buscando da linha Fonte
+            if trigger_id in source_data_map:
+                source_row = linha_fonte(trigger_id, source_data_map[trigger_id])
+                if source_row is None: return False # Linhas excluídas/inseridas fora do app: o índice não vale mais
+                if DEBUG_MODE and not row_needs_api_update: print(f"  L{row_num}: Fonte encontrada para ID '{trigger_id}'. Verificando campos...")
+                campos_preenchidos_da_fonte = 0
+                for col_name, col_idx in cols_to_fill.items():
+                    # Verifica se o campo está VAZIO na linha Alvo
+                    if not valor_celula(target_row, row_num, col_name):
+                        source_value = valor_celula(source_row, source_data_map[trigger_id], col_name)
+                        # Verifica se o campo tem valor na linha Fonte
+                        if source_value:
+                            agendar(alteracoes, target_row, row_num, col_name, col_idx, source_value) # Memória + API update
+                            row_needs_api_update = True
+                            campos_preenchidos_da_fonte += 1
+                if DEBUG_MODE and campos_preenchidos_da_fonte > 0:
+                     print(f"    L{row_num}: Preenchidos {campos_preenchidos_da_fonte} campos a partir da fonte.")
+                estado['alvos'].setdefault(trigger_id, []).append(row_num)
+                estado['propagados'].setdefault(trigger_id, [valor_celula(source_row, source_data_map[trigger_id], col_name) for col_name in cols_to_fill])
+
+            else: # Fonte ainda não existe: a linha é conferida de novo nas próximas cargas
+                estado['pendentes'].append(row_num)
+                if DEBUG_MODE and not row_needs_api_update: # Se não achou fonte E não preencheu o ID no passo 1
+                    print(f"  L{row_num}: Fonte não encontrada para ID '{trigger_id}' e coluna de comparação já estava preenchida. Nenhum pré-preenchimento realizado.")
+        return True
+
+    def repropagar(estado, alteracoes):
+        """Confere as linhas fonte já usadas e leva as colunas editadas para os alvos vazios ou com o valor antigo. False = estado desatualizado."""
+        editadas = repropagadas = 0
+        buscar_completas([estado['fontes'].get(t, 0) for t in estado['propagados']] + [n for alvos in estado['alvos'].values() for n in alvos])
+        for trigger_id, antigos in estado['propagados'].items():
+            source_row = linha_fonte(trigger_id, estado['fontes'].get(trigger_id, 0))
+            if source_row is None: return False
+            atuais = [valor_celula(source_row, estado['fontes'][trigger_id], col_name) for col_name in cols_to_fill]
+            if atuais == antigos: continue
+            editadas += 1
+            alvos = [(row_num, dados_modificados[row_num - 2]) for row_num in estado['alvos'].get(trigger_id, [])
+                     if row_num <= len(dados_modificados) + 1]
+            for (col_name, col_idx), antigo, atual in zip(cols_to_fill.items(), antigos, atuais):
+                if atual == antigo or not atual: continue # Valor apagado na fonte não apaga o alvo
+                for row_num, target_row in alvos:
+                    if target_row.get(id_col_trigger, "") != trigger_id: continue
+                    valor_alvo = valor_celula(target_row, row_num, col_name)
+                    if valor_alvo in ("", antigo): # O que foi digitado no próprio alvo prevalece
+                        agendar(alteracoes, target_row, row_num, col_name, col_idx, atual); repropagadas += 1
+            estado['propagados'][trigger_id] = atuais
+        print(f" Verificação: {len(estado['propagados'])} linha(s) fonte conferida(s), {editadas} editada(s), {repropagadas} célula(s) repropagada(s).")
+        return True
+
+    alteracoes = [] # (registro, linha, nome e índice da coluna, valor anterior, valor novo) da passada em andamento
+    estado = ler_estado_pre_preenchimento(sheet, assinatura, dados_modificados, colunas_conferencia)
+    if estado is not None:
+        print(f" Pré-preenchimento incremental: {len(dados_modificados) + 1 - estado['marca_agua']} linha(s) nova(s), {len(estado['pendentes'])} alvo(s) pendente(s).")
+        if not (processar(estado, alteracoes) and (not VERIFICAR_PRE_PREENCHIMENTO or repropagar(estado, alteracoes))):
+            print(f" Estado do pré-preenchimento de '{sheet.title}' desatualizado (linhas excluídas/inseridas fora do app). Conferindo todas as linhas...")
+            for target_row, row_num, col_name, _, anterior, _ in reversed(alteracoes): definir(target_row, row_num, col_name, anterior) # Desfaz a passada interrompida
+            alteracoes = []
+            estado = None
+    if estado is None: # Sem estado válido: todas as linhas, como antes
+        estado = {'fontes': {}, 'marca_agua': 1, 'pendentes': [], 'alvos': {}, 'propagados': {}}
+        processar(estado, alteracoes)
+    for _, row_num, _, col_idx, _, novo in alteracoes: buffer_envio.adicionar(sheet, row_num, col_idx, str(novo))
+    celulas_agendadas = len(alteracoes)
+    if PRE_PREENCHIMENTO_INCREMENTAL:
+        estado.update(assinatura=assinatura, conferencia=_conferencia_linha(dados_modificados[-1], colunas_conferencia))
+        with _trava_pre_preenchimento: _estados_pendentes[sheet.chave] = estado # Gravado depois do envio das células
+
+    # Envia as atualizações (agrupadas em intervalos) para a API, se houver alguma
+    if celulas_agendadas:
+        print(f" {celulas_agendadas} célula(s) de pré-preenchimento agendada(s) para '{sheet.title}'.")
     else:
         print(f" Nenhuma atualização de pré-preenchimento necessária para enviar à API para '{sheet.title}'.")
+    if buffer is None: enviar_pre_preenchimento(buffer_envio) # Também confirma o estado incremental
 
     print(f"--- Fim do pré-preenchimento para: {sheet.title} ---\n")
-    return dados_modificados # Retorna a lista de dicionários potencialmente modificada em memória
+    return dados_modificados # Retorna a lista de Registros potencialmente modificada em memória
+
+# ==============================================================================
+# 4.1 ESTADO DO PRÉ-PREENCHIMENTO (índice CPF/CNPJ -> linha fonte e marca d'água, por fonte)
+# ==============================================================================
+# Cada carga revarria todas as linhas: remontava o mapa de fontes e reconferia cada linha de "veículo adicional",
+# inclusive as já preenchidas em cargas anteriores. O estado em PASTA_CACHE guarda, por fonte (aba ou arquivo):
+#   'fontes'      ID (CPF/CNPJ) -> linha da primeira linha fonte
+#   'marca_agua'  última linha já processada, e 'conferencia' = carimbo, cadastro e ID trigger dessa linha
+#   'pendentes'   linhas alvo cuja fonte ainda não apareceu (conferidas de novo a cada carga)
+#   'alvos'       ID -> linhas alvo já resolvidas, e 'propagados' = ID -> valores copiados da fonte
+# Assim cada carga só mapeia e resolve as linhas novas e as pendentes. Cabeçalho/colunas diferentes, conferência que
+# não bate ou índice apontando para outra linha descartam o estado (tudo é conferido, como antes); exclusões feitas pelo
+# app deslocam as linhas do estado. O estado só é gravado depois que as células foram enviadas sem erro.
+# VERIFICAR_PRE_PREENCHIMENTO (--verify-prefill) confere as linhas fonte já usadas: colunas editadas na fonte vão para
+# os alvos que estão vazios ou ainda com o valor antigo (o que foi digitado no próprio alvo não é sobrescrito).
+ARQUIVO_PRE_PREENCHIMENTO = "pre_preenchimento.json" # Em PASTA_CACHE
+PRE_PREENCHIMENTO_INCREMENTAL = True # False = confere todas as linhas a cada carga
+VERIFICAR_PRE_PREENCHIMENTO = False
+
+_estados_pendentes = {} # Chave da fonte -> estado novo, à espera do envio das células
+_trava_pre_preenchimento = threading.Lock() # PF e PJ são pré-preenchidos em threads paralelas
+
+def _caminho_pre_preenchimento():
+    return Path(PASTA_CACHE) / ARQUIVO_PRE_PREENCHIMENTO
+
+def _ler_estados_pre_preenchimento():
+    """Estados salvos de todas as fontes; arquivo ausente ou corrompido = nenhum estado."""
+    try:
+        return json.loads(_caminho_pre_preenchimento().read_text(encoding='utf-8'))['estados']
+    except (OSError, ValueError, KeyError, TypeError):
+        return {}
+
+def _salvar_estados_pre_preenchimento(estados):
+    """Grava os estados (arquivo temporário + replace)."""
+    try:
+        Path(PASTA_CACHE).mkdir(parents=True, exist_ok=True)
+        caminho_tmp = _caminho_pre_preenchimento().with_suffix('.tmp')
+        caminho_tmp.write_text(json.dumps({'versao': 1, 'estados': estados}, ensure_ascii=False), encoding='utf-8')
+        os.replace(caminho_tmp, _caminho_pre_preenchimento())
+    except OSError as e:
+        print(f" Aviso: não foi possível salvar o estado do pré-preenchimento: {e}")
+
+def assinatura_pre_preenchimento(headers, id_col_trigger, id_col_comparison, col_cadastro, trigger_value, colunas):
+    """Hash do que define o resultado do pré-preenchimento além das linhas: mudou, o estado salvo não vale."""
+    partes = [headers, id_col_trigger, id_col_comparison, col_cadastro, trigger_value, sorted(colunas) if colunas is not None else None]
+    return hashlib.sha256(json.dumps(partes, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def _conferencia_linha(registro, colunas):
+    return [str(registro.get(coluna, "")).strip() for coluna in colunas]
+
+def ler_estado_pre_preenchimento(fonte, assinatura, registros, colunas_conferencia):
+    """Estado salvo da fonte, se ainda vale para estes registros; None = processar todas as linhas."""
+    if not PRE_PREENCHIMENTO_INCREMENTAL or FORCAR_RESYNC: return None
+    estado = _ler_estados_pre_preenchimento().get(fonte.chave)
+    if not estado or estado.get('assinatura') != assinatura: return None
+    marca_agua = estado['marca_agua']
+    if not 1 <= marca_agua <= len(registros) + 1: return None # Linhas excluídas fora do app
+    if marca_agua >= 2 and _conferencia_linha(registros[marca_agua - 2], colunas_conferencia) != estado['conferencia']: return None
+    return estado
+
+def confirmar_estados_pre_preenchimento(sucesso):
+    """Depois do envio das células: grava os estados novos (sucesso) ou os descarta (a próxima carga refaz o trabalho)."""
+    with _trava_pre_preenchimento:
+        pendentes = dict(_estados_pendentes); _estados_pendentes.clear()
+        if not pendentes or not sucesso: return
+        estados = _ler_estados_pre_preenchimento()
+        estados.update(pendentes)
+        _salvar_estados_pre_preenchimento(estados)
+
+def pre_preenchimento_remover_linhas(fonte, linhas_excluidas):
+    """Desloca as linhas do estado salvo depois de uma exclusão feita pelo app (como snapshot_remover_linhas)."""
+    with _trava_pre_preenchimento:
+        estados = _ler_estados_pre_preenchimento()
+        estado = estados.get(fonte.chave)
+        if not estado: return
+        excluidas = sorted({linha for linha in linhas_excluidas if 2 <= linha <= estado['marca_agua']})
+        if not excluidas: return
+        conjunto_excluidas = set(excluidas) # Consulta O(1) por linha; a lista ordenada fica para o bisect
+        if conjunto_excluidas & set(estado['fontes'].values()):
+            del estados[fonte.chave] # Linha fonte excluída: outra linha pode virar a fonte; a próxima carga confere tudo
+        else:
+            deslocar = lambda linha: linha - bisect.bisect_left(excluidas, linha) # Nº de linhas excluídas acima
+            manter = lambda linha: linha not in conjunto_excluidas
+            estado['fontes'] = {chave: deslocar(linha) for chave, linha in estado['fontes'].items()}
+            estado['pendentes'] = [deslocar(linha) for linha in estado['pendentes'] if manter(linha)]
+            estado['alvos'] = {chave: [deslocar(linha) for linha in linhas if manter(linha)] for chave, linhas in estado['alvos'].items()}
+            estado['marca_agua'] -= len(excluidas)
+        _salvar_estados_pre_preenchimento(estados)
 
 # ==============================================================================
 # 5. FUNÇÕES DE INTERAÇÃO COM PLANILHAS (Carregar)
@@ -317,75 +1114,1396 @@ def autenticar_google():
     scopes = ['https://www.googleapis.com/auth/spreadsheets', 'https://www.googleapis.com/auth/drive']
     if not CAMINHO_CREDENCIAL.exists():
          raise FileNotFoundError(f"Arquivo de credenciais não encontrado em: {CAMINHO_CREDENCIAL}")
-    credenciais = Credentials.from_service_account_file(CAMINHO_CREDENCIAL, scopes=scopes)
-    gc = gspread.authorize(credenciais)
+    with medir('autenticacao'):
+        from google.oauth2.service_account import Credentials
+        credenciais = Credentials.from_service_account_file(CAMINHO_CREDENCIAL, scopes=scopes)
+        reaproveitar_token(credenciais) # Token salvo ainda válido: a primeira chamada não precisa gerar outro
+        gc = gspread.authorize(credenciais, http_client=classe_cliente_http()) # Cota, retry e backoff em todas as chamadas
     print("Autenticado.")
     return gc
 
-def carregar_planilha(gc, filename, tab_name):
-    """Abre uma planilha e aba específica, lê cabeçalho e dados de forma robusta."""
+def registros_da_fonte(fonte, colunas=None, tipo=None):
+    """Lê cabeçalho e dados da fonte, valida o cabeçalho e monta os registros. Retorna (headers limpos, registros).
+
+    Com `colunas` (nomes em maiúsculas), só essas colunas são baixadas (e a primeira, que marca as linhas preenchidas);
+    as demais ficam vazias nos registros. Os registros são Registros (seção 3.4) de uma mesma TabelaRegistros do `tipo`.
+    Cabeçalho inválido levanta ValueError.
+    """
+    # Lê a primeira linha (cabeçalho) BRUTA e as linhas de dados (no Sheets, pelo snapshot local: só o que mudou vem da API)
+    projetar = None
+    if colunas is not None:
+        projetar = lambda cabecalho: {0} | {i for i, h in enumerate(cabecalho) if str(h).strip().upper() in colunas}
+    raw_headers_list, linhas_brutas = fonte.ler(projetar)
+    if not raw_headers_list:
+        raise ValueError("Cabeçalho (Linha 1) está completamente vazio ou não pôde ser lido.")
+
+    # Limpa os cabeçalhos (remove espaços extras das pontas, converte para string)
+    cleaned_headers_list = [str(h).strip() for h in raw_headers_list]
+    # Filtra cabeçalhos que ficaram vazios APÓS limpeza
+    headers_non_empty = [h for h in cleaned_headers_list if h]
+    if not headers_non_empty:
+         raise ValueError("Todos os cabeçalhos na Linha 1 estão vazios após limpeza.")
+    if DEBUG_MODE:
+         print(f"Cabeçalho final (limpo, não-vazio) a ser usado: {headers_non_empty}")
+
+    # Verifica Duplicatas nos cabeçalhos NÃO VAZIOS (case-insensitive)
+    headers_lower_non_empty = [h.lower() for h in headers_non_empty]
+    if len(headers_lower_non_empty) != len(set(headers_lower_non_empty)):
+        from collections import Counter
+        header_counts = Counter(headers_lower_non_empty)
+        duplicates = {header: count for header, count in header_counts.items() if count > 1}
+        # Levanta um erro claro se duplicatas forem encontradas aqui
+        raise ValueError(
+            f"Cabeçalho não único detectado programaticamente em '{fonte.title}'. "
+            f"Duplicatas (minúsculas): {duplicates}. Corrija a Linha 1 da planilha."
+        )
+
+    # Valida se a coluna Status Essencial está presente nos cabeçalhos finais
+    if STATUS_COL not in headers_non_empty:
+        raise ValueError(f"Coluna Status Essencial '{STATUS_COL}' não encontrada no cabeçalho final (após limpeza e remoção de vazios).")
+
+    # Monta os registros como o get_all_records do gspread faria (linhas completadas com "" e valores numéricos
+    # convertidos), mas sem um dict por linha: o cabeçalho fica uma vez só na tabela
+    largura = max([len(raw_headers_list)] + [len(linha) for linha in linhas_brutas])
+    tabela = TabelaRegistros(list(raw_headers_list) + [""] * (largura - len(raw_headers_list)), tipo)
+    numericise_all = gspread.utils.numericise_all
+    data = [Registro(tabela, numericise_all(list(linha) + [""] * (largura - len(linha))), i + 2) for i, linha in enumerate(linhas_brutas)]
+    print(f"Lidos {len(data)} registros de '{fonte.title}' com sucesso.")
+    return headers_non_empty, data # Retorna os headers limpos e não-vazios
+
+def carregar_planilha(gc, filename, tab_name, colunas=None, tipo=None):
+    """Abre uma planilha e aba específica do Google Sheets e lê os registros. Retorna (FonteGoogleSheets, headers, registros)."""
     print(f"\nAbrindo arquivo: {filename}")
     try:
-        workbook = gc.open(filename)
-        print(f"Tentando acessar aba: '{tab_name}'")
-        sheet = workbook.worksheet(tab_name)
+        sheet = abrir_aba(gc, filename, tab_name) # Pela chave/ID salvos; busca por título só na primeira vez
         print(f"Aba '{sheet.title}' (ID: {sheet.id}) acessada.")
-
-        # Lê a primeira linha (cabeçalho) BRUTA
-        raw_headers_list = sheet.row_values(1)
-        if not raw_headers_list:
-            raise ValueError("Cabeçalho (Linha 1) está completamente vazio ou não pôde ser lido.")
-
-        # Limpa os cabeçalhos (remove espaços extras das pontas, converte para string)
-        cleaned_headers_list = [str(h).strip() for h in raw_headers_list]
-        # Filtra cabeçalhos que ficaram vazios APÓS limpeza
-        headers_non_empty = [h for h in cleaned_headers_list if h]
-        if not headers_non_empty:
-             raise ValueError("Todos os cabeçalhos na Linha 1 estão vazios após limpeza.")
-        if DEBUG_MODE:
-             print(f"Cabeçalho final (limpo, não-vazio) a ser usado: {headers_non_empty}")
-
-        # Verifica Duplicatas nos cabeçalhos NÃO VAZIOS (case-insensitive)
-        headers_lower_non_empty = [h.lower() for h in headers_non_empty]
-        if len(headers_lower_non_empty) != len(set(headers_lower_non_empty)):
-            from collections import Counter
-            header_counts = Counter(headers_lower_non_empty)
-            duplicates = {header: count for header, count in header_counts.items() if count > 1}
-            # Levanta um erro claro se duplicatas forem encontradas aqui
-            raise gspread.exceptions.GSpreadException(
-                f"Cabeçalho não único detectado programaticamente na aba '{sheet.title}'. "
-                f"Duplicatas (minúsculas): {duplicates}. Corrija a Linha 1 da planilha."
-            )
-
-        # Valida se a coluna Status Essencial está presente nos cabeçalhos finais
-        if STATUS_COL not in headers_non_empty:
-            raise ValueError(f"Coluna Status Essencial '{STATUS_COL}' não encontrada no cabeçalho final (após limpeza e remoção de vazios).")
-
-        print(f"Lendo dados da aba '{sheet.title}' usando get_all_records...")
-        # Usa get_all_records passando os cabeçalhos limpos e validados como 'expected_headers'
-        # Isso ajuda gspread a mapear corretamente e evita erros de 'cabeçalho não único' causados por problemas de detecção interna
-        data = sheet.get_all_records(head=1, expected_headers=headers_non_empty)
-        print(f"Lidos {len(data)} registros de '{sheet.title}' com sucesso.")
-
-        return sheet, headers_non_empty, data # Retorna os headers limpos e não-vazios
+        fonte = FonteGoogleSheets(sheet)
+        return (fonte, *registros_da_fonte(fonte, colunas, tipo))
 
     except gspread.exceptions.SpreadsheetNotFound:
-        messagebox.showerror("Erro Crítico", f"Arquivo '{filename}' não encontrado no Google Drive. Verifique o nome e as permissões da conta de serviço.")
-        sys.exit()
+        notificar('erro', "Erro Crítico", f"Arquivo '{filename}' não encontrado no Google Drive. Verifique o nome e as permissões da conta de serviço.")
+        sys.exit(SAIDA_ERRO_PLANILHA)
     except gspread.exceptions.WorksheetNotFound:
-        messagebox.showerror("Erro Crítico", f"Aba '{tab_name}' não encontrada no arquivo '{filename}'. Verifique o nome exato (sensível a maiúsculas/minúsculas e espaços).")
-        sys.exit()
+        notificar('erro', "Erro Crítico", f"Aba '{tab_name}' não encontrada no arquivo '{filename}'. Verifique o nome exato (sensível a maiúsculas/minúsculas e espaços).")
+        sys.exit(SAIDA_ERRO_PLANILHA)
     except ValueError as e: # Erro levantado pela nossa validação de cabeçalho/Status
-         messagebox.showerror("Erro Cabeçalho/Validação", f"Erro no cabeçalho/validação da aba '{tab_name}' em '{filename}':\n{e}")
-         sys.exit()
-    except gspread.exceptions.GSpreadException as ge: # Erro de duplicata ou outro erro gspread
+         notificar('erro', "Erro Cabeçalho/Validação", f"Erro no cabeçalho/validação da aba '{tab_name}' em '{filename}':\n{e}")
+         sys.exit(SAIDA_ERRO_PLANILHA)
+    except gspread.exceptions.GSpreadException as ge: # Outro erro gspread
          print(f"ERRO GSPREAD FINAL: {ge}") # Loga o erro
-         messagebox.showerror("Erro GSpread", f"Erro ao processar a planilha '{filename}' / Aba '{tab_name}':\n{ge}\n\nVerifique a formatação da planilha ou o console para mais detalhes.")
-         sys.exit()
+         notificar('erro', "Erro GSpread", f"Erro ao processar a planilha '{filename}' / Aba '{tab_name}':\n{ge}\n\nVerifique a formatação da planilha ou o console para mais detalhes.")
+         sys.exit(SAIDA_ERRO_PLANILHA)
     except Exception as e: # Outros erros (API, rede, etc.)
-        messagebox.showerror("Erro ao Carregar Planilha", f"Erro inesperado ao carregar '{filename}' / Aba '{tab_name}':\n{type(e).__name__}: {e}")
-        sys.exit()
+        notificar('erro', "Erro ao Carregar Planilha", f"Erro inesperado ao carregar '{filename}' / Aba '{tab_name}':\n{type(e).__name__}: {e}")
+        sys.exit(SAIDA_ERRO_PLANILHA)
+
+def carregar_fonte_local(especificacao, tab_name, colunas=None, tipo=None):
+    """Como carregar_planilha, para um arquivo CSV/XLSX/SQLite (ver FONTES_LOCAIS). Retorna (fonte, headers, registros)."""
+    print(f"\nAbrindo arquivo local: {especificacao}")
+    try:
+        fonte = abrir_fonte_local(especificacao, tab_name)
+        return (fonte, *registros_da_fonte(fonte, colunas, tipo))
+    except FileNotFoundError:
+        notificar('erro', "Erro Crítico", f"Arquivo local '{especificacao}' não encontrado.")
+        sys.exit(SAIDA_ERRO_PLANILHA)
+    except ValueError as e: # Formato não suportado, aba/tabela inexistente ou cabeçalho inválido
+        notificar('erro', "Erro Cabeçalho/Validação", f"Erro no arquivo local '{especificacao}':\n{e}")
+        sys.exit(SAIDA_ERRO_PLANILHA)
+    except Exception as e: # CSV/XLSX/SQLite corrompido, sem permissão etc.
+        notificar('erro', "Erro ao Carregar Arquivo", f"Erro inesperado ao carregar '{especificacao}':\n{type(e).__name__}: {e}")
+        sys.exit(SAIDA_ERRO_PLANILHA)
+
+
+# ==============================================================================
+# 5.1 GERAÇÃO DE DOCUMENTOS (por registro, sequencial ou em processos paralelos)
+# ==============================================================================
+NUM_WORKERS = None # Processos de geração; None = nº de CPUs, 1 = sequencial no processo principal
+
+def _resultado_registro(linha, tipo, msg_erro=None):
+    """Resultado inicial (ou de falha) da geração de um registro."""
+    return {'linha': linha, 'tipo': tipo, 'nome': None, 'ok': False, 'processado': False, 'documentos': 0,
+            'pulados': 0, 'falhas': 0, 'manifesto': {}, 'arquivos': [], 'arquivo_registro': None,
+            'erros_template': [], 'erros_geracao': [msg_erro] if msg_erro else [], 'nao_resolvidos': {}}
+
+def gerar_documentos_registro(pessoa_original):
+    """Gera todos os DOCX/XLSX de um registro. Não acessa a planilha: devolve um dict com o resultado."""
+    resultado = _resultado_registro(pessoa_original.get("linha"), None)
+    erros_template, erros_geracao = resultado['erros_template'], resultado['erros_geracao']
+
+    # Registro da sessão (ou dict avulso convertido): campos pela coluna em maiúsculas, sem copiar a linha
+    pessoa = registro_de_dict(pessoa_original)
+
+    tipo = pessoa['tipo'] # 'tipo' vem da tabela da aba
+    linha = pessoa.linha # 'linha' foi adicionada no processamento
+    resultado['tipo'] = tipo
+
+    # Define quais listas de templates usar
+    if tipo == "PF":
+        templates_docx = TEMPLATE_PF_DOCX
+        templates_xlsx = TEMPLATE_PF_XLSX
+    elif tipo == "PJ":
+        templates_docx = TEMPLATE_PJ_DOCX
+        templates_xlsx = TEMPLATE_PJ_XLSX
+    else:
+        msg_erro = f"L{linha}: Tipo de pessoa ('{tipo}') inválido ou não encontrado nos dados."
+        print(f"⚠️ {msg_erro}"); erros_geracao.append(msg_erro); return resultado # Pula este registro
+
+    # Define nomes base para pastas e arquivos, tratando caracteres inválidos
+    nome_base_raw = str(pessoa.campo("NOME COMPLETO", pessoa.campo("RAZÃO SOCIAL", f"Registro_L{linha}"))).strip()
+    placa_base_raw = str(pessoa.campo("PLACA", "SemPlaca")).strip()
+    resultado['nome'] = nome_base_raw
+    # Remove caracteres inválidos para nomes de arquivo/pasta e limita comprimento
+    nome_base = re.sub(r'[\\/*?:"<>|]', "", nome_base_raw).replace(" ", "_")[:80]
+    placa_base = re.sub(r'[\\/*?:"<>|]', "", placa_base_raw).replace('-', '')
+
+    if not isinstance(linha, int) or linha < 2:
+        msg_erro = f"{nome_base}: Número de linha inválido ({linha}) associado ao registro."
+        print(f"⚠️ {msg_erro}"); erros_geracao.append(msg_erro); return resultado
+
+    if DEBUG_MODE: print(f"\n=== PROC REG: {nome_base_raw} (L{linha}, {tipo}) ===")
+    pasta_destino = Path(PASTA_SAIDA) / nome_base
+    em_zip = MODO_SAIDA != "pastas" # Documentos ficam em memória e o processo principal grava no ZIP (seção 5.9)
+    usar_manifesto = USAR_MANIFESTO and not em_zip
+    if em_zip:
+        resultado['arquivo_registro'] = f"{nome_base}_{placa_base}.zip"
+    else:
+        try:
+             pasta_destino.mkdir(parents=True, exist_ok=True)
+        except OSError as e:
+             msg = f"L{linha} ({nome_base_raw}): Erro ao criar pasta de destino '{pasta_destino}': {e}"; print(f"❌ {msg}"); erros_geracao.append(msg); return resultado
+
+    resultado['processado'] = True
+    # Flag para controlar se TODOS os templates (docx e xlsx) foram gerados com sucesso para esta pessoa
+    todos_templates_ok_para_pessoa = True
+    placeholders_nao_resolvidos = resultado['nao_resolvidos']
+    contexto = pessoa.contexto() # Uma vez por registro: compartilhado por todos os templates e pelo manifesto
+    hash_dados = hash_placeholders(contexto) if usar_manifesto else None
+
+    # --- Processamento dos Templates DOCX ---
+    if DEBUG_MODE and templates_docx: print(f"  -- Processando {len(templates_docx)} templates DOCX --")
+    for template_path_obj in templates_docx:
+        template_nome = template_path_obj.name
+        if not template_path_obj.exists():
+            msg = f"Template DOCX não encontrado: {template_nome}"; print(f"⚠️ {msg}"); erros_template.append(msg); todos_templates_ok_para_pessoa = False; resultado['falhas'] += 1; continue
+        if DEBUG_MODE: print(f"-- Proc Template DOCX: {template_nome}")
+        try:
+            prefixo = template_path_obj.stem.split('-', 1)[0].strip()
+            nome_doc = f"{prefixo}_{nome_base}_{placa_base}.docx"
+            caminho_saida = pasta_destino / nome_doc
+            nao_resolvidos = placeholders_nao_resolvidos.setdefault(template_nome, set())
+            hash_entrada = hash_entradas(template_path_obj, MOTOR_DOCX, hash_dados) if usar_manifesto else None
+            anterior = saida_atualizada(f"{nome_base}/{nome_doc}", caminho_saida, hash_entrada) if usar_manifesto else None
+            if anterior is not None: # Mesmo template e mesmos dados: o arquivo existente já é o resultado
+                nao_resolvidos.update(anterior.get('nao_resolvidos', [])); resultado['pulados'] += 1; continue
+            # Template interpretado uma vez por sessão; aqui só clona e altera os parágrafos indexados
+            destino = io.BytesIO() if em_zip else caminho_saida
+            renderizar_docx(template_path_obj, contexto, destino, nao_resolvidos)
+            resultado['documentos'] += 1
+            if em_zip: resultado['arquivos'].append((f"{nome_base}/{nome_doc}", destino.getvalue()))
+            else: registrar_saida(resultado, f"{nome_base}/{nome_doc}", caminho_saida, hash_entrada, nao_resolvidos)
+            # if DEBUG_MODE: print(f"  >> Salvo DOCX: {nome_doc}")
+        except Exception as e:
+            msg = f"L{linha} ({nome_base_raw}): Erro ao gerar/salvar DOCX '{template_nome}': {type(e).__name__} - {e}"; print(f"❌ {msg}"); erros_geracao.append(msg); todos_templates_ok_para_pessoa = False; resultado['falhas'] += 1
+
+    # --- Processamento dos Templates XLSX ---
+    if DEBUG_MODE and templates_xlsx: print(f"  -- Processando {len(templates_xlsx)} templates XLSX --")
+    for template_path_obj in templates_xlsx:
+        template_nome = template_path_obj.name
+        if not template_path_obj.exists():
+             msg = f"Template XLSX não encontrado: {template_nome}"; print(f"⚠️ {msg}"); erros_template.append(msg); todos_templates_ok_para_pessoa = False; resultado['falhas'] += 1; continue
+        if DEBUG_MODE: print(f"-- Proc Template XLSX: {template_nome}")
+        try:
+            prefixo_xlsx = template_path_obj.stem # Nome do arquivo template sem extensão
+            nome_doc_xlsx = f"{prefixo_xlsx}_{nome_base}_{placa_base}.xlsx"
+            caminho_saida_xlsx = pasta_destino / nome_doc_xlsx
+            nao_resolvidos = placeholders_nao_resolvidos.setdefault(template_nome, set())
+            hash_entrada = hash_entradas(template_path_obj, MOTOR_XLSX, hash_dados) if usar_manifesto else None
+            anterior = saida_atualizada(f"{nome_base}/{nome_doc_xlsx}", caminho_saida_xlsx, hash_entrada) if usar_manifesto else None
+            if anterior is not None:
+                nao_resolvidos.update(anterior.get('nao_resolvidos', [])); resultado['pulados'] += 1; continue
+            destino = io.BytesIO() if em_zip else caminho_saida_xlsx
+            renderizar_xlsx(template_path_obj, contexto, destino, nao_resolvidos)
+            resultado['documentos'] += 1
+            if em_zip: resultado['arquivos'].append((f"{nome_base}/{nome_doc_xlsx}", destino.getvalue()))
+            else: registrar_saida(resultado, f"{nome_base}/{nome_doc_xlsx}", caminho_saida_xlsx, hash_entrada, nao_resolvidos)
+            # if DEBUG_MODE: print(f"  >> Salvo XLSX: {nome_doc_xlsx}")
+        except openpyxl.utils.exceptions.InvalidFileException:
+             msg = f"L{linha} ({nome_base_raw}): Arquivo Excel inválido ou corrompido: '{template_nome}'"; print(f"❌ {msg}"); erros_geracao.append(msg); todos_templates_ok_para_pessoa = False; resultado['falhas'] += 1
+        except Exception as e:
+             msg = f"L{linha} ({nome_base_raw}): Erro ao gerar/salvar XLSX '{template_nome}': {type(e).__name__} - {e}"; print(f"❌ {msg}"); erros_geracao.append(msg); todos_templates_ok_para_pessoa = False; resultado['falhas'] += 1
+
+    resultado['ok'] = todos_templates_ok_para_pessoa
+    return resultado
+
+def _gerar_registro_protegido(pessoa_original):
+    """Envolve gerar_documentos_registro para que falhas inesperadas virem erro do registro, não do lote."""
+    try:
+        with medir('registro.gerar', 'debug', linha=pessoa_original.get("linha"), tipo=pessoa_original.get("tipo")):
+            resultado = gerar_documentos_registro(pessoa_original)
+    except Exception as e:
+        linha = pessoa_original.get("linha")
+        msg = f"L{linha}: Erro inesperado na geração: {type(e).__name__} - {e}"; print(f"❌ {msg}")
+        resultado = _resultado_registro(linha, pessoa_original.get("tipo"), msg)
+    contar('registros.gerados')
+    contar('documentos.gerados', resultado['documentos'])
+    contar('documentos.pulados', resultado['pulados'])
+    contar('documentos.falhos', resultado['falhas'])
+    if _em_worker: resultado['instrumentacao'] = drenar_instrumentacao() # Volta ao processo principal com o resultado
+    return resultado
+
+def aquecer_cache_templates():
+    """Carrega no cache de templates todos os modelos existentes, com os motores configurados."""
+    for template_path in TEMPLATE_PF_DOCX + TEMPLATE_PJ_DOCX:
+        if not template_path.exists(): continue
+        try:
+            if MOTOR_DOCX == "zip": obter_template_cache('docx-zip', template_path, _carregar_template_docx_zip)
+            else: obter_template_cache('docx', template_path, _carregar_template_docx)
+        except Exception as e: # O erro real será reportado por registro, durante a geração
+            if DEBUG_MODE: print(f"  [cache] Falha ao pré-carregar '{template_path.name}': {e}")
+    if MOTOR_XLSX == "zip":
+        for template_path in TEMPLATE_PF_XLSX + TEMPLATE_PJ_XLSX:
+            if template_path.exists(): obter_template_cache('xlsx-zip', template_path, _carregar_template_xlsx_zip)
+
+def _config_worker():
+    """Configurações do processo principal que os workers precisam replicar (sobrevivem ao 'spawn' do Windows)."""
+    return {'MOTOR_DOCX': MOTOR_DOCX, 'MOTOR_XLSX': MOTOR_XLSX, 'DEBUG_MODE': DEBUG_MODE, 'PASTA_SAIDA': PASTA_SAIDA,
+            'USAR_MANIFESTO': USAR_MANIFESTO, 'FORCAR_GERACAO': FORCAR_GERACAO, '_manifesto': _manifesto, 'MODO_SAIDA': MODO_SAIDA,
+            'MEDIR_MEMORIA': MEDIR_MEMORIA, '_eventos_worker': [] if _arquivo_log_json is not None else None,
+            '_em_worker': True, 'stdout_para_stderr': sys.stdout is sys.stderr}
+
+def _inicializar_worker(config):
+    """Inicializador de cada processo de geração: aplica a configuração e deixa os templates em cache."""
+    config = dict(config)
+    # No modo linha de comando o stdout é reservado para o progresso em JSON
+    if config.pop('stdout_para_stderr', False): sys.stdout = sys.stderr
+    globals().update(config)
+    _duracoes.clear(); _contadores.clear() # Com 'fork', o worker herdaria o que o processo principal já mediu
+    if MEDIR_MEMORIA:
+        import tracemalloc
+        tracemalloc.start()
+    aquecer_cache_templates()
+
+def gerar_registros(registros, num_workers=None, cancelar=None):
+    """Gera os documentos dos registros e produz os resultados na mesma ordem, à medida que ficam prontos.
+
+    `cancelar` (threading.Event) interrompe na fronteira de um registro: os que não começaram são
+    descartados e os já iniciados terminam e têm o resultado entregue normalmente.
+    """
+    num_workers = num_workers or NUM_WORKERS or os.cpu_count() or 1
+    num_workers = min(num_workers, len(registros))
+    if num_workers <= 1:
+        for pessoa in registros:
+            if cancelar is not None and cancelar.is_set(): break
+            yield _gerar_registro_protegido(pessoa)
+        return
+
+    print(f" Gerando em {num_workers} processo(s) paralelos...")
+    with ProcessPoolExecutor(max_workers=num_workers, initializer=_inicializar_worker, initargs=(_config_worker(),)) as executor:
+        futuros = [executor.submit(_gerar_registro_protegido, pessoa) for pessoa in registros]
+        for pessoa, futuro in zip(registros, futuros):
+            if cancelar is not None and cancelar.is_set():
+                for pendente in futuros: pendente.cancel() # Só cancela os que ainda não começaram
+            if futuro.cancelled(): continue
+            try:
+                resultado = futuro.result()
+            except Exception as e: # Ex.: BrokenProcessPool se um worker morrer
+                linha = pessoa.get("linha")
+                msg = f"L{linha}: Falha no processo de geração: {type(e).__name__} - {e}"; print(f"❌ {msg}")
+                yield _resultado_registro(linha, pessoa.get("tipo"), msg)
+                continue
+            mesclar_instrumentacao(resultado.pop('instrumentacao'))
+            yield resultado
+
+
+# ==============================================================================
+# 5.2 SNAPSHOT LOCAL DAS RESPOSTAS (SQLite, sincronização incremental)
+# ==============================================================================
+# As abas de respostas do Forms só crescem no fim: guardamos as linhas já lidas e a "marca d'água" (última linha
+# sincronizada) e, a cada abertura, uma única chamada values.batchGet traz o cabeçalho, as linhas novas, a coluna
+# Status (que pode ser editada fora do app) e a linha da marca d'água, usada para detectar exclusões/inserções externas.
+PASTA_CACHE = ".autodocs_cache" # Criada onde o script/exe rodar, como a PASTA_SAIDA
+ARQUIVO_SNAPSHOT = "respostas.sqlite3"
+USAR_SNAPSHOT = True   # False = sempre baixa a aba inteira (sem gravar cache)
+FORCAR_RESYNC = False  # True (ou --resync na linha de comando) = descarta o snapshot e baixa tudo de novo
+
+_conexao_snapshot = None
+_trava_snapshot = threading.Lock() # A conexão é compartilhada entre a thread da interface e a de carregamento
+
+def _abrir_snapshot():
+    """Abre (e cria, se preciso) o banco do snapshot."""
+    global _conexao_snapshot
+    if _conexao_snapshot is None:
+        Path(PASTA_CACHE).mkdir(parents=True, exist_ok=True)
+        conexao = sqlite3.connect(Path(PASTA_CACHE) / ARQUIVO_SNAPSHOT, check_same_thread=False)
+        conexao.executescript("""
+            CREATE TABLE IF NOT EXISTS abas (chave TEXT PRIMARY KEY, cabecalho TEXT NOT NULL,
+                                             marca_agua INTEGER NOT NULL, sincronizado_em REAL, colunas TEXT);
+            CREATE TABLE IF NOT EXISTS linhas (chave TEXT NOT NULL, linha INTEGER NOT NULL, valores TEXT NOT NULL,
+                                               PRIMARY KEY (chave, linha)) WITHOUT ROWID;
+        """)
+        # Snapshots de versões anteriores não têm a coluna 'colunas' (NULL = todas as colunas baixadas)
+        if 'colunas' not in [info[1] for info in conexao.execute("PRAGMA table_info(abas)")]:
+            conexao.execute("ALTER TABLE abas ADD COLUMN colunas TEXT")
+        _conexao_snapshot = conexao
+    return _conexao_snapshot
+
+def _chave_snapshot(sheet):
+    """Identifica a aba no snapshot: ID da planilha + ID da aba (não mudam ao renomear)."""
+    return f"{sheet.spreadsheet.id}/{sheet.id}"
+
+def _ler_snapshot(chave):
+    """Retorna (cabeçalho, marca_d'água, linhas, colunas baixadas ou None = todas) do snapshot, ou None se a aba nunca foi sincronizada."""
+    with _trava_snapshot:
+        conexao = _abrir_snapshot()
+        aba = conexao.execute("SELECT cabecalho, marca_agua, colunas FROM abas WHERE chave = ?", (chave,)).fetchone()
+        if aba is None: return None
+        linhas = [json.loads(valores) for (valores,) in
+                  conexao.execute("SELECT valores FROM linhas WHERE chave = ? ORDER BY linha", (chave,))]
+    return json.loads(aba[0]), aba[1], linhas, (set(json.loads(aba[2])) if aba[2] else None)
+
+def _gravar_snapshot(chave, cabecalho, marca_agua, linhas, colunas, alteradas=None):
+    """Grava o snapshot; `alteradas` = índices (0-based) das linhas a regravar, ou None para regravar a aba inteira."""
+    with _trava_snapshot:
+        conexao = _abrir_snapshot()
+        with conexao: # Uma transação: o snapshot nunca fica pela metade
+            if alteradas is None:
+                conexao.execute("DELETE FROM linhas WHERE chave = ?", (chave,))
+                alteradas = range(len(linhas))
+            conexao.executemany("INSERT OR REPLACE INTO linhas (chave, linha, valores) VALUES (?, ?, ?)",
+                                ((chave, i + 2, json.dumps(linhas[i], ensure_ascii=False)) for i in alteradas))
+            conexao.execute("INSERT OR REPLACE INTO abas (chave, cabecalho, marca_agua, sincronizado_em, colunas) VALUES (?, ?, ?, ?, ?)",
+                            (chave, json.dumps(cabecalho, ensure_ascii=False), marca_agua, time.time(),
+                             json.dumps(sorted(colunas)) if colunas is not None else None))
+
+def _sem_vazios_finais(linha):
+    """Remove as células vazias do fim da linha (a API não as devolve)."""
+    linha = list(linha)
+    while linha and linha[-1] == "": linha.pop()
+    return linha
+
+def _celula(linha, indice):
+    return linha[indice] if indice < len(linha) else ""
+
+def _blocos_colunas(colunas):
+    """Agrupa índices de coluna (0-based) em trechos contíguos: [(inicial, final)]."""
+    blocos = []
+    for indice in sorted(colunas):
+        if blocos and blocos[-1][1] == indice - 1: blocos[-1][1] = indice
+        else: blocos.append([indice, indice])
+    return [tuple(bloco) for bloco in blocos]
+
+def _letra_coluna(indice):
+    """Letra A1 da coluna de índice 0-based."""
+    return gspread.utils.rowcol_to_a1(1, indice + 1)[:-1]
+
+def _intervalos_linhas(blocos, primeira, ultima):
+    """Intervalos A1 das linhas [primeira, ultima]: linhas inteiras (blocos None) ou só os trechos de colunas projetados."""
+    if blocos is None: return [f"{primeira}:{ultima}"]
+    return [f"{_letra_coluna(inicio)}{primeira}:{_letra_coluna(fim)}{ultima}" for inicio, fim in blocos]
+
+def _montar_linhas(blocos, respostas):
+    """Junta as respostas de _intervalos_linhas em linhas completas (colunas não projetadas ficam vazias)."""
+    if blocos is None: return [list(linha) for linha in respostas[0]]
+    quantidade = max((len(valores) for valores in respostas), default=0)
+    linhas = [[""] * (blocos[-1][1] + 1) for _ in range(quantidade)]
+    for (inicio, _), valores in zip(blocos, respostas):
+        for k, trecho in enumerate(valores): linhas[k][inicio:inicio + len(trecho)] = trecho
+    return [_sem_vazios_finais(linha) for linha in linhas]
+
+def sincronizar_aba(sheet, projetar=None, forcar=False):
+    """Retorna (cabeçalho bruto, linhas brutas a partir da linha 2) da aba, baixando só o que mudou desde o snapshot.
+
+    `projetar(cabeçalho)` devolve os índices (0-based) das colunas a baixar; None baixa as linhas inteiras.
+    """
+    chave = _chave_snapshot(sheet)
+    snapshot = None if (forcar or FORCAR_RESYNC or not USAR_SNAPSHOT) else _ler_snapshot(chave)
+    if snapshot:
+        cabecalho_salvo, marca_agua, linhas, colunas_salvas = snapshot
+        colunas = projetar(cabecalho_salvo) if projetar else None
+        if colunas_salvas is not None and (colunas is None or not colunas <= colunas_salvas):
+            print(f" Snapshot: os templates passaram a usar colunas de '{sheet.title}' que não estão no cache. Ressincronizando a aba inteira...")
+            return sincronizar_aba(sheet, projetar, forcar=True)
+    else:
+        cabecalho_salvo, marca_agua, linhas, colunas = None, 1, [], None
+        if projetar: # Primeira sincronização: o cabeçalho vem antes, para saber quais colunas pedir
+            resposta = sheet.batch_get(["1:1"])[0]
+            colunas = projetar(list(resposta[0]) if resposta else [])
+    blocos = None if colunas is None else _blocos_colunas(colunas)
+
+    # Índice da coluna Status no cabeçalho salvo (se o cabeçalho mudou, a comparação abaixo força o resync)
+    idx_status = next((i for i, h in enumerate(cabecalho_salvo or []) if str(h).strip() == STATUS_COL), None)
+    intervalos = ["1:1"]
+    if marca_agua >= 2:
+        intervalos.append(f"{marca_agua}:{marca_agua}") # Linha de conferência
+        if idx_status is not None:
+            coluna = _letra_coluna(idx_status)
+            intervalos.append(f"{coluna}2:{coluna}{marca_agua}")
+    qtd_fixos = len(intervalos)
+    buscar_novas = marca_agua < sheet.row_count
+    if buscar_novas: intervalos.extend(_intervalos_linhas(blocos, marca_agua + 1, sheet.row_count))
+
+    respostas = sheet.batch_get(intervalos) # Uma única requisição
+    cabecalho = list(respostas[0][0]) if respostas[0] else []
+    if snapshot:
+        if cabecalho != cabecalho_salvo:
+            print(f" Snapshot: cabeçalho de '{sheet.title}' mudou. Ressincronizando a aba inteira...")
+            return sincronizar_aba(sheet, projetar, forcar=True)
+        if marca_agua >= 2:
+            conferencia = list(respostas[1][0]) if respostas[1] else []
+            salva = linhas[marca_agua - 2]
+            # O Status fica de fora: editá-lo na planilha não é exclusão/inserção e ele é atualizado logo abaixo
+            indices = range(max(len(conferencia), len(salva))) if colunas is None else colunas
+            iguais = all(_celula(conferencia, i) == _celula(salva, i) for i in indices if i != idx_status)
+            if not iguais:
+                print(f" Snapshot: linhas de '{sheet.title}' foram excluídas/inseridas fora do app. Ressincronizando a aba inteira...")
+                return sincronizar_aba(sheet, projetar, forcar=True)
+
+    # Atualiza o Status das linhas já conhecidas (pode ter sido editado direto na planilha)
+    alteradas = set()
+    if snapshot and marca_agua >= 2 and idx_status is not None:
+        coluna_status = respostas[2]
+        for i, linha in enumerate(linhas):
+            valor = coluna_status[i][0] if i < len(coluna_status) and coluna_status[i] else ""
+            if valor != _celula(linha, idx_status):
+                linha.extend([""] * (idx_status + 1 - len(linha)))
+                linha[idx_status] = valor
+                alteradas.add(i)
+    status_atualizados = len(alteradas)
+
+    novas = _montar_linhas(blocos, respostas[qtd_fixos:]) if buscar_novas else []
+    alteradas.update(range(len(linhas), len(linhas) + len(novas)))
+    linhas.extend(novas)
+    marca_agua += len(novas)
+
+    if USAR_SNAPSHOT:
+        _gravar_snapshot(chave, cabecalho, marca_agua, linhas, colunas, alteradas if snapshot else None)
+    projecao = f" ({len(colunas)} de {len(cabecalho)} colunas)" if colunas is not None else ""
+    if snapshot:
+        print(f" Snapshot: {len(linhas) - len(novas)} linha(s) em cache, {len(novas)} nova(s){projecao}, {status_atualizados} status atualizado(s).")
+    else:
+        print(f" Snapshot: aba '{sheet.title}' baixada por completo ({len(linhas)} linha(s){projecao}).")
+    return cabecalho, linhas
+
+def snapshot_aplicar_celulas(sheet, celulas):
+    """Aplica no snapshot células já gravadas na planilha ({(linha, coluna): valor})."""
+    if not USAR_SNAPSHOT: return
+    chave = _chave_snapshot(sheet)
+    snapshot = _ler_snapshot(chave)
+    if not snapshot: return
+    cabecalho, marca_agua, linhas, colunas = snapshot
+    alteradas = set()
+    for (linha, coluna), valor in celulas.items():
+        if not 2 <= linha <= marca_agua: continue
+        valores = linhas[linha - 2]
+        valores.extend([""] * (coluna - len(valores)))
+        valores[coluna - 1] = str(valor)
+        alteradas.add(linha - 2)
+    if alteradas: _gravar_snapshot(chave, cabecalho, marca_agua, linhas, colunas, alteradas)
+
+def snapshot_remover_linhas(sheet, linhas_excluidas):
+    """Remove do snapshot linhas já excluídas da planilha, deslocando as seguintes (como a planilha faz)."""
+    if not USAR_SNAPSHOT: return
+    chave = _chave_snapshot(sheet)
+    snapshot = _ler_snapshot(chave)
+    if not snapshot: return
+    cabecalho, marca_agua, linhas, colunas = snapshot
+    excluidas = {linha for linha in linhas_excluidas if 2 <= linha <= marca_agua}
+    linhas = [valores for i, valores in enumerate(linhas) if i + 2 not in excluidas]
+    _gravar_snapshot(chave, cabecalho, marca_agua - len(excluidas), linhas, colunas)
+
+# ==============================================================================
+# 5.3 BUFFER DE ESCRITA (células agrupadas em intervalos, poucas chamadas values.batchUpdate)
+# ==============================================================================
+# Pré-preenchimento e status geram uma gravação por célula. O buffer junta as células de todas as fontes (seção 5.8)
+# e cada classe de fonte envia as suas de uma vez: no Google Sheets, as vizinhas são agrupadas em retângulos (trechos
+# de linha e, depois, trechos iguais em linhas seguidas) e vai uma única values.batchUpdate por planilha, dividida só
+# quando o corpo passaria de LIMITE_BYTES_REQUISICAO; num arquivo local, uma gravação por arquivo.
+LIMITE_BYTES_REQUISICAO = 2_000_000 # Tamanho máximo (estimado) do corpo de cada values.batchUpdate
+
+def coalescer_celulas(celulas):
+    """Agrupa células {(linha, coluna): valor} em retângulos. Retorna [(linha, coluna, matriz de valores)]."""
+    por_linha = {}
+    for (linha, coluna), valor in celulas.items(): por_linha.setdefault(linha, {})[coluna] = valor
+    retangulos = []
+    abertos = {} # (coluna inicial, coluna final) -> retângulo que termina na última linha vista com esse trecho
+    for linha in sorted(por_linha):
+        colunas = por_linha[linha]
+        trechos = [] # Colunas consecutivas da linha: [inicial, final]
+        for coluna in sorted(colunas):
+            if trechos and trechos[-1][1] == coluna - 1: trechos[-1][1] = coluna
+            else: trechos.append([coluna, coluna])
+        for inicio, fim in trechos:
+            valores = [colunas[c] for c in range(inicio, fim + 1)]
+            retangulo = abertos.get((inicio, fim))
+            if retangulo and retangulo['ultima_linha'] == linha - 1: # Mesmo trecho na linha de cima: estende para baixo
+                retangulo['ultima_linha'] = linha; retangulo['valores'].append(valores)
+            else:
+                retangulo = {'linha': linha, 'coluna': inicio, 'ultima_linha': linha, 'valores': [valores]}
+                abertos[(inicio, fim)] = retangulo; retangulos.append(retangulo)
+    return [(r['linha'], r['coluna'], r['valores']) for r in retangulos]
+
+class BufferEscrita:
+    """Acumula gravações de células de várias fontes (abas/arquivos) e as envia agrupadas, uma chamada por grupo."""
+    def __init__(self):
+        self._abas = {} # Chave da fonte -> (fonte, {(linha, coluna): valor})
+        self._trava = threading.Lock()
+
+    def adicionar(self, fonte, linha, coluna, valor):
+        """Agenda a gravação de uma célula (1-based); a última gravação da mesma célula prevalece."""
+        with self._trava: # PF e PJ agendam em threads diferentes no carregamento
+            self._abas.setdefault(fonte.chave, (fonte, {}))[1][(linha, coluna)] = valor
+
+    def __len__(self):
+        return sum(len(celulas) for _, celulas in self._abas.values())
+
+    def enviar(self, value_input_option='USER_ENTERED'):
+        """Envia tudo e esvazia o buffer. Retorna o relatório com contagens, erros e as células gravadas por fonte."""
+        relatorio = {'celulas': 0, 'intervalos': 0, 'requisicoes': 0, 'erros': [], 'gravadas': {}}
+        por_classe = {} # Classe da fonte -> [(fonte, células)]; cada classe sabe agrupar as suas (ex.: abas da mesma planilha)
+        for fonte, celulas in self._abas.values(): por_classe.setdefault(type(fonte), []).append((fonte, celulas))
+        self._abas = {}
+        for classe, abas in por_classe.items(): classe.enviar_celulas(abas, value_input_option, relatorio)
+        print(f" Planilhas: {relatorio['celulas']} célula(s) gravada(s) em {relatorio['intervalos']} intervalo(s), {relatorio['requisicoes']} requisição(ões).")
+        return relatorio
+
+def enviar_pre_preenchimento(buffer):
+    """Envia o buffer do pré-preenchimento (PF e PJ juntos), avisa sobre falhas e confirma o estado incremental (seção 4.1)."""
+    if not len(buffer):
+        confirmar_estados_pre_preenchimento(True); return
+    print(f"\n--- Enviando pré-preenchimento ({len(buffer)} célula(s)) ---")
+    relatorio = buffer.enviar()
+    if relatorio['erros']:
+        notificar('erro', "Erro API Google (Pré-preenchimento)", "Falha ao salvar pré-preenchimento:\n" + "\n".join(relatorio['erros']))
+    else:
+        print(" Pré-preenchimento salvo com sucesso na planilha!")
+    confirmar_estados_pre_preenchimento(not relatorio['erros'])
+
+# ==============================================================================
+# 5.4 AGENDADOR DAS CHAMADAS À API (cota por classe, retry com backoff)
+# ==============================================================================
+# Toda requisição HTTP do gspread passa por ClienteHTTPAgendado (classe_cliente_http) -> agendador_api.executar: um balde de tokens por
+# classe de cota (leitura/escrita, como as cotas por minuto da Sheets API) segura o ritmo antes de estourar a cota,
+# e respostas 429/5xx/timeout são repetidas com backoff exponencial com jitter, respeitando o Retry-After.
+# Só chamadas idempotentes são repetidas depois de um 5xx/timeout: a batchUpdate estrutural da planilha (exclusão de
+# linhas, criação de aba, cópia para a aba de excluídos) pode já ter sido aplicada, e repeti-la excluiria as N linhas
+# seguintes. Nela, só 429/403 de cota (recusada antes de aplicar) e erros de conexão antes do envio são repetidos.
+COTAS_API = {'leitura': (60, 60.0), 'escrita': (60, 60.0)} # Classe -> (requisições, por N segundos), cota padrão por usuário
+MAX_TENTATIVAS_API = 6     # Tentativas por chamada (a primeira + retentativas)
+BACKOFF_BASE_S = 1.0       # Espera base do backoff, dobrada a cada retentativa
+BACKOFF_MAX_S = 64.0       # Teto da espera entre tentativas
+CODIGOS_RETENTAVEIS = {408, 429, 500, 502, 503, 504}
+
+class BaldeTokens:
+    """Limite de taxa (token bucket): até `capacidade` chamadas seguidas, repostas à razão capacidade/periodo_s."""
+    def __init__(self, capacidade, periodo_s, relogio=time.monotonic):
+        self.capacidade = capacidade
+        self.taxa = capacidade / periodo_s
+        self.tokens = float(capacidade)
+        self.relogio = relogio
+        self.ultimo = relogio()
+        self.trava = threading.Lock()
+
+    def reservar(self):
+        """Reserva um token e retorna quantos segundos esperar até poder usá-lo (0 se já disponível)."""
+        with self.trava:
+            agora = self.relogio()
+            self.tokens = min(self.capacidade, self.tokens + (agora - self.ultimo) * self.taxa)
+            self.ultimo = agora
+            self.tokens -= 1 # Pode ficar negativo: as próximas reservas esperam na fila, na ordem de chegada
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.taxa
+
+def _segundos_retry_after(resposta):
+    """Lê o cabeçalho Retry-After (segundos ou data HTTP) de uma resposta; None se ausente/inválido."""
+    valor = getattr(resposta, 'headers', {}).get('Retry-After') if resposta is not None else None
+    if not valor: return None
+    try:
+        return max(0.0, float(valor))
+    except ValueError:
+        from email.utils import parsedate_to_datetime
+        try:
+            return max(0.0, parsedate_to_datetime(valor).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+def _erro_retentavel(erro, idempotente=True):
+    """Indica se o erro é temporário (cota, timeout, erro do servidor) e vale repetir a chamada.
+
+    Chamada não idempotente: só erros em que a requisição com certeza não foi aplicada (cota; conexão não aberta).
+    """
+    import requests
+    if isinstance(erro, (requests.exceptions.ConnectTimeout, requests.exceptions.ProxyError)): return True # Nada foi enviado
+    if isinstance(erro, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)): return idempotente
+    if not isinstance(erro, gspread.exceptions.APIError): return False
+    codigo = getattr(erro.response, 'status_code', None) or erro.code
+    if codigo == 429: return True
+    if codigo in CODIGOS_RETENTAVEIS: return idempotente
+    motivos = [e.get('domain', '') + '/' + e.get('reason', '') for e in erro.error.get('errors', [])] # Drive API: cota vem como 403
+    return codigo == 403 and any('usageLimits' in m or 'rateLimitExceeded' in m for m in motivos)
+
+class AgendadorAPI:
+    """Ponto único das chamadas ao Google: limite por classe de cota, retentativas e contadores."""
+    def __init__(self, cotas=None, max_tentativas=None, relogio=time.monotonic, dormir=time.sleep, aleatorio=None):
+        import random
+        cotas = cotas or COTAS_API
+        self.baldes = {classe: BaldeTokens(n, periodo, relogio) for classe, (n, periodo) in cotas.items()}
+        self.max_tentativas = max_tentativas or MAX_TENTATIVAS_API
+        self.dormir = dormir
+        self.aleatorio = aleatorio or random.random
+        self.trava = threading.Lock()
+        self.contadores = {classe: {'chamadas': 0, 'retentativas': 0, 'falhas': 0, 'espera_cota_s': 0.0, 'espera_backoff_s': 0.0}
+                           for classe in cotas}
+
+    @staticmethod
+    def classificar(metodo, endpoint):
+        """Classe de cota da requisição: GET lê; POST/PUT/DELETE escrevem."""
+        return 'leitura' if metodo.upper() == 'GET' else 'escrita'
+
+    @staticmethod
+    def idempotente(metodo, endpoint):
+        """Repetir a requisição dá o mesmo resultado? Leituras e gravação de valores em intervalos fixos, sim; a
+        batchUpdate estrutural da planilha (':batchUpdate' fora de values) e os demais POST, não."""
+        if metodo.upper() in ('GET', 'PUT', 'DELETE'): return True
+        caminho = str(endpoint).split('?', 1)[0]
+        return caminho.endswith(('values:batchUpdate', 'values:batchGet', 'values:batchClear', 'values:batchGetByDataFilter'))
+
+    def _contar(self, classe, campo, valor=1):
+        with self.trava: self.contadores[classe][campo] += valor
+
+    def executar(self, classe, chamada, idempotente=True):
+        """Executa `chamada()` respeitando a cota da classe e repetindo erros temporários (ver _erro_retentavel)."""
+        for tentativa in range(self.max_tentativas):
+            espera = self.baldes[classe].reservar()
+            if espera > 0:
+                self._contar(classe, 'espera_cota_s', espera); self.dormir(espera)
+            self._contar(classe, 'chamadas')
+            try:
+                with medir(f'api.{classe}', 'debug', tentativa=tentativa + 1):
+                    return chamada()
+            except Exception as e:
+                if not _erro_retentavel(e, idempotente) or tentativa == self.max_tentativas - 1:
+                    self._contar(classe, 'falhas'); contar('api.falhas'); raise
+                teto = min(BACKOFF_MAX_S, BACKOFF_BASE_S * 2 ** tentativa)
+                espera = teto / 2 + self.aleatorio() * teto / 2 # Backoff exponencial com jitter
+                retry_after = _segundos_retry_after(getattr(e, 'response', None))
+                if retry_after is not None: espera = max(espera, retry_after)
+                print(f" API Google ({classe}): {type(e).__name__} {getattr(e, 'code', '')} - nova tentativa em {espera:.1f}s ({tentativa + 2}/{self.max_tentativas})")
+                self._contar(classe, 'retentativas'); self._contar(classe, 'espera_backoff_s', espera)
+                contar('api.retentativas')
+                _emitir_evento('aviso', 'retentativa', classe=classe, erro=type(e).__name__, codigo=getattr(e, 'code', None),
+                               tentativa=tentativa + 2, espera_s=round(espera, 2))
+                self.dormir(espera)
+
+    def resumo(self):
+        """Cópia dos contadores, com as esperas arredondadas (para logs e o resumo JSON da linha de comando)."""
+        with self.trava:
+            return {classe: {k: round(v, 2) if isinstance(v, float) else v for k, v in c.items()} for classe, c in self.contadores.items()}
+
+agendador_api = AgendadorAPI()
+
+@functools.cache
+def classe_cliente_http():
+    """Classe ClienteHTTPAgendado, criada no primeiro uso porque herda do gspread (importado só ao autenticar)."""
+    class ClienteHTTPAgendado(gspread.http_client.HTTPClient):
+        """HTTPClient do gspread que passa cada requisição pelo agendador_api."""
+        def request(self, method, endpoint, *args, **kwargs):
+            requisitar = super(ClienteHTTPAgendado, self).request
+            return agendador_api.executar(agendador_api.classificar(method, endpoint), lambda: requisitar(method, endpoint, *args, **kwargs),
+                                          agendador_api.idempotente(method, endpoint))
+    return ClienteHTTPAgendado
+
+# ==============================================================================
+# 5.5 CACHE DE METADADOS (chave da planilha, ID da aba e token de acesso)
+# ==============================================================================
+# Abrir pelo título custa uma busca no Drive (files.list) a cada execução, e cada execução gerava um token novo.
+# Guardamos a chave da planilha e o ID da aba já resolvidos: na próxima vez, uma única leitura de metadados abre
+# planilha e aba. Com REAPROVEITAR_TOKEN, o token de acesso (válido por ~1 h) também é guardado e reaproveitado enquanto
+# não estiver perto de expirar; ele fica em texto puro no arquivo (só o dono lê no Linux/macOS; no Windows valem as
+# permissões da pasta), por isso vem desligado.
+# Os cabeçalhos ficam no snapshot das respostas (seção 5.2). Se a chave salva não for encontrada, voltamos à busca por título.
+ARQUIVO_METADADOS = "metadados.json" # Em PASTA_CACHE
+USAR_CACHE_METADADOS = True
+REAPROVEITAR_TOKEN = False # True = guarda o token de acesso em metadados.json e o reaproveita nas próximas execuções
+MARGEM_TOKEN_S = 300 # Token com menos que isso de validade não é reaproveitado
+
+_metadados = None
+_trava_metadados = threading.Lock() # PF e PJ são abertos em threads paralelas
+
+def _caminho_metadados():
+    return Path(PASTA_CACHE) / ARQUIVO_METADADOS
+
+def _ler_metadados():
+    """Metadados salvos (carregados uma vez por processo); arquivo ausente ou corrompido = cache vazio."""
+    global _metadados
+    if _metadados is None:
+        try:
+            _metadados = json.loads(_caminho_metadados().read_text(encoding='utf-8'))
+        except (OSError, ValueError):
+            _metadados = {}
+        _metadados.setdefault('planilhas', {})
+    return _metadados
+
+def _salvar_metadados():
+    """Grava os metadados (só o dono do arquivo lê, no Linux/macOS: pode conter o token de acesso)."""
+    if not USAR_CACHE_METADADOS: return
+    try:
+        Path(PASTA_CACHE).mkdir(parents=True, exist_ok=True)
+        caminho_tmp = _caminho_metadados().with_suffix('.tmp')
+        # Tudo sob a trava: PF e PJ gravam ao mesmo tempo na primeira execução, e o temporário é um só
+        with _trava_metadados:
+            conteudo = json.dumps(_ler_metadados(), ensure_ascii=False, indent=1)
+            descritor = os.open(caminho_tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(descritor, 'w', encoding='utf-8') as arquivo: arquivo.write(conteudo)
+            os.replace(caminho_tmp, _caminho_metadados())
+    except OSError as e:
+        print(f" Aviso: não foi possível salvar o cache de metadados: {e}")
+
+def reaproveitar_token(credenciais):
+    """Se houver token salvo da mesma conta de serviço e ainda válido, usa-o (evita gerar um novo na primeira chamada)."""
+    if not USAR_CACHE_METADADOS or not REAPROVEITAR_TOKEN: return False
+    with _trava_metadados:
+        salvo = _ler_metadados().get('token') or {}
+    if salvo.get('conta') != credenciais.service_account_email or not salvo.get('token'): return False
+    try:
+        expira = datetime.datetime.fromisoformat(salvo['expira']) # UTC sem fuso, como o google-auth usa
+    except (KeyError, TypeError, ValueError):
+        return False
+    agora = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+    if expira - agora < datetime.timedelta(seconds=MARGEM_TOKEN_S): return False
+    credenciais.token, credenciais.expiry = salvo['token'], expira
+    print(f" Token de acesso reaproveitado (expira às {expira:%H:%M} UTC).")
+    return True
+
+def salvar_token(gc):
+    """Guarda o token atual do cliente (se já houver um) para as próximas execuções."""
+    if USAR_CACHE_METADADOS and not REAPROVEITAR_TOKEN:
+        with _trava_metadados:
+            descartado = _ler_metadados().pop('token', None) # Salvo por uma versão anterior ou com a opção ligada
+        if descartado: _salvar_metadados()
+        return
+    credenciais = getattr(getattr(gc, 'http_client', None), 'auth', None)
+    if not USAR_CACHE_METADADOS or not getattr(credenciais, 'token', None) or not getattr(credenciais, 'expiry', None): return
+    with _trava_metadados:
+        _ler_metadados()['token'] = {'conta': credenciais.service_account_email, 'token': credenciais.token,
+                                     'expira': credenciais.expiry.isoformat()}
+    _salvar_metadados()
+
+@functools.cache
+def _classe_planilha_com_abas():
+    """Classe _PlanilhaComAbas, criada no primeiro uso (herda do gspread)."""
+    class _PlanilhaComAbas(gspread.spreadsheet.Spreadsheet):
+        """Spreadsheet que guarda as abas da leitura de metadados feita ao abrir, para achar a aba sem outra requisição."""
+        def fetch_sheet_metadata(self, params=None):
+            metadados = super().fetch_sheet_metadata(params)
+            self.abas_metadados = metadados.get('sheets', [])
+            return metadados
+    return _PlanilhaComAbas
+
+def _abrir_pela_chave(gc, chave, id_aba):
+    """Abre planilha e aba pelos IDs salvos (uma requisição). Levanta SpreadsheetNotFound/WorksheetNotFound se não existirem mais."""
+    try:
+        workbook = _classe_planilha_com_abas()(gc.http_client, {"id": chave})
+    except gspread.exceptions.APIError as e:
+        if getattr(e.response, 'status_code', None) in (403, 404): raise gspread.exceptions.SpreadsheetNotFound(e.response) from e
+        raise
+    for aba in workbook.abas_metadados:
+        if aba['properties']['sheetId'] == id_aba:
+            return gspread.worksheet.Worksheet(workbook, aba['properties'], workbook.id, gc.http_client)
+    raise gspread.exceptions.WorksheetNotFound(id_aba)
+
+def abrir_aba(gc, filename, tab_name):
+    """Abre a aba pela chave/ID salvos; se não houver cache ou eles não existirem mais, busca pelo título e atualiza o cache."""
+    with _trava_metadados:
+        salvo = _ler_metadados()['planilhas'].get(filename, {}) if USAR_CACHE_METADADOS else {}
+    chave, id_aba = salvo.get('chave'), salvo.get('abas', {}).get(tab_name)
+    if chave and id_aba is not None:
+        try:
+            sheet = _abrir_pela_chave(gc, chave, id_aba)
+            if sheet.title == tab_name: return sheet
+            print(f" Cache de metadados: aba {id_aba} agora se chama '{sheet.title}'. Buscando '{tab_name}' pelo título...")
+        except (gspread.exceptions.SpreadsheetNotFound, gspread.exceptions.WorksheetNotFound):
+            print(f" Cache de metadados: '{filename}' / '{tab_name}' não encontrada pela chave salva. Buscando pelo título...")
+
+    workbook = gc.open(filename) # Busca no Drive pelo título
+    print(f"Tentando acessar aba: '{tab_name}'")
+    sheet = workbook.worksheet(tab_name)
+    if USAR_CACHE_METADADOS:
+        with _trava_metadados:
+            entrada = _ler_metadados()['planilhas'].get(filename, {})
+            abas = entrada.get('abas', {}) if entrada.get('chave') == workbook.id else {} # Planilha recriada: IDs antigos não valem
+            _ler_metadados()['planilhas'][filename] = {'chave': workbook.id, 'abas': {**abas, tab_name: sheet.id}}
+        _salvar_metadados()
+    return sheet
+
+# ==============================================================================
+# 5.6 MANIFESTO DA GERAÇÃO (pula documentos cujas entradas não mudaram)
+# ==============================================================================
+# Para cada arquivo gerado, o manifesto em PASTA_SAIDA guarda o hash das entradas: bytes do template, motor e
+# dicionário de placeholders do registro. Se o hash é o mesmo e o arquivo continua lá com o mesmo tamanho, a
+# geração é pulada (ex.: rodar de novo depois de uma falha parcial). --force (FORCAR_GERACAO) ignora o manifesto.
+ARQUIVO_MANIFESTO = "manifesto.json"
+USAR_MANIFESTO = True
+FORCAR_GERACAO = False
+_manifesto = {} # Caminho relativo a PASTA_SAIDA -> {'hash', 'tamanho', 'nao_resolvidos'}
+_hashes_templates = {} # Caminho absoluto -> (assinatura, sha256 dos bytes)
+
+def _caminho_manifesto():
+    return Path(PASTA_SAIDA) / ARQUIVO_MANIFESTO
+
+def carregar_manifesto():
+    """Lê o manifesto da pasta de saída; arquivo ausente ou corrompido = manifesto vazio (tudo é gerado)."""
+    global _manifesto
+    try:
+        _manifesto = json.loads(_caminho_manifesto().read_text(encoding='utf-8'))['arquivos']
+    except (OSError, ValueError, KeyError, TypeError):
+        _manifesto = {}
+    return _manifesto
+
+def salvar_manifesto():
+    """Grava o manifesto (arquivo temporário + replace, para não deixar um JSON pela metade)."""
+    try:
+        caminho_tmp = _caminho_manifesto().with_suffix('.tmp')
+        caminho_tmp.write_text(json.dumps({'versao': 1, 'arquivos': _manifesto}, ensure_ascii=False), encoding='utf-8')
+        os.replace(caminho_tmp, _caminho_manifesto())
+    except OSError as e:
+        print(f" Aviso: não foi possível salvar o manifesto da geração: {e}")
+
+def _hash_template(caminho):
+    """sha256 dos bytes do template, recalculado só quando o arquivo muda (mtime/tamanho)."""
+    chave = str(Path(caminho).resolve())
+    assinatura = _assinatura_arquivo(caminho)
+    anterior = _hashes_templates.get(chave)
+    if anterior is None or anterior[0] != assinatura:
+        anterior = _hashes_templates[chave] = (assinatura, hashlib.sha256(Path(caminho).read_bytes()).hexdigest())
+    return anterior[1]
+
+def hash_placeholders(placeholders):
+    """Hash estável do dicionário de placeholders de um registro, sem o {STATUS} (a própria geração o altera para GERADO)."""
+    dados = {chave: valor for chave, valor in placeholders.items() if chave != f"{{{STATUS_COL.upper()}}}"}
+    return hashlib.sha256(json.dumps(dados, sort_keys=True, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+def hash_entradas(template_path, motor, hash_dados):
+    """Hash de tudo que define o conteúdo de um arquivo gerado."""
+    return hashlib.sha256(f"{_hash_template(template_path)}|{motor}|{hash_dados}".encode('ascii')).hexdigest()
+
+def saida_atualizada(relativo, caminho_saida, hash_entrada):
+    """Entrada do manifesto se o arquivo já foi gerado com essas entradas e ainda existe; senão None."""
+    if FORCAR_GERACAO or not USAR_MANIFESTO: return None
+    entrada = _manifesto.get(relativo)
+    if not entrada or entrada.get('hash') != hash_entrada: return None
+    try:
+        if caminho_saida.stat().st_size != entrada.get('tamanho'): return None # Arquivo truncado/substituído
+    except OSError:
+        return None # Apagado da pasta de saída
+    return entrada
 
+def registrar_saida(resultado, relativo, caminho_saida, hash_entrada, nao_resolvidos):
+    """Anota no resultado do registro a entrada de manifesto de um arquivo recém-gerado (o processo principal grava)."""
+    if not USAR_MANIFESTO: return
+    resultado['manifesto'][relativo] = {'hash': hash_entrada, 'tamanho': caminho_saida.stat().st_size,
+                                        'nao_resolvidos': sorted(nao_resolvidos)}
+
+# ==============================================================================
+# 5.7 DIÁRIO DO LOTE (write-ahead em disco, status enviado em blocos, retomada)
+# ==============================================================================
+# Cada geração grava um diário em PASTA_CACHE, uma linha JSON por evento, com fsync antes de seguir:
+#   'inicio' (registros do lote), 'registro' (documentos prontos, antes de agendar o status), 'status' (GERADO gravado).
+# O status é enviado em blocos (a cada STATUS_LOTE_REGISTROS registros ou STATUS_LOTE_SEGUNDOS). O diário é apagado
+# quando todo status agendado foi gravado. Se o processo morrer ou um envio falhar, ele fica: na próxima geração os
+# registros já prontos (mesma linha e mesmos dados) não são gerados de novo e o status pendente deles é reenviado.
+# `generate --resume` (ou a pergunta ao abrir a interface) retoma o lote interrompido inteiro.
+ARQUIVO_DIARIO = "diario_geracao.jsonl"
+USAR_DIARIO = True
+STATUS_LOTE_REGISTROS = 50   # Envia o status a cada N registros concluídos...
+STATUS_LOTE_SEGUNDOS = 30.0  # ...ou quando o bloco mais antigo pendente tem T segundos
+
+def _caminho_diario():
+    return Path(PASTA_CACHE) / ARQUIVO_DIARIO
+
+def impressao_registro(pessoa):
+    """Hash dos dados do registro (sem Status, tipo e linha): confirma, ao retomar, que a linha ainda é o mesmo registro.
+
+    Os valores entram como texto: a linha é a mesma esteja ela limpa pelo pré-preenchimento ou não (seção 4.1).
+    """
+    dados = {str(k): str(v).strip() if v is not None else "" for k, v in pessoa.items() if k not in (STATUS_COL, 'tipo', 'linha')}
+    return hashlib.sha256(json.dumps(dados, sort_keys=True, ensure_ascii=False, default=str).encode('utf-8')).hexdigest()
+
+def ler_diario():
+    """Diário de um lote interrompido, ou None se não houver.
+
+    Retorna {'registros': [(tipo, linha, impressão)], 'concluidos': {(tipo, linha): evento 'registro'},
+    'status_gravados': set((tipo, linha))}.
+    """
+    if not USAR_DIARIO: return None
+    try:
+        linhas = _caminho_diario().read_text(encoding='utf-8').splitlines()
+    except OSError:
+        return None
+    diario = {'registros': [], 'concluidos': {}, 'status_gravados': set()}
+    for texto in linhas:
+        try:
+            evento = json.loads(texto)
+        except ValueError:
+            continue # Última linha cortada pela queda do processo
+        if evento.get('evento') == 'inicio': diario['registros'] = [tuple(r) for r in evento['registros']]
+        elif evento.get('evento') == 'registro': diario['concluidos'][(evento['tipo'], evento['linha'])] = evento
+        elif evento.get('evento') == 'status': diario['status_gravados'].update(tuple(c) for c in evento['chaves'])
+    return diario
+
+def registros_do_diario(diario, registros_sessao):
+    """Registros do lote do diário que ainda não terminaram (sem status gravado), se a linha ainda tem os mesmos dados."""
+    por_chave = {(p.get('tipo'), p.get('linha')): p for p in registros_sessao}
+    encontrados = []
+    for tipo, linha, impressao in diario['registros']:
+        if (tipo, linha) in diario['status_gravados']: continue
+        pessoa = por_chave.get((tipo, linha))
+        if pessoa is not None and impressao_registro(pessoa) == impressao: encontrados.append(pessoa)
+        else: print(f" Aviso: {tipo} L{linha} do lote interrompido mudou ou não existe mais na planilha; não será retomado.")
+    return encontrados
+
+class DiarioLote:
+    """Diário do lote em andamento: cada evento é gravado e sincronizado no disco antes de o lote seguir."""
+    def __init__(self, registros, herdados):
+        """Começa um diário novo com os registros do lote e os eventos 'registro' (ainda sem status) herdados do anterior."""
+        Path(PASTA_CACHE).mkdir(parents=True, exist_ok=True)
+        caminho_tmp = _caminho_diario().with_suffix('.tmp')
+        self._arquivo = open(caminho_tmp, 'w', encoding='utf-8')
+        self.gravar('inicio', registros=[[p.get('tipo'), p.get('linha'), impressao_registro(p)] for p in registros])
+        for evento in herdados: self.gravar(**evento)
+        self._arquivo.close()
+        os.replace(caminho_tmp, _caminho_diario()) # O diário anterior só some depois que o novo já tem o que herdou dele
+        self._arquivo = open(_caminho_diario(), 'a', encoding='utf-8')
+
+    def gravar(self, evento, **campos):
+        self._arquivo.write(json.dumps({'evento': evento, **campos}, ensure_ascii=False) + "\n")
+        self._arquivo.flush()
+        os.fsync(self._arquivo.fileno())
+
+    def fechar(self, concluido):
+        """Fecha o diário; se todo status foi gravado, apaga (não há o que retomar)."""
+        self._arquivo.close()
+        if concluido: _caminho_diario().unlink(missing_ok=True)
+
+# ==============================================================================
+# 5.8 FONTES DE REGISTROS (Google Sheets, CSV, XLSX, SQLite)
+# ==============================================================================
+# Tudo o que o app faz com uma aba de respostas passa por uma "fonte":
+#   title                         nome para mensagens
+#   chave                         identifica a fonte no BufferEscrita
+#   ler(projetar=None)            -> (cabeçalho, linhas) brutos, como texto (linha 1 da tabela = cabeçalho)
+#   ler_linhas(linhas)            -> {linha: valores brutos} das linhas inteiras (todas as colunas, mesmo com projeção)
+#   gravar_celulas(celulas)       grava {(linha, coluna): valor} (1-based) de uma vez; marcar status é gravar a célula da coluna Status
+#   excluir_linhas(linhas)        exclui as linhas (1-based); as seguintes sobem, como na planilha
+#   arquivar_linhas(linhas)       idem, mas antes as copia para a aba/tabela de excluídos (MODO_EXCLUSAO = "arquivar")
+#   enviar_celulas(abas, ...)     (classmethod) envio de várias fontes da mesma classe, usado pelo BufferEscrita
+# FonteGoogleSheets é o caminho de sempre (snapshot, values.batchUpdate, deleteDimension). As fontes locais
+# servem para lotes grandes de dados que já temos em disco, sem latência nem cota da API: o tipo (PF/PJ)
+# com um arquivo em FONTES_LOCAIS é lido e atualizado nesse arquivo; os demais continuam no Google Sheets.
+FONTES_LOCAIS = {} # Tipo ('PF'/'PJ') -> "arquivo.csv" | "arquivo.xlsx[#aba]" | "arquivo.sqlite3[#tabela]" (--source PF=arquivo)
+FORMATO_DATA_LOCAL = "%d/%m/%Y %H:%M:%S" # Datas de XLSX/SQLite viram texto como o carimbo de data/hora do Forms
+MODO_EXCLUSAO = "excluir" # "excluir" | "arquivar" (delete --soft): move as linhas para a aba/tabela de excluídos
+SUFIXO_ARQUIVO_EXCLUIDOS = " (excluídos)" # Aba "<aba> (excluídos)"; no CSV, arquivo "<nome> (excluídos).csv"
+LIMITE_INTERVALOS_LEITURA = 100 # Intervalos por values.batchGet em ler_linhas (vão na URL da requisição)
+
+class FonteGoogleSheets:
+    """Aba do Google Sheets (gspread): leitura pelo snapshot local, escrita agrupada por planilha, exclusão por deleteDimension."""
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+        self.title = worksheet.title
+        self.chave = _chave_snapshot(worksheet)
+
+    def ler(self, projetar=None):
+        return sincronizar_aba(self.worksheet, projetar)
+
+    def ler_linhas(self, linhas):
+        """Linhas inteiras direto da planilha (sem o snapshot); linhas seguidas vão num só intervalo."""
+        faixas = list(reversed(_faixas_decrescentes(sorted(set(linhas), reverse=True))))
+        resultado = {}
+        for i in range(0, len(faixas), LIMITE_INTERVALOS_LEITURA):
+            lote = faixas[i:i + LIMITE_INTERVALOS_LEITURA]
+            respostas = self.worksheet.batch_get([f"{inicio}:{inicio + quantidade - 1}" for inicio, quantidade in lote])
+            for (inicio, quantidade), valores in zip(lote, respostas):
+                for k in range(quantidade): resultado[inicio + k] = list(valores[k]) if k < len(valores) else []
+        contar('planilha.linhas_completas', len(resultado))
+        return resultado
+
+    def gravar_celulas(self, celulas, value_input_option='USER_ENTERED'):
+        relatorio = {'celulas': 0, 'intervalos': 0, 'requisicoes': 0, 'erros': [], 'gravadas': {}}
+        self.enviar_celulas([(self, celulas)], value_input_option, relatorio)
+        if relatorio['erros']: raise RuntimeError("\n".join(relatorio['erros']))
+
+    def _exclusoes(self, faixas):
+        # Uma deleteDimension por trecho contíguo, de baixo para cima: os índices dos trechos seguintes continuam válidos
+        return [{'deleteDimension': {'range': {'sheetId': self.worksheet.id, 'dimension': 'ROWS', 'startIndex': inicio - 1, 'endIndex': inicio - 1 + quantidade}}}
+                for inicio, quantidade in faixas]
+
+    @staticmethod
+    def _copiar_linhas(sheet_origem, inicio, quantidade, sheet_destino, destino):
+        """copyPaste de linhas inteiras (todas as colunas, inclusive as não baixadas pela projeção), com valores e formatação."""
+        return {'copyPaste': {'source': {'sheetId': sheet_origem, 'startRowIndex': inicio - 1, 'endRowIndex': inicio - 1 + quantidade},
+                              'destination': {'sheetId': sheet_destino, 'startRowIndex': destino - 1, 'endRowIndex': destino - 1 + quantidade},
+                              'pasteType': 'PASTE_NORMAL'}}
+
+    def excluir_linhas(self, linhas):
+        faixas = _faixas_decrescentes(sorted(set(linhas), reverse=True))
+        self.worksheet.spreadsheet.batch_update({'requests': self._exclusoes(faixas)}) # Exclusão é feita no spreadsheet, não no worksheet
+        contar('planilha.faixas_excluidas', len(faixas))
+        snapshot_remover_linhas(self.worksheet, linhas)
+
+    def _id_aba_excluidos(self):
+        """sheetId fixo da aba de excluídos desta aba, para criá-la e copiar para ela na mesma batchUpdate."""
+        return int(hashlib.sha1(f"{self.worksheet.spreadsheet.id}/{self.worksheet.id}{SUFIXO_ARQUIVO_EXCLUIDOS}".encode('utf-8')).hexdigest()[:7], 16)
+
+    def arquivar_linhas(self, linhas):
+        """Move as linhas para a aba de excluídos (criada na primeira vez, com o cabeçalho) e as exclui daqui, numa única batchUpdate."""
+        planilha = self.worksheet.spreadsheet
+        nome_arquivo = self.title + SUFIXO_ARQUIVO_EXCLUIDOS
+        faixas = _faixas_decrescentes(sorted(set(linhas), reverse=True))
+        try:
+            arquivo = planilha.worksheet(nome_arquivo)
+        except gspread.exceptions.WorksheetNotFound:
+            arquivo = None
+        if arquivo is None:
+            # addSheet vai na mesma batchUpdate (com sheetId escolhido aqui, para as cópias apontarem para ela): se algo
+            # falhar, a API não aplica nada e não sobra uma aba de excluídos sem cabeçalho
+            id_arquivo, destino = self._id_aba_excluidos(), 2
+            requests = [{'addSheet': {'properties': {'sheetId': id_arquivo, 'title': nome_arquivo, 'gridProperties':
+                                                      {'rowCount': 1 + len(set(linhas)), 'columnCount': self.worksheet.col_count}}}},
+                        self._copiar_linhas(self.worksheet.id, 1, 1, id_arquivo, 1)] # Cabeçalho
+        else:
+            id_arquivo, destino = arquivo.id, arquivo.row_count + 1 # As linhas vão para o fim da aba de excluídos, na ordem da planilha
+            requests = [{'appendDimension': {'sheetId': arquivo.id, 'dimension': 'ROWS', 'length': len(set(linhas))}}]
+            if arquivo.col_count < self.worksheet.col_count: # Colunas novas na aba de respostas
+                requests.append({'appendDimension': {'sheetId': arquivo.id, 'dimension': 'COLUMNS', 'length': self.worksheet.col_count - arquivo.col_count}})
+        for inicio, quantidade in reversed(faixas):
+            requests.append(self._copiar_linhas(self.worksheet.id, inicio, quantidade, id_arquivo, destino))
+            destino += quantidade
+        planilha.batch_update({'requests': requests + self._exclusoes(faixas)}) # Cópia e exclusão juntas: ou tudo, ou nada
+        contar('planilha.faixas_excluidas', len(faixas))
+        snapshot_remover_linhas(self.worksheet, linhas)
+
+    @classmethod
+    def enviar_celulas(cls, abas, value_input_option, relatorio):
+        """Uma values.batchUpdate por planilha (todas as abas juntas), dividida só acima de LIMITE_BYTES_REQUISICAO."""
+        planilhas = {} # ID da planilha -> (spreadsheet, [(fonte, células)])
+        for fonte, celulas in abas:
+            planilhas.setdefault(fonte.worksheet.spreadsheet.id, (fonte.worksheet.spreadsheet, []))[1].append((fonte, celulas))
+
+        for planilha, abas_planilha in planilhas.values():
+            # Monta os intervalos e os divide em requisições pelo tamanho estimado do corpo
+            lotes = [{'dados': [], 'celulas': [], 'bytes': 0}]
+            for fonte, celulas in abas_planilha:
+                for linha, coluna, valores in coalescer_celulas(celulas):
+                    ultima = gspread.utils.rowcol_to_a1(linha + len(valores) - 1, coluna + len(valores[0]) - 1)
+                    intervalo = {'range': gspread.utils.absolute_range_name(fonte.worksheet.title, f"{gspread.utils.rowcol_to_a1(linha, coluna)}:{ultima}"), 'values': valores}
+                    tamanho = len(json.dumps(intervalo, ensure_ascii=False).encode('utf-8'))
+                    if lotes[-1]['dados'] and lotes[-1]['bytes'] + tamanho > LIMITE_BYTES_REQUISICAO:
+                        lotes.append({'dados': [], 'celulas': [], 'bytes': 0})
+                    lotes[-1]['dados'].append(intervalo); lotes[-1]['bytes'] += tamanho
+                    lotes[-1]['celulas'].append((fonte, linha, coluna, valores))
+
+            gravadas_planilha = {}
+            for lote in lotes:
+                if not lote['dados']: continue
+                qtd_celulas = sum(len(valores) * len(valores[0]) for _, _, _, valores in lote['celulas'])
+                try:
+                    planilha.values_batch_update({'valueInputOption': value_input_option, 'data': lote['dados']})
+                except gspread.exceptions.APIError as e:
+                    msg = f"Erro API Google ao gravar {qtd_celulas} célula(s) em '{planilha.title}': {e}"; print(f"❌ {msg}"); relatorio['erros'].append(msg); continue
+                except Exception as e:
+                    msg = f"Erro inesperado ao gravar {qtd_celulas} célula(s) em '{planilha.title}': {e}"; print(f"❌ {msg}"); relatorio['erros'].append(msg); continue
+                relatorio['requisicoes'] += 1; relatorio['intervalos'] += len(lote['dados']); relatorio['celulas'] += qtd_celulas
+                contar('planilha.requisicoes_escrita'); contar('planilha.celulas_gravadas', qtd_celulas)
+                for fonte, linha, coluna, valores in lote['celulas']:
+                    gravadas = gravadas_planilha.setdefault(fonte, {})
+                    for i, valores_linha in enumerate(valores):
+                        for j, valor in enumerate(valores_linha): gravadas[(linha + i, coluna + j)] = valor
+            for fonte, gravadas in gravadas_planilha.items():
+                snapshot_aplicar_celulas(fonte.worksheet, gravadas)
+                relatorio['gravadas'][fonte] = gravadas
+
+def _texto_celula(valor):
+    """Valor de célula XLSX/SQLite como texto, parecido com o que a API do Sheets devolve."""
+    if valor is None: return ""
+    if isinstance(valor, bool): return "TRUE" if valor else "FALSE"
+    if isinstance(valor, float) and valor.is_integer(): return str(int(valor))
+    if isinstance(valor, datetime.datetime): return valor.strftime(FORMATO_DATA_LOCAL)
+    if isinstance(valor, datetime.date): return valor.strftime(FORMATO_DATA_LOCAL.split()[0])
+    return str(valor)
+
+class FonteLocal:
+    """Base das fontes em arquivo: a tabela fica em memória (linha 1 = cabeçalho) e cada gravação/exclusão é persistida."""
+    def __init__(self, caminho, tabela=None, tabela_padrao=None):
+        self.caminho = Path(caminho)
+        self.tabela = tabela # Escolhida com arquivo#tabela: precisa existir
+        self.tabela_padrao = tabela_padrao # Nome da aba configurada: usada se existir, senão a primeira
+        self.title = f"{self.caminho.name}#{tabela}" if tabela else self.caminho.name
+        self.chave = f"{self.caminho.resolve()}#{tabela or ''}"
+        self._linhas = []
+
+    def ler(self, projetar=None):
+        """Lê o arquivo inteiro (a projeção de colunas só economiza rede, não vale para arquivo local)."""
+        self._linhas = self._ler_arquivo()
+        return (self._linhas[0] if self._linhas else []), self._linhas[1:]
+
+    def ler_linhas(self, linhas):
+        """Linhas da tabela em memória (o arquivo já foi lido inteiro)."""
+        return {linha: list(self._linhas[linha - 1]) if linha <= len(self._linhas) else [] for linha in linhas}
+
+    def gravar_celulas(self, celulas):
+        for (linha, coluna), valor in celulas.items():
+            while len(self._linhas) < linha: self._linhas.append([])
+            destino = self._linhas[linha - 1]
+            if len(destino) < coluna: destino.extend([""] * (coluna - len(destino)))
+            destino[coluna - 1] = "" if valor is None else str(valor)
+        self._persistir_celulas(celulas)
+
+    def excluir_linhas(self, linhas):
+        linhas = sorted(set(linhas), reverse=True)
+        for linha in linhas: del self._linhas[linha - 1]
+        self._persistir_exclusao(linhas)
+
+    def arquivar_linhas(self, linhas):
+        """Copia as linhas para a tabela de excluídos (criada com o cabeçalho na primeira vez) e as exclui daqui."""
+        linhas = sorted(set(linhas), reverse=True)
+        valores = [self._linhas[linha - 1] for linha in reversed(linhas)] # Na ordem da tabela
+        for linha in linhas: del self._linhas[linha - 1]
+        self._persistir_arquivamento(linhas, valores)
+
+    @classmethod
+    def enviar_celulas(cls, abas, value_input_option, relatorio):
+        """Uma gravação por arquivo; o valueInputOption do Sheets não se aplica."""
+        for fonte, celulas in abas:
+            try:
+                fonte.gravar_celulas(celulas)
+            except Exception as e:
+                msg = f"Erro ao gravar {len(celulas)} célula(s) em '{fonte.title}': {type(e).__name__} - {e}"; print(f"❌ {msg}"); relatorio['erros'].append(msg); continue
+            relatorio['requisicoes'] += 1; relatorio['intervalos'] += 1; relatorio['celulas'] += len(celulas)
+            contar('planilha.celulas_gravadas', len(celulas))
+            relatorio['gravadas'][fonte] = dict(celulas)
+
+    def _salvar_atomico(self, escrever):
+        """Grava via arquivo temporário + os.replace: uma queda no meio não deixa o arquivo pela metade."""
+        temporario = self.caminho.with_name(self.caminho.name + ".tmp")
+        escrever(temporario)
+        os.replace(temporario, self.caminho)
+
+class FonteCSV(FonteLocal):
+    """CSV (UTF-8, com ou sem BOM); o separador (',', ';' ou tab) é detectado e mantido ao regravar."""
+    def _ler_arquivo(self):
+        import csv
+        with open(self.caminho, newline='', encoding='utf-8-sig') as arquivo:
+            amostra = arquivo.read(65536); arquivo.seek(0)
+            try: self._dialeto = csv.Sniffer().sniff(amostra, delimiters=",;\t")
+            except csv.Error: self._dialeto = csv.excel
+            return [linha for linha in csv.reader(arquivo, self._dialeto)]
+
+    def _regravar(self):
+        import csv
+        def escrever(temporario):
+            with open(temporario, 'w', newline='', encoding='utf-8') as arquivo:
+                csv.writer(arquivo, delimiter=self._dialeto.delimiter, quotechar=self._dialeto.quotechar or '"',
+                           lineterminator="\r\n").writerows(self._linhas)
+        self._salvar_atomico(escrever)
+
+    def _persistir_celulas(self, celulas): self._regravar()
+    def _persistir_exclusao(self, linhas): self._regravar()
+
+    def _persistir_arquivamento(self, linhas, valores):
+        """Acrescenta as linhas ao CSV de excluídos ao lado do arquivo (antes de regravar este: uma queda no meio duplica, não perde)."""
+        import csv
+        caminho_arquivo = self.caminho.with_name(self.caminho.stem + SUFIXO_ARQUIVO_EXCLUIDOS + self.caminho.suffix)
+        novo = not caminho_arquivo.exists()
+        with open(caminho_arquivo, 'a', newline='', encoding='utf-8') as arquivo:
+            escritor = csv.writer(arquivo, delimiter=self._dialeto.delimiter, quotechar=self._dialeto.quotechar or '"', lineterminator="\r\n")
+            if novo: escritor.writerow(self._linhas[0])
+            escritor.writerows(valores)
+        self._regravar()
+
+class FonteXLSX(FonteLocal):
+    """Aba de uma pasta de trabalho Excel (a de mesmo nome da aba configurada, ou a primeira), editada com openpyxl."""
+    def _ler_arquivo(self):
+        self._workbook = openpyxl.load_workbook(self.caminho)
+        self._aba = self._workbook[_escolher_tabela(self, self._workbook.sheetnames)]
+        linhas = [[_texto_celula(valor) for valor in linha] for linha in self._aba.iter_rows(values_only=True)]
+        while linhas and not any(linhas[-1]): linhas.pop() # Linhas formatadas mas vazias no fim da aba
+        return linhas
+
+    def _persistir_celulas(self, celulas):
+        for (linha, coluna), valor in celulas.items(): self._aba.cell(linha, coluna, valor)
+        self._salvar_atomico(self._workbook.save)
+
+    def _persistir_exclusao(self, linhas):
+        for inicio, quantidade in _faixas_decrescentes(linhas): self._aba.delete_rows(inicio, quantidade)
+        self._salvar_atomico(self._workbook.save)
+
+    def _persistir_arquivamento(self, linhas, valores):
+        nome_arquivo = (self._aba.title + SUFIXO_ARQUIVO_EXCLUIDOS)[:31] # Limite do Excel para nomes de aba
+        if nome_arquivo in self._workbook.sheetnames:
+            arquivo = self._workbook[nome_arquivo]
+        else:
+            arquivo = self._workbook.create_sheet(nome_arquivo)
+            arquivo.append([celula.value for celula in self._aba[1]])
+        for linha in reversed(linhas): arquivo.append([celula.value for celula in self._aba[linha]]) # Valores originais (datas, números)
+        self._persistir_exclusao(linhas) # Um único save para a cópia e a exclusão
+
+def _escolher_tabela(fonte, nomes):
+    """Aba/tabela da fonte: a pedida em arquivo#tabela; senão a de nome igual à aba configurada; senão a primeira."""
+    if fonte.tabela:
+        if fonte.tabela not in nomes: raise ValueError(f"'{fonte.tabela}' não existe em '{fonte.caminho.name}' (disponíveis: {', '.join(nomes)})")
+        return fonte.tabela
+    if not nomes: raise ValueError(f"Nenhuma aba/tabela em '{fonte.caminho.name}'.")
+    return fonte.tabela_padrao if fonte.tabela_padrao in nomes else nomes[0]
+
+def _faixas_decrescentes(linhas_decrescentes):
+    """[9, 8, 7, 3] -> [(7, 3), (3, 1)]: (primeira linha, quantidade) de cada trecho contíguo, de baixo para cima."""
+    faixas = []
+    for linha in linhas_decrescentes:
+        if faixas and faixas[-1][0] == linha + 1: faixas[-1] = (linha, faixas[-1][1] + 1)
+        else: faixas.append((linha, 1))
+    return faixas
+
+class FonteSQLite(FonteLocal):
+    """Tabela SQLite (a de mesmo nome da aba configurada, ou a primeira): colunas = cabeçalho, ordem das linhas = rowid."""
+    def _ler_arquivo(self):
+        if not self.caminho.exists(): raise FileNotFoundError(self.caminho) # sqlite3.connect criaria um banco vazio
+        if getattr(self, '_conexao', None) is not None: self._conexao.close() # Recarga da sessão
+        self._conexao = sqlite3.connect(self.caminho, check_same_thread=False) # Lida na thread de carga, gravada na de geração
+        tabelas = [nome for (nome,) in self._conexao.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY rowid")]
+        self._tabela = _escolher_tabela(self, tabelas)
+        cursor = self._conexao.execute(f'SELECT rowid, * FROM "{self._tabela}" ORDER BY rowid')
+        self._colunas = [descricao[0] for descricao in cursor.description[1:]]
+        self._rowids = [None] # Linha 1 (cabeçalho) não é uma linha da tabela
+        linhas = [list(self._colunas)]
+        for rowid, *valores in cursor:
+            self._rowids.append(rowid); linhas.append([_texto_celula(valor) for valor in valores])
+        return linhas
+
+    def _persistir_celulas(self, celulas):
+        por_coluna = {}
+        for (linha, coluna), valor in celulas.items():
+            if linha < 2 or coluna > len(self._colunas): raise ValueError(f"Célula fora da tabela '{self._tabela}': L{linha} C{coluna}")
+            por_coluna.setdefault(coluna, []).append((valor, self._rowids[linha - 1]))
+        with self._conexao: # Uma transação para todas as células
+            for coluna, valores in por_coluna.items():
+                self._conexao.executemany(f'UPDATE "{self._tabela}" SET "{self._colunas[coluna - 1]}" = ? WHERE rowid = ?', valores)
+
+    def _persistir_exclusao(self, linhas, arquivar=False):
+        excluidos = [self._rowids.pop(linha - 1) for linha in linhas] # Linhas em ordem decrescente
+        with self._conexao: # Uma transação: a cópia para a tabela de excluídos e a exclusão
+            if arquivar:
+                tabela_arquivo = self._tabela + SUFIXO_ARQUIVO_EXCLUIDOS
+                self._conexao.execute(f'CREATE TABLE IF NOT EXISTS "{tabela_arquivo}" AS SELECT * FROM "{self._tabela}" WHERE 0')
+                self._conexao.executemany(f'INSERT INTO "{tabela_arquivo}" SELECT * FROM "{self._tabela}" WHERE rowid = ?',
+                                          [(rowid,) for rowid in reversed(excluidos)])
+            self._conexao.executemany(f'DELETE FROM "{self._tabela}" WHERE rowid = ?', [(rowid,) for rowid in excluidos])
+
+    def _persistir_arquivamento(self, linhas, valores):
+        self._persistir_exclusao(linhas, arquivar=True) # Copia os valores originais (tipos do SQLite), não o texto
+
+def abrir_fonte_local(especificacao, tabela_padrao=None):
+    """Fonte para "arquivo[#tabela]", pelo formato do arquivo; sem #tabela, usa `tabela_padrao` se existir no arquivo."""
+    caminho, _, tabela = str(especificacao).partition('#')
+    classes = {'.csv': FonteCSV, '.tsv': FonteCSV, '.txt': FonteCSV, '.xlsx': FonteXLSX,
+               '.sqlite': FonteSQLite, '.sqlite3': FonteSQLite, '.db': FonteSQLite}
+    classe = classes.get(Path(caminho).suffix.lower())
+    if classe is None: raise ValueError(f"Formato de fonte local não suportado: '{caminho}' (use CSV, XLSX ou SQLite)")
+    return classe(caminho, tabela or None, tabela_padrao)
+
+# ==============================================================================
+# 5.9 SAÍDA EM ZIP (um arquivo por lote ou por registro, com índice linha -> membros)
+# ==============================================================================
+# Em "pastas", cada registro ganha uma pasta em PASTA_SAIDA com seus 5 arquivos: num lote de 2.000 registros são
+# 2.000 pastas e 10.000 arquivos pequenos, lentos de criar e de copiar num compartilhamento de rede. Nos modos ZIP
+# os documentos são renderizados em memória (nos workers) e o processo principal os grava, em sequência, num único
+# ZIP do lote ("zip-lote", membros NOME/arquivo) ou num ZIP por registro ("zip-registro", NOME_PLACA.zip).
+# DOCX e XLSX já são ZIPs comprimidos: entram sem nova compressão (ZIP_STORED); NIVEL_COMPRESSAO_ZIP vale para o índice.
+# O índice (CSV: tipo, linha, nome, arquivo ZIP, membro) fica ao lado dos ZIPs e, no "zip-lote", também dentro dele.
+# O ZIP é gravado como .parcial e renomeado ao fechar; no "zip-lote" o status GERADO só é enviado depois disso
+# (até lá uma queda perderia o arquivo), e o diário aponta o ZIP de cada registro para a retomada conferir.
+# O manifesto (5.6) só vale para "pastas": nos modos ZIP todos os documentos do lote são gerados.
+MODO_SAIDA = "pastas" # "pastas" | "zip-lote" | "zip-registro" (generate --archive batch|person)
+NIVEL_COMPRESSAO_ZIP = 6 # 0-9 (generate --zip-level)
+EXTENSOES_JA_COMPRIMIDAS = ('.docx', '.xlsx', '.zip', '.png', '.jpg', '.jpeg')
+
+class SaidaZip:
+    """Grava os documentos de um lote em ZIP, registro a registro, e o índice linha -> membros ao fechar."""
+    def __init__(self, modo, pasta, nivel=None):
+        self.modo = modo
+        self.pasta = Path(pasta)
+        self.nivel = NIVEL_COMPRESSAO_ZIP if nivel is None else nivel
+        self.id_lote = time.strftime("lote_%Y%m%d_%H%M%S")
+        self.por_registro = modo == "zip-registro" # Cada ZIP fica completo em disco ao fim do registro
+        self.indice = [] # (tipo, linha, nome, arquivo ZIP, membro)
+        self.arquivos = [] # ZIPs concluídos
+        self.caminho_indice = self.pasta / f"{self.id_lote}_indice.csv"
+        self._zip_lote = None
+        if modo == "zip-lote":
+            self.caminho_lote = self.pasta / f"{self.id_lote}.zip"
+            self._zip_lote = self._abrir(self.caminho_lote)
+            self._membros_lote = set()
+
+    def _abrir(self, caminho):
+        return zipfile.ZipFile(caminho.with_name(caminho.name + ".parcial"), 'w', zipfile.ZIP_DEFLATED, compresslevel=self.nivel)
+
+    def _fechar_zip(self, zf, caminho):
+        zf.close()
+        temporario = caminho.with_name(caminho.name + ".parcial")
+        with open(temporario, 'rb') as arquivo: os.fsync(arquivo.fileno())
+        os.replace(temporario, caminho)
+        self.arquivos.append(caminho)
+
+    def _gravar_membro(self, zf, nome, dados):
+        info = zipfile.ZipInfo(nome, date_time=time.localtime()[:6])
+        info.external_attr = 0o644 << 16
+        ja_comprimido = nome.lower().endswith(EXTENSOES_JA_COMPRIMIDAS) or not self.nivel
+        info.compress_type = zipfile.ZIP_STORED if ja_comprimido else zipfile.ZIP_DEFLATED
+        zf.writestr(info, dados, compresslevel=None if ja_comprimido else self.nivel)
+
+    def adicionar(self, resultado):
+        """Grava os documentos do resultado (e os retira dele). Retorna o caminho do ZIP onde eles ficam."""
+        arquivos, resultado['arquivos'] = resultado['arquivos'], []
+        if self._zip_lote is not None:
+            zf, caminho = self._zip_lote, self.caminho_lote
+        else:
+            caminho = self.pasta / resultado['arquivo_registro']
+            zf = self._abrir(caminho)
+        try:
+            for relativo, dados in arquivos:
+                if self._zip_lote is None:
+                    membro = relativo.rsplit('/', 1)[-1] # Um ZIP por registro: sem a pasta
+                else:
+                    membro = relativo
+                    if membro in self._membros_lote: # Mesmo nome e placa em duas linhas: não sobrescreve no ZIP
+                        raiz, extensao = os.path.splitext(membro); membro = f"{raiz}_L{resultado['linha']}{extensao}"
+                    self._membros_lote.add(membro)
+                self._gravar_membro(zf, membro, dados)
+                self.indice.append((resultado['tipo'], resultado['linha'], resultado['nome'], caminho.name, membro))
+        except BaseException:
+            if self._zip_lote is None: # ZIP do registro pela metade: não fica na pasta de saída
+                zf.close(); os.remove(caminho.with_name(caminho.name + ".parcial"))
+            raise
+        if self._zip_lote is None: self._fechar_zip(zf, caminho)
+        return caminho
+
+    def fechar(self):
+        """Grava o índice e fecha o ZIP do lote. Retorna o caminho do índice (None se nenhum documento foi gravado)."""
+        import csv
+        if not self.indice:
+            if self._zip_lote is not None: # Lote sem documentos: descarta o ZIP vazio
+                self._zip_lote.close(); os.remove(self.caminho_lote.with_name(self.caminho_lote.name + ".parcial"))
+            return None
+        texto = io.StringIO()
+        escritor = csv.writer(texto, delimiter=';', lineterminator="\r\n") # ';' abre direto no Excel em português
+        escritor.writerow(["tipo", "linha", "nome", "arquivo_zip", "membro"])
+        escritor.writerows(self.indice)
+        conteudo = texto.getvalue().encode('utf-8-sig')
+        if self._zip_lote is not None:
+            self._gravar_membro(self._zip_lote, "indice.csv", conteudo)
+            self._fechar_zip(self._zip_lote, self.caminho_lote)
+        temporario = self.caminho_indice.with_name(self.caminho_indice.name + ".tmp")
+        temporario.write_bytes(conteudo)
+        os.replace(temporario, self.caminho_indice)
+        return self.caminho_indice
 
 # ==============================================================================
 # 6. FUNÇÕES PRINCIPAIS DA APLICAÇÃO (Gerar Docs, Excluir)
@@ -394,214 +2512,347 @@ def carregar_planilha(gc, filename, tab_name):
 # Variáveis globais para acesso pelas funções de comando dos botões
 # (Alternativa seria usar uma classe App, mas mantendo funcional por ora)
 root = None
-checkboxes_pf = []
-checkboxes_pj = []
+lista_pf = None # ListaRegistros (Treeview) dos registros PF pendentes
+lista_pj = None
 dados_pf_processados = []
 dados_pj_processados = []
 sheet_pf = None
 sheet_pj = None
 col_index_status_pf = -1
 col_index_status_pj = -1
+client_gspread = None # Cliente autenticado da sessão, reaproveitado entre lotes e recargas
+
+# Parâmetros de cada tipo de formulário: (arquivo, aba, coluna ID trigger, coluna ID comparação)
+PLANILHAS_POR_TIPO = {
+    "PF": (PLANILHA_PF_FILENAME, PF_TAB_NAME, COL_PF_ID_TRIGGER, COL_PF_ID_COMPARISON),
+    "PJ": (PLANILHA_PJ_FILENAME, PJ_TAB_NAME, COL_PJ_ID_TRIGGER, COL_PJ_ID_COMPARISON),
+}
+
+def _carregar_tipo(client, tipo, buffer_prefill):
+    """Carrega a aba de um tipo (PF/PJ), agenda o pré-preenchimento no buffer e prepara os registros. Roda numa thread."""
+    filename, tab_name, id_col_trigger, id_col_comparison = PLANILHAS_POR_TIPO[tipo]
+    placeholders_templates = placeholders_dos_templates(tipo)
+    colunas = colunas_usadas(tipo, placeholders_templates) if PROJETAR_COLUNAS else None
+    with medir('planilha.carregar', tipo=tipo):
+        if tipo in FONTES_LOCAIS: sheet, headers, dados_originais = carregar_fonte_local(FONTES_LOCAIS[tipo], tab_name, colunas, tipo)
+        else: sheet, headers, dados_originais = carregar_planilha(client, filename, tab_name, colunas, tipo)
+    contar('registros.carregados', len(dados_originais))
+
+    # Placeholders dos templates que não correspondem a nenhuma coluna da planilha
+    headers_maiusculos = {h.upper() for h in headers}
+    for template_nome, tokens in placeholders_templates.items():
+        sem_coluna = sorted(token for token in tokens if token[1:-1] not in headers_maiusculos)
+        if sem_coluna: print(f"⚠️ {template_nome}: placeholders sem coluna correspondente na planilha {tipo}: {', '.join(sem_coluna)}")
+
+    # Índice da Coluna de Status (1-based)
+    try: col_index_status = headers.index(STATUS_COL) + 1
+    except ValueError: notificar('erro', "Erro Fatal", f"Coluna Status '{STATUS_COL}' não encontrada nos cabeçalhos da planilha {tipo}."); sys.exit(SAIDA_ERRO_PLANILHA)
+
+    dados_preenchidos = dados_originais
+    if buffer_prefill is not None:
+        with medir('planilha.pre_preenchimento', tipo=tipo):
+            dados_preenchidos = preencher_e_atualizar_planilha(
+                sheet, headers, dados_originais,
+                id_col_trigger, id_col_comparison, COL_CADASTRO, TRIGGER_VALUE, buffer_prefill, colunas
+            )
 
-def gerar_documentos_cmd():
-    """Função chamada pelo botão 'Gerar Documentos'. Processa DOCX e XLSX."""
-    global checkboxes_pf, checkboxes_pj, sheet_pf, sheet_pj, col_index_status_pf, col_index_status_pj, root
-
-    selecionados_tuplas = [(p, var) for p, var in checkboxes_pf + checkboxes_pj if var.get()]
-    if not selecionados_tuplas:
-        messagebox.showwarning("Aviso", "Nenhum registro selecionado.")
-        return
-
-    print(f"\n--- Gerando Docs para {len(selecionados_tuplas)} registro(s) ---")
+    # 'tipo' (da tabela) e 'linha' já vêm nos Registros, para uso na interface e geração
+    return sheet, col_index_status, dados_preenchidos
+
+def carregar_sessao(executar_prefill=True):
+    """Autentica (uma vez por sessão), carrega as planilhas PF/PJ, pré-preenche e prepara os registros (atualiza as globais da sessão).
+
+    PF e PJ são carregados em paralelo (duas threads sobre a mesma sessão HTTP do cliente); cada fase é um span
+    da instrumentação (seção 2.1), que entra no resumo por etapa.
+    """
+    global sheet_pf, sheet_pj, col_index_status_pf, col_index_status_pj, dados_pf_processados, dados_pj_processados, client_gspread
+    with medir('sessao.carregar'):
+        # --- 1. Autenticação (só se algum tipo vem do Google Sheets) ---
+        if client_gspread is None and set(PLANILHAS_POR_TIPO) - set(FONTES_LOCAIS):
+            client_gspread = autenticar_google()
+
+        # --- 2 e 3. Carregamento e pré-preenchimento de PF e PJ, em paralelo (o tempo é quase todo espera de rede) ---
+        buffer_prefill = BufferEscrita() if executar_prefill else None # PF e PJ vão juntos para a API no fim
+        with medir('planilha.carregar_pf_pj'), ThreadPoolExecutor(max_workers=2, thread_name_prefix="autodocs-carregar") as executor:
+            futuros = {tipo: executor.submit(_carregar_tipo, client_gspread, tipo, buffer_prefill) for tipo in PLANILHAS_POR_TIPO}
+            resultados = {tipo: futuro.result() for tipo, futuro in futuros.items()} # Repassa SystemExit/erros da thread
+        sheet_pf, col_index_status_pf, dados_pf_processados = resultados["PF"]
+        sheet_pj, col_index_status_pj, dados_pj_processados = resultados["PJ"]
+
+        if buffer_prefill is not None:
+            with medir('planilha.enviar_pre_preenchimento'):
+                enviar_pre_preenchimento(buffer_prefill)
+
+        if client_gspread is not None: salvar_token(client_gspread)
+    return client_gspread
+
+def aplicar_exclusao_em_memoria(tipo, linhas_excluidas):
+    """Remove dos registros da sessão as linhas excluídas e desloca o 'linha' das seguintes, como a planilha faz."""
+    global dados_pf_processados, dados_pj_processados
+    excluidas = sorted(set(linhas_excluidas))
+    if not excluidas: return
+    conjunto_excluidas = set(excluidas) # Consulta O(1) por registro; a lista ordenada fica para o bisect
+    registros = dados_pf_processados if tipo == "PF" else dados_pj_processados
+    restantes = [pessoa for pessoa in registros if pessoa["linha"] not in conjunto_excluidas]
+    for pessoa in restantes: pessoa["linha"] -= bisect.bisect_left(excluidas, pessoa["linha"]) # Nº de linhas excluídas acima
+    if tipo == "PF": dados_pf_processados = restantes
+    else: dados_pj_processados = restantes
+
+def registros_pendentes(registros):
+    """Filtra os registros que ainda não estão marcados como 'GERADO'."""
+    return [pessoa for pessoa in registros if str(pessoa.get(STATUS_COL, "")).strip().upper() != "GERADO"]
+
+def gerar_documentos(registros, progresso=None, cancelar=None):
+    """Gera os documentos dos registros e envia o status 'GERADO'. Retorna o relatório (dict) ou None se não pôde iniciar.
+
+    `progresso(feitos, total, resultado)` é chamado a cada registro concluído; `cancelar` (threading.Event)
+    interrompe na fronteira de um registro, e o status dos registros já concluídos ainda é enviado.
+    O status vai em blocos durante o lote e cada etapa fica no diário (ver DiarioLote), para retomar após uma queda.
+    """
+    global sheet_pf, sheet_pj, col_index_status_pf, col_index_status_pj
+
+    inicio_lote = time.perf_counter()
+    print(f"\n--- Gerando Docs para {len(registros)} registro(s) ---")
     try:
         # Cria a pasta de saída se não existir
         Path(PASTA_SAIDA).mkdir(parents=True, exist_ok=True)
     except OSError as e:
-        messagebox.showerror("Erro ao Criar Pasta", f"Não foi possível criar a pasta de saída '{PASTA_SAIDA}': {e}")
-        return
+        notificar('erro', "Erro ao Criar Pasta", f"Não foi possível criar a pasta de saída '{PASTA_SAIDA}': {e}")
+        return None
+    if USAR_MANIFESTO: carregar_manifesto()
+    saida_zip = SaidaZip(MODO_SAIDA, PASTA_SAIDA) if MODO_SAIDA != "pastas" else None
 
     erros_template = [] # Guarda erros de templates não encontrados
     erros_geracao = []  # Guarda erros durante a geração/salvamento de arquivos individuais
     erros_atualizacao = [] # Guarda erros ao preparar/enviar atualização de status
-    updates_status_batch = [] # Lista para guardar atualizações de status para a API
-
-    # Itera sobre cada pessoa/empresa selecionada na interface
-    for pessoa_original, var_tk in selecionados_tuplas:
-        # Garante que as chaves do dicionário sejam strings e estejam em maiúsculo
-        dados_pessoa = {str(k).strip().upper(): v for k, v in pessoa_original.items() if k}
-
-        tipo = dados_pessoa.get('TIPO') # 'TIPO' foi adicionado no processamento
-        linha = pessoa_original.get("linha") # 'linha' foi adicionada no processamento
-
-        # Define quais listas de templates usar e qual planilha/coluna de status atualizar
-        if tipo == "PF":
-            templates_docx = TEMPLATE_PF_DOCX
-            templates_xlsx = TEMPLATE_PF_XLSX
-            ws, col_idx = sheet_pf, col_index_status_pf
-        elif tipo == "PJ":
-            templates_docx = TEMPLATE_PJ_DOCX
-            templates_xlsx = TEMPLATE_PJ_XLSX
-            ws, col_idx = sheet_pj, col_index_status_pj
-        else:
-            msg_erro = f"L{linha}: Tipo de pessoa ('{tipo}') inválido ou não encontrado nos dados."
-            print(f"⚠️ {msg_erro}"); erros_geracao.append(msg_erro); continue # Pula este registro
-
-        # Define nomes base para pastas e arquivos, tratando caracteres inválidos
-        nome_base_raw = str(dados_pessoa.get("NOME COMPLETO", dados_pessoa.get("RAZÃO SOCIAL", f"Registro_L{linha}"))).strip()
-        placa_base_raw = str(dados_pessoa.get("PLACA", "SemPlaca")).strip()
-        # Remove caracteres inválidos para nomes de arquivo/pasta e limita comprimento
-        nome_base = re.sub(r'[\\/*?:"<>|]', "", nome_base_raw).replace(" ", "_")[:80]
-        placa_base = re.sub(r'[\\/*?:"<>|]', "", placa_base_raw).replace('-', '')
-
-        if not isinstance(linha, int) or linha < 2:
-            msg_erro = f"{nome_base}: Número de linha inválido ({linha}) associado ao registro."
-            print(f"⚠️ {msg_erro}"); erros_geracao.append(msg_erro); continue
-
-        if DEBUG_MODE: print(f"\n=== PROC REG: {nome_base_raw} (L{linha}, {tipo}) ===")
-        pasta_destino = Path(PASTA_SAIDA) / nome_base
-        try:
-             pasta_destino.mkdir(parents=True, exist_ok=True)
-        except OSError as e:
-             msg = f"L{linha} ({nome_base_raw}): Erro ao criar pasta de destino '{pasta_destino}': {e}"; print(f"❌ {msg}"); erros_geracao.append(msg); continue
-
-        # Flag para controlar se TODOS os templates (docx e xlsx) foram gerados com sucesso para esta pessoa
-        todos_templates_ok_para_pessoa = True
-
-        # --- Processamento dos Templates DOCX ---
-        if DEBUG_MODE and templates_docx: print(f"  -- Processando {len(templates_docx)} templates DOCX --")
-        for template_path_obj in templates_docx:
-            template_nome = template_path_obj.name
-            if not template_path_obj.exists():
-                msg = f"Template DOCX não encontrado: {template_nome}"; print(f"⚠️ {msg}"); erros_template.append(msg); todos_templates_ok_para_pessoa = False; continue
-            if DEBUG_MODE: print(f"-- Proc Template DOCX: {template_nome}")
-            try:
-                doc = Document(template_path_obj)
-                substituir_placeholders(doc, dados_pessoa)
-                prefixo = template_path_obj.stem.split('-', 1)[0].strip()
-                nome_doc = f"{prefixo}_{nome_base}_{placa_base}.docx"
-                caminho_saida = pasta_destino / nome_doc
-                doc.save(caminho_saida)
-                # if DEBUG_MODE: print(f"  >> Salvo DOCX: {nome_doc}")
-            except Exception as e:
-                msg = f"L{linha} ({nome_base_raw}): Erro ao gerar/salvar DOCX '{template_nome}': {type(e).__name__} - {e}"; print(f"❌ {msg}"); erros_geracao.append(msg); todos_templates_ok_para_pessoa = False
-
-        # --- Processamento dos Templates XLSX ---
-        if DEBUG_MODE and templates_xlsx: print(f"  -- Processando {len(templates_xlsx)} templates XLSX --")
-        for template_path_obj in templates_xlsx:
-            template_nome = template_path_obj.name
-            if not template_path_obj.exists():
-                 msg = f"Template XLSX não encontrado: {template_nome}"; print(f"⚠️ {msg}"); erros_template.append(msg); todos_templates_ok_para_pessoa = False; continue
-            if DEBUG_MODE: print(f"-- Proc Template XLSX: {template_nome}")
-            try:
-                workbook = openpyxl.load_workbook(template_path_obj)
-                workbook_modificado = substituir_placeholders_excel(workbook, dados_pessoa)
-                prefixo_xlsx = template_path_obj.stem # Nome do arquivo template sem extensão
-                nome_doc_xlsx = f"{prefixo_xlsx}_{nome_base}_{placa_base}.xlsx"
-                caminho_saida_xlsx = pasta_destino / nome_doc_xlsx
-                workbook_modificado.save(caminho_saida_xlsx)
-                # if DEBUG_MODE: print(f"  >> Salvo XLSX: {nome_doc_xlsx}")
-            except InvalidFileException:
-                 msg = f"L{linha} ({nome_base_raw}): Arquivo Excel inválido ou corrompido: '{template_nome}'"; print(f"❌ {msg}"); erros_geracao.append(msg); todos_templates_ok_para_pessoa = False
-            except Exception as e:
-                 msg = f"L{linha} ({nome_base_raw}): Erro ao gerar/salvar XLSX '{template_nome}': {type(e).__name__} - {e}"; print(f"❌ {msg}"); erros_geracao.append(msg); todos_templates_ok_para_pessoa = False
-
-        # --- Preparar Atualização de Status (APENAS se TUDO deu certo para esta pessoa) ---
-        if todos_templates_ok_para_pessoa:
-            if col_idx > 0: # Verifica se o índice da coluna Status é válido
-                if DEBUG_MODE: print(f"  >> TODOS Docs OK ({nome_base_raw}). Preparando update status '{ws.title}' L{linha} C{col_idx}")
-                try:
-                    cell_a1 = rowcol_to_a1(linha, col_idx)
-                    updates_status_batch.append({'range': cell_a1, 'values': [['GERADO']], 'worksheet': ws})
-                except Exception as e:
-                    msg = f"L{linha} ({nome_base_raw}): Erro ao preparar A1 para status ({linha},{col_idx}): {e}"; print(f"❌ {msg}"); erros_atualizacao.append(msg)
-            else:
-                msg = f"L{linha} ({nome_base_raw}): Docs gerados, mas coluna '{STATUS_COL}' não encontrada ou inválida em '{ws.title}'. Status não será atualizado."; print(f"⚠️ {msg}"); erros_atualizacao.append(msg)
-        elif DEBUG_MODE:
-            print(f"  >> Geração INCOMPLETA/ERRO para {nome_base_raw}. Status NÃO será atualizado.")
-
-
-    # --- Envio das Atualizações de Status em Lote ---
+    placeholders_nao_resolvidos = {} # Template -> tokens {...} sem coluna correspondente na planilha
+    buffer_status = BufferEscrita() # Status 'GERADO' de PF e PJ, enviados em blocos
+    status_pendentes = [] # (fonte, linha, coluna, chave) de cada status agendado e ainda não enviado
+    registros_por_chave = {(pessoa.get("tipo"), pessoa.get("linha")): pessoa for pessoa in registros} # Para marcar GERADO em memória
+    documentos_gerados = documentos_pulados = documentos_falhos = 0
+    feitos = 0
     status_atualizado_count = 0
-    if updates_status_batch:
-        print(f"\n--- Enviando {len(updates_status_batch)} updates de status para Google Sheets ---")
-        updates_agrupados = {} # Agrupa por objeto worksheet
-        for info in updates_status_batch:
-            ws = info['worksheet']
-            if ws not in updates_agrupados: updates_agrupados[ws] = []
-            updates_agrupados[ws].append({'range': info['range'], 'values': info['values']})
-
-        for sheet_obj, updates_list in updates_agrupados.items():
-            title = sheet_obj.title
-            print(f" Enviando {len(updates_list)} updates para '{title}'...")
+    envio_status = {'celulas': 0, 'intervalos': 0, 'requisicoes': 0}
+    status_nao_gravados = 0 # Status agendados cujo envio falhou: o diário é mantido para reenviar
+    inicio_bloco = None
+
+    # --- Diário: registros já prontos num lote interrompido não são gerados de novo ---
+    retomados = {} # (tipo, linha) -> evento 'registro' do diário anterior, ainda sem status gravado
+    selecionados = set(registros_por_chave)
+    anterior = ler_diario()
+    if anterior:
+        sessao = {(p.get('tipo'), p.get('linha')): p for p in dados_pf_processados + dados_pj_processados}
+        sessao.update(registros_por_chave)
+        for chave, evento in anterior['concluidos'].items():
+            _manifesto.update(evento.get('manifesto', {})) # Arquivos gerados antes da queda
+            pessoa = sessao.get(chave)
+            if chave in anterior['status_gravados'] or pessoa is None or impressao_registro(pessoa) != evento.get('impressao'): continue
+            if evento.get('arquivo') and not Path(evento['arquivo']).exists(): continue # ZIP não chegou a ser fechado
+            retomados[chave] = evento; registros_por_chave.setdefault(chave, pessoa)
+        if retomados: print(f" Diário: {len(retomados)} registro(s) de um lote interrompido já têm os documentos prontos; só o status será enviado.")
+    diario = DiarioLote(registros, list(retomados.values())) if USAR_DIARIO else None
+
+    def agendar_status(tipo, linha, nome_base_raw):
+        nonlocal inicio_bloco
+        ws, col_idx = (sheet_pf, col_index_status_pf) if tipo == "PF" else (sheet_pj, col_index_status_pj)
+        if col_idx <= 0: # Índice da coluna Status inválido
+            msg = f"L{linha} ({nome_base_raw}): Docs gerados, mas coluna '{STATUS_COL}' não encontrada ou inválida em '{ws.title}'. Status não será atualizado."; print(f"⚠️ {msg}"); erros_atualizacao.append(msg)
+            return
+        if DEBUG_MODE: print(f"  >> TODOS Docs OK ({nome_base_raw}). Preparando update status '{ws.title}' L{linha} C{col_idx}")
+        buffer_status.adicionar(ws, linha, col_idx, 'GERADO')
+        status_pendentes.append((ws, linha, col_idx, (tipo, linha)))
+        if inicio_bloco is None: inicio_bloco = time.monotonic()
+
+    def enviar_bloco_status():
+        nonlocal status_atualizado_count, status_nao_gravados, inicio_bloco
+        print(f"\n--- Enviando {len(status_pendentes)} updates de status para Google Sheets ---")
+        with medir('status.enviar', registros=len(status_pendentes)):
+            envio = buffer_status.enviar()
+        for k in envio_status: envio_status[k] += envio[k]
+        erros_atualizacao.extend(envio['erros'])
+        # Reflete o status na sessão, para a lista ser atualizada sem recarregar as planilhas
+        gravados = [chave for ws, linha, col_idx, chave in status_pendentes if (linha, col_idx) in envio['gravadas'].get(ws, {})]
+        for chave in gravados: registros_por_chave[chave][STATUS_COL] = "GERADO"
+        if diario and gravados: diario.gravar('status', chaves=gravados)
+        status_atualizado_count += len(gravados)
+        status_nao_gravados += len(status_pendentes) - len(gravados)
+        status_pendentes.clear(); inicio_bloco = None
+
+    # Status pendente de registros retomados que não estão na seleção atual
+    for (tipo, linha), evento in retomados.items():
+        if (tipo, linha) not in selecionados: agendar_status(tipo, linha, evento.get('nome'))
+
+    def resultados():
+        """Resultados do diário para os registros retomados; os demais são gerados (em paralelo, se NUM_WORKERS permitir)."""
+        a_gerar = []
+        for pessoa in registros:
+            evento = retomados.get((pessoa.get("tipo"), pessoa.get("linha")))
+            if evento is None: a_gerar.append(pessoa); continue
+            resultado = _resultado_registro(evento['linha'], evento['tipo'])
+            resultado.update(nome=evento.get('nome'), ok=True, processado=True, pulados=evento.get('documentos', 0), retomado=True,
+                             nao_resolvidos={t: set(tokens) for t, tokens in evento.get('nao_resolvidos', {}).items()})
+            yield resultado
+        yield from gerar_registros(a_gerar, cancelar=cancelar)
+
+    # Resultados chegam na ordem da seleção
+    for resultado in resultados():
+        feitos += 1
+        arquivo_zip = None
+        if saida_zip is not None and resultado['arquivos']:
             try:
-                response = sheet_obj.batch_update(updates_list, value_input_option='USER_ENTERED')
-                print(f"   -> Sucesso ao enviar para '{title}'.")
-                status_atualizado_count += len(updates_list)
-            except gspread.exceptions.APIError as e:
-                 msg = f"   -> ERRO API Google ao atualizar status em '{title}': {e}"; print(msg); erros_atualizacao.append(msg)
-            except Exception as e:
-                 msg = f"   -> ERRO inesperado ao atualizar status em '{title}': {e}"; print(msg); erros_atualizacao.append(msg)
+                arquivo_zip = saida_zip.adicionar(resultado)
+            except (OSError, ValueError) as e:
+                msg = f"L{resultado['linha']} ({resultado['nome']}): Erro ao gravar os documentos no ZIP: {type(e).__name__} - {e}"; print(f"❌ {msg}")
+                resultado['erros_geracao'].append(msg); resultado['ok'] = False
+                resultado['falhas'] += resultado['documentos']; resultado['documentos'] = 0
+        documentos_gerados += resultado['documentos']
+        documentos_pulados += resultado['pulados']
+        documentos_falhos += resultado['falhas']
+        _manifesto.update(resultado['manifesto'])
+        erros_template.extend(resultado['erros_template'])
+        erros_geracao.extend(resultado['erros_geracao'])
+        for template_nome, tokens in resultado['nao_resolvidos'].items():
+            placeholders_nao_resolvidos.setdefault(template_nome, set()).update(tokens)
+
+        tipo, linha, nome_base_raw = resultado['tipo'], resultado['linha'], resultado['nome']
+        # --- Preparar Atualização de Status (APENAS se TUDO deu certo para esta pessoa) ---
+        if resultado['ok']:
+            if diario and not resultado.get('retomado'): # Write-ahead: documentos prontos antes de agendar o status
+                diario.gravar('registro', tipo=tipo, linha=linha, impressao=impressao_registro(registros_por_chave[(tipo, linha)]),
+                              nome=nome_base_raw, documentos=resultado['documentos'] + resultado['pulados'], manifesto=resultado['manifesto'],
+                              arquivo=str(arquivo_zip) if arquivo_zip else None,
+                              nao_resolvidos={t: sorted(tokens) for t, tokens in resultado['nao_resolvidos'].items()})
+            agendar_status(tipo, linha, nome_base_raw)
+        elif DEBUG_MODE and resultado['processado']:
+            print(f"  >> Geração INCOMPLETA/ERRO para {nome_base_raw}. Status NÃO será atualizado.")
+        # No "zip-lote" o status espera o ZIP do lote ser fechado: antes disso os documentos não estão seguros em disco
+        if (status_pendentes and (saida_zip is None or saida_zip.por_registro)
+                and (len(status_pendentes) >= STATUS_LOTE_REGISTROS or time.monotonic() - inicio_bloco >= STATUS_LOTE_SEGUNDOS)):
+            enviar_bloco_status()
+        if progresso: progresso(feitos, len(registros), resultado)
+
+
+    cancelado = cancelar is not None and cancelar.is_set() and feitos < len(registros)
+    if cancelado: print(f"\n--- Geração cancelada pelo usuário após {feitos} de {len(registros)} registro(s) ---")
+    if USAR_MANIFESTO and (documentos_gerados or retomados): salvar_manifesto()
+    indice_zip = None
+    if saida_zip is not None:
+        try:
+            indice_zip = saida_zip.fechar()
+        except OSError as e:
+            msg = f"Erro ao fechar o arquivo ZIP / índice do lote: {e}"; print(f"❌ {msg}"); erros_geracao.append(msg)
+            if not saida_zip.por_registro: # Documentos do lote perdidos: o status não pode ir para a planilha
+                status_nao_gravados += len(status_pendentes); status_pendentes.clear(); buffer_status = BufferEscrita()
+        if indice_zip: print(f" ZIP: {len(saida_zip.arquivos)} arquivo(s) em '{PASTA_SAIDA}', índice '{indice_zip.name}'.")
+
+    # --- Envio do último bloco de status ---
+    if status_pendentes:
+        enviar_bloco_status()
         print("--- Fim do envio de status ---")
-    else:
+    elif not status_atualizado_count:
         print("\nNenhum update de status a enviar.")
-
-    # --- Monta Relatório Final para o Usuário ---
-    msg_final = [f"Processo Concluído.", f"Registros Selecionados: {len(selecionados_tuplas)}", f"Status 'GERADO' atualizado (API OK): {status_atualizado_count}"]
+    if diario:
+        diario.fechar(concluido=status_nao_gravados == 0)
+        if status_nao_gravados: print(f" Diário mantido: {status_nao_gravados} status não gravado(s) serão reenviados na próxima geração.")
+
+    # --- Placeholders sem correspondência (reportados uma vez por template) ---
+    avisos_placeholders = [f"{nome}: {', '.join(sorted(tokens))}" for nome, tokens in placeholders_nao_resolvidos.items() if tokens]
+    for aviso in avisos_placeholders: print(f"⚠️ Placeholders sem coluna correspondente - {aviso}")
+
+    registrar_duracao('geracao.lote', time.perf_counter() - inicio_lote, registros=len(registros), processados=feitos, cancelado=cancelado)
+    return {'registros': len(registros), 'processados': feitos, 'cancelado': cancelado, 'retomados': len(retomados),
+            'documentos': documentos_gerados, 'documentos_pulados': documentos_pulados, 'documentos_falhos': documentos_falhos,
+            'status_atualizados': status_atualizado_count,
+            'escrita_planilha': envio_status,
+            'arquivos_zip': [str(caminho) for caminho in saida_zip.arquivos] if saida_zip else [], 'indice_zip': str(indice_zip) if indice_zip else None,
+            'erros_template': erros_template, 'erros_geracao': erros_geracao, 'erros_atualizacao': erros_atualizacao,
+            'avisos_placeholders': avisos_placeholders}
+
+def montar_relatorio_geracao(relatorio):
+    """Texto do relatório final da geração (messagebox no modo GUI, log no modo linha de comando)."""
+    erros_template, erros_geracao, erros_atualizacao = relatorio['erros_template'], relatorio['erros_geracao'], relatorio['erros_atualizacao']
+    avisos_placeholders = relatorio['avisos_placeholders']
+    msg_final = [f"Processo Concluído.", f"Registros Selecionados: {relatorio['registros']}",
+                 f"Documentos: {relatorio['documentos']} gerado(s), {relatorio['documentos_pulados']} sem alteração (pulado(s)), {relatorio['documentos_falhos']} com falha",
+                 f"Status 'GERADO' atualizado (API OK): {relatorio['status_atualizados']}"]
+    if relatorio.get('arquivos_zip'): msg_final.append(f"Arquivos ZIP: {len(relatorio['arquivos_zip'])} em '{PASTA_SAIDA}' (índice: {Path(relatorio['indice_zip']).name})")
+    if relatorio.get('retomados'): msg_final.insert(1, f"Retomados do lote interrompido (sem gerar de novo): {relatorio['retomados']} registro(s).")
+    if relatorio['cancelado']: msg_final.insert(1, f"CANCELADO pelo usuário: {relatorio['processados']} registro(s) processado(s) antes da interrupção.")
     if erros_template: msg_final.extend(["\n--- Templates Não Encontrados ---"] + list(set(erros_template)))
+    if avisos_placeholders: msg_final.extend([f"\n--- Placeholders Sem Coluna Correspondente ({len(avisos_placeholders)} template(s)) ---"] + avisos_placeholders)
     if erros_geracao: msg_final.extend([f"\n--- Erros Geração/Salvar Docs ({len(erros_geracao)}) ---"] + erros_geracao[:5] + ["(... ver console para mais detalhes)"] if len(erros_geracao) > 5 else erros_geracao)
     if erros_atualizacao: msg_final.extend([f"\n--- Erros Preparação/Envio Status ({len(erros_atualizacao)}) ---"] + erros_atualizacao[:5] + ["(... ver console para mais detalhes)"] if len(erros_atualizacao) > 5 else erros_atualizacao)
-    messagebox.showinfo("Relatório Final da Geração", "\n".join(msg_final))
+    return "\n".join(msg_final)
 
-    # Fecha a janela atual para forçar recarga dos dados na próxima execução
-    print("Recarregando interface...")
-    try:
-        if root and root.winfo_exists(): root.destroy()
-    except tk.TclError: pass # Ignora erro se a janela já foi destruída
-
-
-def excluir_entradas_cmd():
-    """Função chamada pelo botão 'Excluir da Planilha'."""
-    global checkboxes_pf, checkboxes_pj, sheet_pf, sheet_pj, root
-
-    selecionados_tuplas = [(p, var) for p, var in checkboxes_pf + checkboxes_pj if var.get()]
-    if not selecionados_tuplas: messagebox.showwarning("Aviso", "Nenhum registro selecionado."); return
-    confirm = messagebox.askyesno("Confirmar Exclusão", f"Tem certeza que deseja excluir {len(selecionados_tuplas)} registro(s) da(s) planilha(s)?\n\nESTA AÇÃO NÃO PODE SER DESFEITA.")
-    if not confirm: return
-
-    print(f"\n--- Excluindo {len(selecionados_tuplas)} registro(s) ---")
-    excluidos_count = 0; erros_exclusao = []; requests_pf = []; requests_pj = []
-    # Ordena por linha DECRESCENTE para evitar problemas de índice na exclusão em lote
-    selecionados_ordenados = sorted(selecionados_tuplas, key=lambda item: item[0].get("linha", 0), reverse=True)
-    try:
-        sheet_id_pf = sheet_pf.id; sheet_id_pj = sheet_pj.id # IDs internos das abas
-    except Exception as e:
-        messagebox.showerror("Erro Interno", f"Erro ao obter IDs das abas para exclusão: {e}"); return
+def gerar_documentos_cmd():
+    """Função chamada pelo botão 'Gerar Documentos'. Processa DOCX e XLSX."""
+    from tkinter import messagebox
 
-    # Prepara as requisições de exclusão para a API batchUpdate
-    for pessoa_dict, _ in selecionados_ordenados:
+    registros = registros_selecionados_gui()
+    if not registros:
+        messagebox.showwarning("Aviso", "Nenhum registro selecionado.")
+        return
+    iniciar_geracao_gui(registros)
+
+def iniciar_geracao_gui(registros):
+    """Gera os registros em segundo plano e mostra o relatório ao final."""
+    from tkinter import messagebox
+
+    def ao_concluir(relatorio):
+        if relatorio is None: return
+        # Os registros marcados como GERADO saem da lista; a sessão (cliente e dados) continua carregada para o próximo lote
+        popular_listas(dados_pf_processados, dados_pj_processados)
+        imprimir_resumo_instrumentacao("Resumo por etapa (sessão)")
+        messagebox.showinfo("Relatório Final da Geração", montar_relatorio_geracao(relatorio))
+
+    # A geração roda fora da thread da interface; o progresso chega pela fila e a janela continua responsiva
+    executar_em_segundo_plano("Gerando", lambda: gerar_documentos(registros, _progresso_gui, _evento_cancelar), ao_concluir,
+                              total=len(registros), cancelavel=True)
+
+def oferecer_retomada_gui():
+    """Se o último lote foi interrompido, pergunta se deve retomá-lo (os registros já prontos não são gerados de novo)."""
+    from tkinter import messagebox
+    diario = ler_diario()
+    if not diario: return
+    registros = registros_do_diario(diario, dados_pf_processados + dados_pj_processados)
+    concluidos = len(set(diario['concluidos']) - diario['status_gravados'])
+    if registros and messagebox.askyesno("Lote Interrompido", f"A última geração foi interrompida: {len(registros)} registro(s) no lote, "
+                                         f"{concluidos} já com documentos prontos aguardando o status.\n\nRetomar agora?"):
+        iniciar_geracao_gui(registros)
+
+
+def excluir_registros(registros):
+    """Exclui as linhas dos registros nas fontes (planilhas ou arquivos locais). Retorna (qtd_excluida, erros) ou None se não pôde iniciar."""
+    global sheet_pf, sheet_pj
+
+    print(f"\n--- Excluindo {len(registros)} registro(s) ---")
+    excluidos_count = 0; erros_exclusao = []; linhas_pf = []; linhas_pj = []
+    if sheet_pf is None or sheet_pj is None:
+        notificar('erro', "Erro Interno", "Planilhas não carregadas: não é possível excluir."); return None
+
+    # Separa as linhas de cada fonte
+    for pessoa_dict in registros:
         linha = pessoa_dict.get("linha"); tipo = pessoa_dict.get("tipo")
         nome = str(pessoa_dict.get("NOME COMPLETO", pessoa_dict.get("RAZÃO SOCIAL", "Reg Desconhecido"))).strip()
         if not isinstance(linha, int) or linha < 2:
              msg = f"Exclusão: Linha inválida ({linha}) para {nome}."; print(f"⚠️ {msg}"); erros_exclusao.append(msg); continue
-
-        start_idx = linha - 1; end_idx = linha # API usa índice 0-based
-        delete_req = {'deleteDimension': {'range': {'sheetId': None, 'dimension': 'ROWS', 'startIndex': start_idx, 'endIndex': end_idx}}}
-        if tipo == "PF":
-             delete_req['deleteDimension']['range']['sheetId'] = sheet_id_pf; requests_pf.append(delete_req)
-        elif tipo == "PJ":
-             delete_req['deleteDimension']['range']['sheetId'] = sheet_id_pj; requests_pj.append(delete_req)
+        if tipo == "PF": linhas_pf.append(linha)
+        elif tipo == "PJ": linhas_pj.append(linha)
         else:
              msg = f"Exclusão: Tipo '{tipo}' desconhecido L{linha}."; print(f"⚠️ {msg}"); erros_exclusao.append(msg)
 
-    # Função auxiliar para executar o batchUpdate de exclusão por planilha
-    def executar_exclusao(sheet_obj, requests, tipo_label):
+    # Função auxiliar para executar a exclusão em uma fonte
+    def executar_exclusao(fonte, linhas, tipo_label):
         count = 0
-        if requests:
-            print(f" Executando {len(requests)} exclusões na planilha {tipo_label} ('{sheet_obj.title}')...")
+        if linhas:
+            acao = "arquivamentos" if MODO_EXCLUSAO == "arquivar" else "exclusões"
+            print(f" Executando {len(linhas)} {acao} na planilha {tipo_label} ('{fonte.title}')...")
             try:
-                # Exclusão é feita no objeto spreadsheet, não no worksheet
-                sheet_obj.spreadsheet.batch_update({'requests': requests})
-                print(f"   > Exclusões {tipo_label} concluídas."); count = len(requests)
+                if MODO_EXCLUSAO == "arquivar": fonte.arquivar_linhas(linhas) # Copiadas para a aba de excluídos e excluídas
+                else: fonte.excluir_linhas(linhas)
+                print(f"   > Exclusões {tipo_label} concluídas."); count = len(linhas)
+                aplicar_exclusao_em_memoria(tipo_label, linhas)
+                pre_preenchimento_remover_linhas(fonte, linhas)
             except gspread.exceptions.APIError as e:
                  msg = f"Erro API Google ao excluir {tipo_label}: {e}"; print(f"❌ {msg}"); erros_exclusao.append(msg)
             except Exception as e:
@@ -609,40 +2860,234 @@ def excluir_entradas_cmd():
         return count
 
     # Executa as exclusões para PF e PJ
-    excluidos_count += executar_exclusao(sheet_pf, requests_pf, "PF")
-    excluidos_count += executar_exclusao(sheet_pj, requests_pj, "PJ")
+    excluidos_count += executar_exclusao(sheet_pf, linhas_pf, "PF")
+    excluidos_count += executar_exclusao(sheet_pj, linhas_pj, "PJ")
 
-    # Mostra relatório final da exclusão
-    msg_final = [f"{excluidos_count} registro(s) efetivamente excluído(s) (comando API enviado)."]
-    if erros_exclusao: msg_final.extend(["\n--- Ocorrências Durante Exclusão ---"] + erros_exclusao)
-    messagebox.showinfo("Relatório de Exclusão", "\n".join(msg_final))
+    return excluidos_count, erros_exclusao
 
-    # Fecha a janela para recarregar
-    print("Recarregando interface após exclusão...")
-    try:
-        if root and root.winfo_exists(): root.destroy()
-    except tk.TclError: pass
+def excluir_entradas_cmd():
+    """Função chamada pelo botão 'Excluir da Planilha'."""
+    from tkinter import messagebox
+
+    registros = registros_selecionados_gui()
+    if not registros: messagebox.showwarning("Aviso", "Nenhum registro selecionado."); return
+    if MODO_EXCLUSAO == "arquivar":
+        aviso = f"As linhas serão movidas para as abas '...{SUFIXO_ARQUIVO_EXCLUIDOS}'."
+    else:
+        aviso = "ESTA AÇÃO NÃO PODE SER DESFEITA."
+    confirm = messagebox.askyesno("Confirmar Exclusão", f"Tem certeza que deseja excluir {len(registros)} registro(s) da(s) planilha(s)?\n\n{aviso}")
+    if not confirm: return
+
+    def ao_concluir(resultado):
+        if resultado is None: return
+        excluidos_count, erros_exclusao = resultado
+
+        # Mostra relatório final da exclusão
+        msg_final = [f"{excluidos_count} registro(s) efetivamente excluído(s) (comando API enviado)."]
+        if erros_exclusao: msg_final.extend(["\n--- Ocorrências Durante Exclusão ---"] + erros_exclusao)
+        # excluir_registros já removeu as linhas da sessão e deslocou as seguintes
+        popular_listas(dados_pf_processados, dados_pj_processados)
+        messagebox.showinfo("Relatório de Exclusão", "\n".join(msg_final))
+
+    executar_em_segundo_plano("Excluindo", lambda: excluir_registros(registros), ao_concluir)
 
 
 # ==============================================================================
 # 7. FUNÇÕES DA INTERFACE GRÁFICA (Tkinter)
 # ==============================================================================
-def adicionar_checkbox(pessoa_data, parent_frame, checkboxes_list):
-    """Cria e adiciona um checkbox para uma pessoa/empresa na interface."""
-    var = tk.BooleanVar() # Variável Tkinter para controlar o estado (marcado/desmarcado)
-    nome = str(pessoa_data.get("NOME COMPLETO", pessoa_data.get("RAZÃO SOCIAL", "N/A"))).strip()
-    placa = str(pessoa_data.get("PLACA", "N/A")).strip()
-    max_len_nome = 35 # Limita o tamanho do nome exibido para não alargar muito
-    nome_display = f"{nome[:max_len_nome]}..." if len(nome) > max_len_nome else nome
-    texto = f"{nome_display} - {placa}" # Texto do checkbox
-    # Cria o checkbox dentro do frame pai (frame_pf ou frame_pj)
-    cb = tk.Checkbutton(parent_frame, text=texto, variable=var, anchor="w", justify="left", wraplength=350)
-    cb.pack(fill="x", padx=5, pady=1) # Adiciona ao frame pai
-    checkboxes_list.append((pessoa_data, var)) # Guarda o dicionário de dados e a variável Tkinter
+# --- Execução em segundo plano ---
+# Operações longas (carregar, gerar, excluir) rodam numa thread de trabalho; ela só conversa com a interface
+# pela fila _fila_gui, consumida periodicamente por _processar_fila_gui na thread do Tkinter (root.after).
+_widgets_gui = {}        # Widgets atualizados fora de criar_interface (listas, progresso, botões)
+_tarefa_gui = None       # Operação em andamento: {'titulo', 'inicio', 'total', 'documentos'} ou None
+_evento_cancelar = None  # threading.Event da operação atual (botão Cancelar)
+_codigo_saida_gui = SAIDA_OK
+
+def executar_em_segundo_plano(titulo, funcao, ao_concluir, total=0, cancelavel=False, ao_falhar=None):
+    """Roda `funcao()` numa thread de trabalho; `ao_concluir(resultado)` ou `ao_falhar(erro)` rodam depois na thread da interface."""
+    from tkinter import messagebox
+    global _tarefa_gui, _evento_cancelar
+    if _tarefa_gui is not None:
+        messagebox.showwarning("Aguarde", f"Já existe uma operação em andamento ({_tarefa_gui['titulo']}).")
+        return
+    _evento_cancelar = threading.Event()
+    _tarefa_gui = {'titulo': titulo, 'inicio': time.perf_counter(), 'total': total, 'documentos': 0}
+    _atualizar_controles_gui(ocupado=True, cancelavel=cancelavel)
+    _exibir_progresso(0, total)
+
+    def alvo():
+        try:
+            resultado, erro = funcao(), None
+        except BaseException as e: # Inclui SystemExit dos erros fatais de carregamento
+            resultado, erro = None, e
+        _fila_gui.put(('concluido', ao_concluir, ao_falhar, resultado, erro))
+
+    threading.Thread(target=alvo, name=f"autodocs-{titulo}", daemon=True).start()
+
+def _progresso_gui(feitos, total, resultado):
+    """Callback de progresso da geração (roda na thread de trabalho): só enfileira."""
+    _fila_gui.put(('progresso', feitos, total, resultado['documentos']))
+
+def _processar_fila_gui():
+    """Consome as mensagens das threads de trabalho; reagenda a si mesmo enquanto a janela existir."""
+    import tkinter as tk
+    global _tarefa_gui
+    try:
+        while True:
+            mensagem = _fila_gui.get_nowait()
+            if mensagem[0] == 'progresso':
+                _, feitos, total, documentos = mensagem
+                _tarefa_gui['documentos'] += documentos
+                _exibir_progresso(feitos, total)
+            elif mensagem[0] == 'notificar':
+                notificar(*mensagem[1:]) # Agora na thread da interface: vira messagebox
+            elif mensagem[0] == 'concluido':
+                _, ao_concluir, ao_falhar, resultado, erro = mensagem
+                _tarefa_gui = None
+                _atualizar_controles_gui(ocupado=False)
+                if erro is None: ao_concluir(resultado)
+                else: (ao_falhar or _falha_tarefa_gui)(erro)
+    except queue.Empty:
+        pass
+    try:
+        if root and root.winfo_exists(): root.after(100, _processar_fila_gui)
+    except tk.TclError: pass # Janela destruída durante o processamento da fila
+
+def _falha_tarefa_gui(erro):
+    """Tratamento padrão de erro inesperado numa operação em segundo plano (a janela continua aberta)."""
+    from tkinter import messagebox
+    if isinstance(erro, SystemExit): return # Erro de planilha: a mensagem já foi exibida por carregar_planilha
+    print(f"ERRO NA OPERAÇÃO EM SEGUNDO PLANO: {type(erro).__name__} - {erro}")
+    messagebox.showerror("Erro Inesperado", f"A operação falhou:\n{type(erro).__name__}: {erro}\n\nVerifique o console para detalhes técnicos.")
+
+def _falha_fatal_gui(erro):
+    """Erro no carregamento inicial: mostra a mensagem (se ainda não mostrada) e encerra a aplicação."""
+    import tkinter as tk
+    from tkinter import messagebox
+    global _codigo_saida_gui
+    if isinstance(erro, SystemExit): # A mensagem já foi exibida por carregar_planilha/carregar_sessao
+        _codigo_saida_gui = erro.code if isinstance(erro.code, int) else SAIDA_ERRO_FATAL
+    elif isinstance(erro, FileNotFoundError):
+        print(f"ERRO FATAL: Arquivo não encontrado - {erro}")
+        messagebox.showerror("Erro Fatal - Arquivo Não Encontrado", f"Não foi possível encontrar um arquivo essencial:\n{erro}\n\nVerifique se o arquivo '{CAMINHO_CREDENCIAL_REL}' está na pasta correta.")
+        _codigo_saida_gui = SAIDA_ERRO_FATAL
+    else:
+        print(f"ERRO FATAL NA EXECUÇÃO PRINCIPAL: {type(erro).__name__} - {erro}")
+        import traceback
+        traceback.print_exception(type(erro), erro, erro.__traceback__) # Imprime detalhes do erro no console
+        messagebox.showerror("Erro Fatal Inesperado", f"Ocorreu um erro crítico:\n{type(erro).__name__}: {erro}\n\nVerifique o console para detalhes técnicos.")
+        _codigo_saida_gui = SAIDA_ERRO_FATAL
+    try:
+        if root and root.winfo_exists(): root.destroy()
+    except tk.TclError: pass
+
+def _atualizar_controles_gui(ocupado, cancelavel=False):
+    """Habilita/desabilita os botões conforme há ou não operação em andamento."""
+    if not _widgets_gui: return
+    _widgets_gui['btn_gerar'].config(state="disabled" if ocupado else "normal")
+    _widgets_gui['btn_recarregar'].config(state="disabled" if ocupado else "normal")
+    _widgets_gui['btn_cancelar'].config(state="normal" if ocupado and cancelavel else "disabled")
+    barra = _widgets_gui['barra']
+    if not ocupado:
+        barra.stop(); barra.config(mode="determinate", value=0)
+        _widgets_gui['label_progresso'].config(text="Pronto.")
+
+def _exibir_progresso(feitos, total):
+    """Atualiza barra e texto de progresso (registros, documentos e tempo restante estimado)."""
+    if not _widgets_gui or _tarefa_gui is None: return
+    barra, label = _widgets_gui['barra'], _widgets_gui['label_progresso']
+    titulo = _tarefa_gui['titulo']
+    if not total: # Duração desconhecida (carregamento, exclusão): barra em modo indeterminado
+        if str(barra.cget('mode')) != "indeterminate": barra.config(mode="indeterminate"); barra.start(15)
+        label.config(text=f"{titulo}...")
+        return
+    barra.config(mode="determinate", maximum=total, value=feitos)
+    decorrido = time.perf_counter() - _tarefa_gui['inicio']
+    texto = f"{titulo}: {feitos}/{total} registros | {_tarefa_gui['documentos']} documentos"
+    if feitos:
+        restante = decorrido / feitos * (total - feitos)
+        texto += f" | ETA {int(restante // 60):02d}:{int(restante % 60):02d}"
+    if _evento_cancelar is not None and _evento_cancelar.is_set():
+        texto += " | Cancelando após o registro atual..."
+    label.config(text=texto)
+
+def recarregar_planilhas_cmd():
+    """Função chamada pelo botão 'Recarregar Planilhas': relê as abas (só o que mudou) com o cliente já autenticado."""
+    executar_em_segundo_plano("Recarregando planilhas", lambda: carregar_sessao(executar_prefill=True),
+                              lambda _: popular_listas(dados_pf_processados, dados_pj_processados))
+
+def cancelar_operacao_cmd():
+    """Botão 'Cancelar': a operação para na fronteira do próximo registro (status dos concluídos é enviado)."""
+    if _evento_cancelar is not None and _tarefa_gui is not None:
+        _evento_cancelar.set()
+        _widgets_gui['btn_cancelar'].config(state="disabled")
+        _widgets_gui['label_progresso'].config(text=f"{_tarefa_gui['titulo']}: cancelando após o registro atual...")
+
+
+class ListaRegistros:
+    """Lista PF ou PJ sobre um ttk.Treeview: os itens não são widgets e a seleção fica num set de linhas da planilha.
+
+    O custo de abrir e rolar a janela não cresce com o nº de widgets, e selecionar/desmarcar todos é uma única
+    chamada ao Treeview. Clique alterna o item (como um checkbox); Shift+clique seleciona um intervalo.
+    """
+    def __init__(self, parent, titulo):
+        import tkinter as tk
+        from tkinter import ttk
+        self.titulo = titulo
+        self.registros = {}       # linha da planilha -> dicionário do registro
+        self.selecionados = set() # linhas da planilha selecionadas
+        self.frame = tk.LabelFrame(parent, text=titulo, padx=5, pady=5, font=('Segoe UI', 9, 'bold'))
+        self.tree = ttk.Treeview(self.frame, columns=("linha", "nome", "placa"), show="headings", selectmode="extended")
+        for coluna, texto, largura, esticar in (("linha", "Linha", 55, False), ("nome", "Nome", 230, True), ("placa", "Placa", 90, False)):
+            self.tree.heading(coluna, text=texto)
+            self.tree.column(coluna, width=largura, stretch=esticar, anchor="w")
+        scrollbar_y = ttk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar_y.set)
+        scrollbar_y.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
+        self.tree.bind("<Button-1>", self._ao_clicar)
+        self.tree.bind("<<TreeviewSelect>>", self._ao_mudar_selecao)
+
+    def popular(self, registros):
+        """Substitui o conteúdo da lista pelos registros informados (a seleção é limpa)."""
+        self.tree.delete(*self.tree.get_children())
+        self.registros = {pessoa["linha"]: pessoa for pessoa in registros}
+        self.selecionados.clear()
+        for linha, pessoa in self.registros.items():
+            nome = str(pessoa.get("NOME COMPLETO", pessoa.get("RAZÃO SOCIAL", "N/A"))).strip()
+            placa = str(pessoa.get("PLACA", "N/A")).strip()
+            self.tree.insert("", "end", iid=str(linha), values=(linha, nome, placa))
+        self.frame.config(text=f"{self.titulo} ({len(self.registros)} visíveis)")
+
+    def _ao_clicar(self, event):
+        if event.state & 0x0001: return None # Shift+clique: deixa o Treeview estender a seleção
+        item = self.tree.identify_row(event.y)
+        if item:
+            self.tree.selection_toggle(item)
+            self.tree.focus(item)
+        return "break" # Impede que o clique simples desmarque os demais itens
+
+    def _ao_mudar_selecao(self, _event=None):
+        self.selecionados = {int(item) for item in self.tree.selection()}
+
+    def selecionar_todos(self):
+        self.tree.selection_set(self.tree.get_children())
+
+    def desmarcar_todos(self):
+        self.tree.selection_set(())
+
+    def registros_selecionados(self):
+        """Registros selecionados, na ordem das linhas da planilha."""
+        return [self.registros[linha] for linha in sorted(self.selecionados) if linha in self.registros]
+
+def registros_selecionados_gui():
+    """Registros selecionados nas listas PF e PJ."""
+    return (lista_pf.registros_selecionados() if lista_pf else []) + (lista_pj.registros_selecionados() if lista_pj else [])
 
 def criar_interface(root_window, dados_pf, dados_pj):
     """Cria todos os elementos da interface gráfica principal."""
-    global checkboxes_pf, checkboxes_pj # Permite que esta função popule as listas globais
+    import tkinter as tk
+    from tkinter import ttk
 
     # Configurações da janela principal
     root_window.title("Autodocs - Gerador de Documentos v1.3")
@@ -658,126 +3103,307 @@ def criar_interface(root_window, dados_pf, dados_pj):
     frame_botoes_principais.pack(pady=10, fill="x")
     btn_gerar = tk.Button(frame_botoes_principais, text="Gerar Documentos Selecionados", command=gerar_documentos_cmd, width=30, height=2, bg="#D0F0D0", font=('Segoe UI', 10, 'bold')) # Cor verde clara
     btn_gerar.pack(side=tk.TOP, pady=5)
+    btn_recarregar = tk.Button(frame_botoes_principais, text="Recarregar Planilhas", command=recarregar_planilhas_cmd, width=20)
+    btn_recarregar.pack(side=tk.TOP)
     # Botão de excluir foi removido/comentado em versões anteriores, mantendo assim.
 
-    # --- Área Rolável (Centro) ---
-    frame_scroll_container = tk.Frame(main_frame)
-    frame_scroll_container.pack(pady=5, padx=10, fill="both", expand=True)
-    canvas = tk.Canvas(frame_scroll_container)
-    scrollbar_y = tk.Scrollbar(frame_scroll_container, orient=tk.VERTICAL, command=canvas.yview)
-    scrollbar_x = tk.Scrollbar(frame_scroll_container, orient=tk.HORIZONTAL, command=canvas.xview)
-    canvas.configure(yscrollcommand=scrollbar_y.set, xscrollcommand=scrollbar_x.set)
-    scrollbar_y.pack(side=tk.RIGHT, fill=tk.Y)
-    scrollbar_x.pack(side=tk.BOTTOM, fill=tk.X)
-    canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
-    # Frame interno que conterá os checkboxes e rolará com o canvas
-    frame_content = tk.Frame(canvas)
-    canvas.create_window((0, 0), window=frame_content, anchor="nw", tags="frame_content")
-    # Função para atualizar a região de rolagem quando o tamanho do frame interno mudar
-    def on_frame_configure(event): canvas.configure(scrollregion=canvas.bbox("all"))
-    frame_content.bind("<Configure>", on_frame_configure)
-
-    # --- Frames PF e PJ (Dentro da Área Rolável, usando Grid) ---
-    frame_content.columnconfigure(0, weight=1) # Coluna PF expande
-    frame_content.columnconfigure(1, weight=1) # Coluna PJ expande
-    frame_pf = tk.LabelFrame(frame_content, text=f"PESSOA FÍSICA ({len(dados_pf)})", padx=10, pady=10, font=('Segoe UI', 9, 'bold'))
-    frame_pf.grid(row=0, column=0, padx=10, pady=5, sticky="nsew") # Ocupa espaço disponível
-    frame_pj = tk.LabelFrame(frame_content, text=f"PESSOA JURÍDICA ({len(dados_pj)})", padx=10, pady=10, font=('Segoe UI', 9, 'bold'))
-    frame_pj.grid(row=0, column=1, padx=10, pady=5, sticky="nsew")
-
-    # --- Populando Checkboxes ---
-    checkboxes_pf.clear(); checkboxes_pj.clear() # Limpa listas caso a interface seja recarregada
-    print(f"\nPopulando Interface...")
-    count_pf_visivel, count_pf_gerado = 0, 0
-    for pessoa in dados_pf:
-        if str(pessoa.get(STATUS_COL, "")).strip().upper() != "GERADO":
-            adicionar_checkbox(pessoa, frame_pf, checkboxes_pf)
-            count_pf_visivel += 1
-        else: count_pf_gerado += 1
-
-    count_pj_visivel, count_pj_gerado = 0, 0
-    for pessoa in dados_pj:
-        if str(pessoa.get(STATUS_COL, "")).strip().upper() != "GERADO":
-            adicionar_checkbox(pessoa, frame_pj, checkboxes_pj)
-            count_pj_visivel += 1
-        else: count_pj_gerado += 1
-
-    print(f" PF: {count_pf_visivel} para exibir ({count_pf_gerado} já 'GERADO'). Total: {len(dados_pf)}")
-    print(f" PJ: {count_pj_visivel} para exibir ({count_pj_gerado} já 'GERADO'). Total: {len(dados_pj)}")
-    # Atualiza títulos dos frames com contagem visível
-    frame_pf.config(text=f"PESSOA FÍSICA ({count_pf_visivel} visíveis)")
-    frame_pj.config(text=f"PESSOA JURÍDICA ({count_pj_visivel} visíveis)")
-
+    # --- Progresso da operação em segundo plano (barra, texto com ETA e Cancelar) ---
+    frame_progresso = tk.Frame(main_frame)
+    frame_progresso.pack(pady=(0, 5), padx=20, fill="x")
+    barra = ttk.Progressbar(frame_progresso, orient=tk.HORIZONTAL, mode="determinate")
+    barra.pack(side=tk.LEFT, fill="x", expand=True)
+    btn_cancelar = tk.Button(frame_progresso, text="Cancelar", command=cancelar_operacao_cmd, width=10, state="disabled")
+    btn_cancelar.pack(side=tk.RIGHT, padx=(10, 0))
+    label_progresso = tk.Label(main_frame, text="Pronto.", anchor="w", font=('Segoe UI', 8))
+    label_progresso.pack(padx=20, fill="x")
+
+    # --- Listas PF e PJ (Centro, lado a lado) ---
+    global lista_pf, lista_pj
+    frame_listas = tk.Frame(main_frame)
+    frame_listas.pack(pady=5, padx=10, fill="both", expand=True)
+    frame_listas.columnconfigure(0, weight=1) # Coluna PF expande
+    frame_listas.columnconfigure(1, weight=1) # Coluna PJ expande
+    frame_listas.rowconfigure(0, weight=1)
+    lista_pf = ListaRegistros(frame_listas, "PESSOA FÍSICA")
+    lista_pf.frame.grid(row=0, column=0, padx=10, pady=5, sticky="nsew") # Ocupa espaço disponível
+    lista_pj = ListaRegistros(frame_listas, "PESSOA JURÍDICA")
+    lista_pj.frame.grid(row=0, column=1, padx=10, pady=5, sticky="nsew")
+
+    _widgets_gui.update(btn_gerar=btn_gerar, btn_recarregar=btn_recarregar, btn_cancelar=btn_cancelar, barra=barra, label_progresso=label_progresso)
+    popular_listas(dados_pf, dados_pj)
 
     # --- Botões de Seleção (Fundo, acima do label dev) ---
     frame_botoes_selecao = tk.Frame(main_frame)
     frame_botoes_selecao.pack(pady=(5,5), fill="x", side=tk.BOTTOM)
-    def selecionar(lista): [var.set(True) for _, var in lista]
-    def desmarcar(lista): [var.set(False) for _, var in lista]
     # Organiza botões em frames para melhor distribuição
     frame_sel_pf = tk.Frame(frame_botoes_selecao)
     frame_sel_pf.pack(side=tk.LEFT, expand=True, fill='x', padx=10)
-    tk.Button(frame_sel_pf, text="Selecionar Todos PF", command=lambda: selecionar(checkboxes_pf), width=18).pack(side=tk.LEFT, padx=5)
-    tk.Button(frame_sel_pf, text="Desmarcar Todos PF", command=lambda: desmarcar(checkboxes_pf), width=18).pack(side=tk.LEFT, padx=5)
+    tk.Button(frame_sel_pf, text="Selecionar Todos PF", command=lambda: lista_pf.selecionar_todos(), width=18).pack(side=tk.LEFT, padx=5)
+    tk.Button(frame_sel_pf, text="Desmarcar Todos PF", command=lambda: lista_pf.desmarcar_todos(), width=18).pack(side=tk.LEFT, padx=5)
 
     frame_sel_pj = tk.Frame(frame_botoes_selecao)
     frame_sel_pj.pack(side=tk.RIGHT, expand=True, fill='x', padx=10)
-    tk.Button(frame_sel_pj, text="Selecionar Todos PJ", command=lambda: selecionar(checkboxes_pj), width=18).pack(side=tk.LEFT, padx=5)
-    tk.Button(frame_sel_pj, text="Desmarcar Todos PJ", command=lambda: desmarcar(checkboxes_pj), width=18).pack(side=tk.LEFT, padx=5)
+    tk.Button(frame_sel_pj, text="Selecionar Todos PJ", command=lambda: lista_pj.selecionar_todos(), width=18).pack(side=tk.LEFT, padx=5)
+    tk.Button(frame_sel_pj, text="Desmarcar Todos PJ", command=lambda: lista_pj.desmarcar_todos(), width=18).pack(side=tk.LEFT, padx=5)
 
     # --- Label (Fundo) ---
     label_dev = tk.Label(main_frame, text='Desenvolvido por Lucas Costa', font=('Segoe UI', 8))
     label_dev.pack(pady=(0,5), side=tk.BOTTOM)
 
 
+def popular_listas(dados_pf, dados_pj):
+    """(Re)preenche as listas PF/PJ com os registros ainda não gerados."""
+    print(f"\nPopulando Interface...")
+    pendentes_pf, pendentes_pj = registros_pendentes(dados_pf), registros_pendentes(dados_pj)
+    lista_pf.popular(pendentes_pf)
+    lista_pj.popular(pendentes_pj)
+    print(f" PF: {len(pendentes_pf)} para exibir ({len(dados_pf) - len(pendentes_pf)} já 'GERADO'). Total: {len(dados_pf)}")
+    print(f" PJ: {len(pendentes_pj)} para exibir ({len(dados_pj) - len(pendentes_pj)} já 'GERADO'). Total: {len(dados_pj)}")
+
+
 # ==============================================================================
-# 8. EXECUÇÃO PRINCIPAL
+# 8. MODO LINHA DE COMANDO (sem interface, ex.: cron em servidor sem display)
 # ==============================================================================
-if __name__ == "__main__":
+_saida_maquina = sys.stdout # Destino das linhas JSON de progresso (o stdout original)
+
+def _emitir_json(evento, **campos):
+    """Escreve uma linha JSON de progresso no stdout original (legível por máquina)."""
+    if evento == 'resumo': # Chamadas, retentativas e tempo de espera por cota; p50/p95 por etapa e contadores
+        campos['api'] = agendador_api.resumo()
+        campos['instrumentacao'] = resumo_instrumentacao()
+    print(json.dumps({'evento': evento, **campos}, ensure_ascii=False), file=_saida_maquina, flush=True)
+
+def _parse_linhas(especificacoes):
+    """Converte ['PF:2,5-7', 'PJ:10'] no conjunto {('PF', 2), ('PF', 5), ('PF', 6), ('PF', 7), ('PJ', 10)}."""
+    selecao = set()
+    for especificacao in especificacoes:
+        tipo, _, faixas = especificacao.partition(':')
+        tipo = tipo.strip().upper()
+        if tipo not in ("PF", "PJ") or not faixas:
+            raise ValueError(f"Especificação de linhas inválida: '{especificacao}' (use PF:2,5-7 ou PJ:10)")
+        for faixa in faixas.split(','):
+            inicio, _, fim = faixa.strip().partition('-')
+            inicio, fim = int(inicio), int(fim or inicio)
+            if inicio < 2 or fim < inicio:
+                raise ValueError(f"Faixa de linhas inválida: '{faixa}' (a linha 1 é o cabeçalho)")
+            selecao.update((tipo, linha) for linha in range(inicio, fim + 1))
+    return selecao
+
+def _selecionar_por_linhas(selecao):
+    """Registros da sessão correspondentes a {(tipo, linha)}; avisa sobre linhas inexistentes."""
+    encontrados = [p for p in dados_pf_processados + dados_pj_processados if (p['tipo'], p['linha']) in selecao]
+    faltantes = selecao - {(p['tipo'], p['linha']) for p in encontrados}
+    for tipo, linha in sorted(faltantes): log.warning("Linha %s:%d não existe na planilha (ignorada).", tipo, linha)
+    return encontrados
+
+def _cli_generate(args):
+    selecao = _parse_linhas(args.rows) if args.rows else None # Valida antes de autenticar
+    carregar_sessao(executar_prefill=not args.no_prefill)
+    if args.resume:
+        diario = ler_diario()
+        if not diario: log.info("Nenhum lote interrompido para retomar.")
+        registros = registros_do_diario(diario, dados_pf_processados + dados_pj_processados) if diario else []
+    elif selecao is None:
+        registros = registros_pendentes(dados_pf_processados) + registros_pendentes(dados_pj_processados)
+    else:
+        registros = _selecionar_por_linhas(selecao)
+    if args.tipo: registros = [p for p in registros if p['tipo'] == args.tipo]
+    if not registros:
+        log.info("Nenhum registro a gerar.")
+        _emitir_json('resumo', comando='generate', registros=0, documentos=0, segundos=0.0, registros_por_s=0.0, docs_por_s=0.0)
+        return SAIDA_OK
+
+    def progresso(feitos, total, resultado):
+        _emitir_json('registro', feitos=feitos, total=total, tipo=resultado['tipo'], linha=resultado['linha'],
+                     ok=resultado['ok'], documentos=resultado['documentos'], pulados=resultado['pulados'], erros=resultado['erros_template'] + resultado['erros_geracao'])
+
+    inicio = time.perf_counter()
+    relatorio = gerar_documentos(registros, progresso)
+    if relatorio is None: return SAIDA_ERRO_FATAL
+    segundos = time.perf_counter() - inicio
+    log.info("%s", montar_relatorio_geracao(relatorio))
+    _emitir_json('resumo', comando='generate', registros=relatorio['registros'], documentos=relatorio['documentos'],
+                 documentos_pulados=relatorio['documentos_pulados'], documentos_falhos=relatorio['documentos_falhos'],
+                 retomados=relatorio['retomados'], status_atualizados=relatorio['status_atualizados'], escrita_planilha=relatorio['escrita_planilha'],
+                 erros_geracao=len(relatorio['erros_geracao']), arquivos_zip=relatorio['arquivos_zip'], indice_zip=relatorio['indice_zip'],
+                 erros_template=len(relatorio['erros_template']), erros_atualizacao=len(relatorio['erros_atualizacao']),
+                 segundos=round(segundos, 3), registros_por_s=round(relatorio['registros'] / segundos, 2),
+                 docs_por_s=round(relatorio['documentos'] / segundos, 2))
+    com_erros = relatorio['erros_template'] or relatorio['erros_geracao'] or relatorio['erros_atualizacao']
+    return SAIDA_COM_ERROS if com_erros else SAIDA_OK
+
+def _cli_prefill(args):
+    inicio = time.perf_counter()
+    carregar_sessao(executar_prefill=True)
+    _emitir_json('resumo', comando='prefill', registros_pf=len(dados_pf_processados), registros_pj=len(dados_pj_processados),
+                 segundos=round(time.perf_counter() - inicio, 3))
+    return SAIDA_OK
+
+def _cli_delete(args):
+    selecao = _parse_linhas(args.rows)
+    if not args.yes:
+        log.error("Exclusão de %d linha(s) não confirmada: repita o comando com --yes.", len(selecao))
+        return SAIDA_USO
+    carregar_sessao(executar_prefill=False)
+    registros = _selecionar_por_linhas(selecao)
+    resultado = excluir_registros(registros) if registros else (0, [])
+    if resultado is None: return SAIDA_ERRO_FATAL
+    excluidos_count, erros_exclusao = resultado
+    for erro in erros_exclusao: log.error("%s", erro)
+    _emitir_json('resumo', comando='delete', solicitados=len(selecao), excluidos=excluidos_count, erros=len(erros_exclusao))
+    return SAIDA_COM_ERROS if erros_exclusao else SAIDA_OK
+
+def _tempo_extracao_onefile():
+    """No .exe --onefile, estima o tempo de extração do pacote + início do interpretador (None fora dele)."""
+    pasta = getattr(sys, '_MEIPASS', None)
+    if not pasta or not Path(pasta).name.startswith('_MEI'): return None # Onedir (ou script): não há extração
+    return max(0.0, time.time() - os.stat(pasta).st_ctime - (time.perf_counter() - _INICIO_MODULO))
+
+def relatorio_partida(etapa):
+    """Com PERFIL_PARTIDA, imprime no stderr o tempo até `etapa` e as importações feitas até aqui, da mais lenta para a mais rápida."""
+    if not PERFIL_PARTIDA: return
+    linhas = [f"--- Perfil de partida: {etapa} ---"]
+    if _EXTRACAO_ONEFILE is not None:
+        linhas.append(f" {'extração onefile + interpretador':<34} {_EXTRACAO_ONEFILE:7.3f} s")
+    linhas.append(f" {'módulo autodocs (stdlib)':<34} {_DURACAO_MODULO:7.3f} s")
+    for nome, segundos in sorted(_tempos_importacao.items(), key=lambda item: -item[1]):
+        linhas.append(f" {'import ' + nome:<34} {segundos:7.3f} s")
+    linhas.append(f" {'total desde o início do autodocs':<34} {time.perf_counter() - _INICIO_MODULO:7.3f} s")
+    print("\n".join(linhas), file=sys.stderr)
+
+def criar_parser_cli():
+    """Parser dos argumentos da linha de comando."""
+    parser = argparse.ArgumentParser(prog="autodocs", description="Gerador de documentos a partir das planilhas de cadastro. Sem argumentos, abre a interface gráfica.")
+    parser.add_argument('--debug', action='store_true', help="Logs detalhados (equivale a DEBUG_MODE = True)")
+    parser.add_argument('--motor-docx', choices=["python-docx", "zip"], help="Motor de geração DOCX (padrão: MOTOR_DOCX)")
+    parser.add_argument('--motor-xlsx', choices=["zip", "openpyxl"], help="Motor de geração XLSX (padrão: MOTOR_XLSX)")
+    parser.add_argument('--resync', action='store_true', help="Descarta o snapshot local e baixa as abas inteiras (equivale a FORCAR_RESYNC = True)")
+    parser.add_argument('--profile-startup', action='store_true', help="Imprime no stderr o tempo de partida e de importação/extração por módulo")
+    parser.add_argument('--log-json', metavar="ARQUIVO", help="Grava spans, contadores e avisos como JSON-lines neste arquivo (equivale a ARQUIVO_LOG_JSON)")
+    parser.add_argument('--source', action='append', metavar="TIPO=ARQUIVO", help="Lê e atualiza PF ou PJ num arquivo local (CSV, XLSX ou SQLite, com #aba/#tabela opcional) em vez do Google Sheets; pode repetir (equivale a FONTES_LOCAIS)")
+    parser.add_argument('--verify-prefill', action='store_true', help="No pré-preenchimento, confere as linhas fonte já usadas e repropaga edições para as linhas alvo (equivale a VERIFICAR_PRE_PREENCHIMENTO = True)")
+    parser.add_argument('--tracemalloc', action='store_true', help="Inclui o pico de memória no resumo por etapa (equivale a MEDIR_MEMORIA = True)")
+    subparsers = parser.add_subparsers(dest='comando') # Sem subcomando: interface gráfica
+
+    subparsers.add_parser('gui', help="Abre a interface gráfica (padrão sem argumentos)")
+
+    p_generate = subparsers.add_parser('generate', help="Gera documentos e marca os registros como GERADO")
+    grupo = p_generate.add_mutually_exclusive_group(required=True)
+    grupo.add_argument('--all-pending', action='store_true', help="Todos os registros ainda não marcados como GERADO")
+    grupo.add_argument('--rows', nargs='+', metavar="TIPO:LINHAS", help="Linhas da planilha, ex.: PF:2,5-7 PJ:10")
+    grupo.add_argument('--resume', action='store_true', help="Retoma o lote interrompido registrado no diário de geração")
+    p_generate.add_argument('--tipo', choices=["PF", "PJ"], help="Restringe a PF ou PJ")
+    p_generate.add_argument('--workers', type=int, help="Processos de geração (padrão: NUM_WORKERS / nº de CPUs)")
+    p_generate.add_argument('--no-prefill', action='store_true', help="Não executa o pré-preenchimento antes de gerar")
+    p_generate.add_argument('--force', action='store_true', help="Regera todos os arquivos, mesmo os que o manifesto indica inalterados (equivale a FORCAR_GERACAO = True)")
+    p_generate.add_argument('--archive', choices=["batch", "person"], help="Grava os documentos num ZIP por lote ou por registro, com índice linha -> arquivo (equivale a MODO_SAIDA)")
+    p_generate.add_argument('--zip-level', type=int, choices=range(10), metavar="0-9", help="Nível de compressão dos ZIPs (padrão: NIVEL_COMPRESSAO_ZIP; 0 = sem compressão)")
+
+    subparsers.add_parser('prefill', help="Executa apenas o pré-preenchimento das planilhas")
+
+    p_delete = subparsers.add_parser('delete', help="Exclui linhas das planilhas")
+    p_delete.add_argument('--rows', nargs='+', required=True, metavar="TIPO:LINHAS", help="Linhas da planilha, ex.: PF:2,5-7 PJ:10")
+    p_delete.add_argument('--yes', action='store_true', help="Confirma a exclusão (obrigatório: a ação não pode ser desfeita)")
+    p_delete.add_argument('--soft', action='store_true', help=f"Move as linhas para a aba/tabela '<aba>{SUFIXO_ARQUIVO_EXCLUIDOS}' em vez de apenas excluí-las (equivale a MODO_EXCLUSAO = 'arquivar')")
+    return parser
+
+def main_cli(argv):
+    """Executa um subcomando sem interface gráfica. Retorna o código de saída."""
+    global DEBUG_MODE, MOTOR_DOCX, MOTOR_XLSX, NUM_WORKERS, FORCAR_RESYNC, FORCAR_GERACAO, PERFIL_PARTIDA, ARQUIVO_LOG_JSON, MEDIR_MEMORIA, MODO_SAIDA, NIVEL_COMPRESSAO_ZIP, VERIFICAR_PRE_PREENCHIMENTO, MODO_EXCLUSAO, _saida_maquina
+    parser = criar_parser_cli()
+    args = parser.parse_args(argv)
+    for especificacao in args.source or []:
+        tipo, _, arquivo = especificacao.partition('=')
+        if tipo.strip().upper() not in PLANILHAS_POR_TIPO or not arquivo:
+            parser.error(f"--source inválido: '{especificacao}' (use PF=arquivo.csv ou PJ=dados.sqlite3#tabela)")
+        FONTES_LOCAIS[tipo.strip().upper()] = arquivo
+    if args.debug: DEBUG_MODE = True
+    if args.motor_docx: MOTOR_DOCX = args.motor_docx
+    if args.motor_xlsx: MOTOR_XLSX = args.motor_xlsx
+    if args.resync: FORCAR_RESYNC = True
+    if args.verify_prefill: VERIFICAR_PRE_PREENCHIMENTO = True
+    if args.profile_startup: PERFIL_PARTIDA = True
+    if getattr(args, 'workers', None): NUM_WORKERS = args.workers
+    if getattr(args, 'force', False): FORCAR_GERACAO = True
+    if getattr(args, 'archive', None): MODO_SAIDA = {"batch": "zip-lote", "person": "zip-registro"}[args.archive]
+    if getattr(args, 'zip_level', None) is not None: NIVEL_COMPRESSAO_ZIP = args.zip_level
+    if getattr(args, 'soft', False): MODO_EXCLUSAO = "arquivar"
+    if args.log_json: ARQUIVO_LOG_JSON = args.log_json
+    if args.tracemalloc: MEDIR_MEMORIA = True
+    iniciar_instrumentacao()
+    if args.comando in (None, 'gui'):
+        return executar_gui()
+
+    logging.basicConfig(level=logging.DEBUG if DEBUG_MODE else logging.INFO, stream=sys.stderr,
+                        format="%(asctime)s %(levelname)s %(message)s")
+
+    # stdout fica reservado para o progresso em JSON; os prints informativos passam a ir para o stderr
+    _saida_maquina = sys.stdout
+    sys.stdout = sys.stderr
     try:
-        # --- 1. Autenticação e Carregamento Inicial ---
-        client_gspread = autenticar_google()
-        sheet_pf, headers_pf, dados_pf_originais = carregar_planilha(client_gspread, PLANILHA_PF_FILENAME, PF_TAB_NAME)
-        sheet_pj, headers_pj, dados_pj_originais = carregar_planilha(client_gspread, PLANILHA_PJ_FILENAME, PJ_TAB_NAME)
-
-        # --- 2. Calcula Índices da Coluna de Status (1-based) ---
-        try: col_index_status_pf = headers_pf.index(STATUS_COL) + 1
-        except ValueError: messagebox.showerror("Erro Fatal", f"Coluna Status '{STATUS_COL}' não encontrada nos cabeçalhos da planilha PF."); sys.exit()
-        try: col_index_status_pj = headers_pj.index(STATUS_COL) + 1
-        except ValueError: messagebox.showerror("Erro Fatal", f"Coluna Status '{STATUS_COL}' não encontrada nos cabeçalhos da planilha PJ."); sys.exit()
-
-        # --- 3. Pré-preenchimento ---
-        dados_pf_preenchidos = preencher_e_atualizar_planilha(
-            sheet_pf, headers_pf, dados_pf_originais,
-            COL_PF_ID_TRIGGER, COL_PF_ID_COMPARISON, COL_CADASTRO, TRIGGER_VALUE
-        )
-        dados_pj_preenchidos = preencher_e_atualizar_planilha(
-            sheet_pj, headers_pj, dados_pj_originais,
-            COL_PJ_ID_TRIGGER, COL_PJ_ID_COMPARISON, COL_CADASTRO, TRIGGER_VALUE
-        )
+        comandos = {'generate': _cli_generate, 'prefill': _cli_prefill, 'delete': _cli_delete}
+        return comandos[args.comando](args)
+    except ValueError as e: # Especificação de linhas inválida
+        log.error("%s", e)
+        return SAIDA_USO
+    except FileNotFoundError as fnf_error:
+        log.error("Arquivo não encontrado: %s (verifique '%s')", fnf_error, CAMINHO_CREDENCIAL_REL)
+        return SAIDA_ERRO_FATAL
+    except Exception as main_error:
+        log.exception("Erro fatal: %s - %s", type(main_error).__name__, main_error)
+        return SAIDA_ERRO_FATAL
+    finally:
+        imprimir_resumo_instrumentacao() # Ainda no stderr
+        sys.stdout = _saida_maquina
+        relatorio_partida(f"fim do comando {args.comando}")
 
-        # --- 4. Processamento Final dos Dados ---
-        # Adiciona 'tipo' e 'linha' a cada dicionário para uso na interface e geração
-        dados_pf_processados = [dict(row, tipo="PF", linha=i+2) for i, row in enumerate(dados_pf_preenchidos)]
-        dados_pj_processados = [dict(row, tipo="PJ", linha=i+2) for i, row in enumerate(dados_pj_preenchidos)]
 
-        # --- 5. Interface Gráfica ---
+_DURACAO_MODULO = time.perf_counter() - _INICIO_MODULO # Import do autodocs em si (sem os módulos tardios)
+_EXTRACAO_ONEFILE = _tempo_extracao_onefile()
+
+# ==============================================================================
+# 9. EXECUÇÃO PRINCIPAL
+# ==============================================================================
+def executar_gui():
+    """Abre a interface gráfica (modo padrão); o carregamento das planilhas roda em segundo plano."""
+    global root, MODO_GUI, _fila_gui
+    MODO_GUI = True
+    _fila_gui = queue.Queue()
+    try:
+        tk = _importar("tkinter")
+        # --- 5. Interface Gráfica (aparece antes do carregamento, que roda em segundo plano) ---
         root = tk.Tk()
-        criar_interface(root, dados_pf_processados, dados_pj_processados)
-        print("\nInterface pronta. Aguardando interação do usuário...")
+        criar_interface(root, [], [])
+        if PERFIL_PARTIDA:
+            root.update() # Desenha a janela agora para medir o tempo até ela aparecer
+            relatorio_partida("janela visível")
+        root.after(100, _processar_fila_gui)
+
+        # --- 1 a 4. Autenticação, carregamento, pré-preenchimento e preparo dos registros ---
+        def ao_carregar(_):
+            popular_listas(dados_pf_processados, dados_pj_processados)
+            print("\nInterface pronta. Aguardando interação do usuário...")
+            relatorio_partida("planilhas carregadas")
+            imprimir_resumo_instrumentacao("Resumo por etapa (carregamento)")
+            oferecer_retomada_gui()
+        executar_em_segundo_plano("Carregando planilhas", lambda: carregar_sessao(executar_prefill=True), ao_carregar, ao_falhar=_falha_fatal_gui)
         root.mainloop() # Mantém a janela aberta
 
-    except FileNotFoundError as fnf_error:
-         print(f"ERRO FATAL: Arquivo não encontrado - {fnf_error}")
-         messagebox.showerror("Erro Fatal - Arquivo Não Encontrado", f"Não foi possível encontrar um arquivo essencial:\n{fnf_error}\n\nVerifique se o arquivo '{CAMINHO_CREDENCIAL_REL}' está na pasta correta.")
-         sys.exit(1)
-    except Exception as main_error:
+    except Exception as main_error: # Ex.: sem display disponível para o Tkinter
         print(f"ERRO FATAL NA EXECUÇÃO PRINCIPAL: {type(main_error).__name__} - {main_error}")
         import traceback
         traceback.print_exc() # Imprime detalhes do erro no console
-        try:
-            messagebox.showerror("Erro Fatal Inesperado", f"Ocorreu um erro crítico:\n{type(main_error).__name__}: {main_error}\n\nVerifique o console para detalhes técnicos.")
-        except Exception: pass # Ignora erro ao mostrar messagebox se o Tkinter falhou
-        sys.exit(1)
+        return SAIDA_ERRO_FATAL
 
-    print("Aplicação finalizada.")
\ No newline at end of file
+    print("Aplicação finalizada.")
+    return _codigo_saida_gui
+
+def main(argv=None):
+    """Ponto de entrada: sem argumentos abre a interface; com subcomando roda em modo linha de comando."""
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv: iniciar_instrumentacao() # Configuração do bloco 2.1 (sem flags)
+    return main_cli(argv) if argv else executar_gui()
+
+if __name__ == "__main__":
+    multiprocessing.freeze_support() # Necessário para o ProcessPoolExecutor no .exe (PyInstaller/Windows)
+    sys.exit(main())
@@ -1,20 +1,23 @@
 # -*- mode: python ; coding: utf-8 -*-
+# Build onedir (pasta dist/autodocs): abre mais rápido que o --onefile, que extrai tudo para uma pasta temporária a cada execução.
+# Uso: pyinstaller autodocs.spec
 
 block_cipher = None
 
 a = Analysis(
-    ['autodocs_v2.py'],
+    ['autodocs.py'],
     pathex=[],
     binaries=[],
     datas=[
 	('credenciais.json', '.'),
 	('templates', 'templates')
 ],
-    hiddenimports=[],
+    # Importados no primeiro uso via importlib (_ModuloTardio): a análise estática do PyInstaller não os vê
+    hiddenimports=['gspread', 'docx', 'lxml.etree', 'openpyxl'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=['numpy', 'pandas', 'matplotlib', 'IPython', 'pytest'], # Dependências opcionais que só aumentam o pacote
     win_no_prefer_redirects=False,
     win_private_assemblies=False,
     cipher=block_cipher,    
@@ -31,11 +34,11 @@ exe = EXE(
     a.datas,
     [],
     exclude_binaries=True,
-    name='autodocs_v2',
+    name='autodocs',
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    upx=False, # Binários comprimidos com UPX precisam ser descomprimidos a cada partida
     console=True,
     disable_windowed_traceback=False,
     argv_emulation=False,
@@ -48,7 +51,7 @@ coll = COLLECT(
     a.binaries,
     a.datas,
     strip=False,
-    upx=True,
+    upx=False,
     upx_exclude=[],
-    name='autodocs_v2',
+    name='autodocs',
 )
@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+"""
+Tempo de cada etapa do autodocs com dados, templates e planilha sintéticos (sem credenciais nem rede).
+
+Para cada tamanho de lote mede, separadamente:
+  carregar_planilha (primeira vez e com snapshot), a mesma aba lida de um CSV local (carregar_fonte_local),
+  preencher_e_atualizar_planilha, envio do pré-preenchimento, pré-preenchimento incremental (segunda carga),
+  contexto de render (Registro.contexto),
+  abrir/substituir_placeholders/salvar DOCX (python-docx), abrir/substituir_placeholders_excel/salvar XLSX
+  (openpyxl), gerar_documentos_registro com cada motor DOCX, o envio do status em lote (planilha e CSV local) e
+  arquivar_linhas de um bloco contíguo (exclusão com cópia para a aba de excluídos).
+As etapas de documento rodam numa amostra de até --max-docs registros (o custo é linear: compare ms_por_registro).
+As chamadas à planilha falsa são contadas por etapa.
+
+Uso:
+    python benchmarks/bench_etapas.py [--tamanhos 100 1000 10000] [--colunas 40] [--densidade 0.3]
+                                      [--max-docs 200] [--latencia-ms 0] [--saida atual.json] [--comparar anterior.json]
+
+O JSON (stdout ou --saida) traz o commit, os parâmetros e, por tamanho e etapa, segundos, registros,
+ms_por_registro e requisicoes; --comparar mostra a variação de cada etapa em relação a um JSON anterior.
+"""
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+import autodocs  # noqa: E402
+import sinteticos  # noqa: E402
+from planilha_falsa import ClienteFalso  # noqa: E402
+
+
+class Medidor:
+    """Acumula tempo, registros e requisições por etapa (a mesma etapa pode ser medida várias vezes)."""
+    def __init__(self, contador):
+        self.contador = contador
+        self.etapas = {}
+
+    @contextlib.contextmanager
+    def etapa(self, nome, registros):
+        requisicoes = self.contador.total()
+        inicio = time.perf_counter()
+        yield
+        segundos = time.perf_counter() - inicio
+        etapa = self.etapas.setdefault(nome, {"segundos": 0.0, "registros": 0, "requisicoes": 0})
+        etapa["segundos"] += segundos
+        etapa["registros"] += registros
+        etapa["requisicoes"] += self.contador.total() - requisicoes
+
+    def resultado(self):
+        for etapa in self.etapas.values():
+            etapa["ms_por_registro"] = round(etapa["segundos"] * 1000 / etapa["registros"], 4) if etapa["registros"] else None
+            etapa["segundos"] = round(etapa["segundos"], 4)
+        return self.etapas
+
+
+def _por_tipo(n_registros):
+    return {"PF": n_registros - n_registros // 2, "PJ": n_registros // 2}
+
+
+def _preparar_backend(n_registros, n_colunas, latencia_s, pasta):
+    """Cliente falso com as abas PF e PJ (metade dos registros em cada) com os nomes configurados no autodocs,
+    e as mesmas abas em CSV na `pasta` (fontes locais). Retorna (cliente, {tipo: caminho do CSV})."""
+    cliente = ClienteFalso(latencia_s)
+    csvs = {}
+    for tipo, quantidade in _por_tipo(n_registros).items():
+        filename, tab_name, _, _ = autodocs.PLANILHAS_POR_TIPO[tipo]
+        linhas = sinteticos.gerar_aba(tipo, quantidade, n_colunas, semente=quantidade)
+        cliente.criar_planilha(filename).adicionar_aba(tab_name, linhas, linhas_grade=quantidade + 500)
+        csvs[tipo] = Path(pasta) / f"{tipo}.csv"
+        with open(csvs[tipo], "w", newline="", encoding="utf-8") as arquivo: csv.writer(arquivo).writerows(linhas)
+    return cliente, csvs
+
+
+def medir_tamanho(n_registros, args):
+    """Roda todas as etapas para um tamanho de lote e devolve o dict de etapas."""
+    with tempfile.TemporaryDirectory() as pasta:
+        autodocs.PASTA_CACHE = str(Path(pasta) / "cache")
+        autodocs.PASTA_SAIDA = str(Path(pasta) / "saida")
+        autodocs._conexao_snapshot = None # Snapshot novo para cada tamanho
+        cliente, csvs = _preparar_backend(n_registros, args.colunas, args.latencia_ms / 1000, pasta)
+        medidor = Medidor(cliente.contador)
+        abas = {}
+        fontes_csv = {}
+
+        for nome_etapa in ("carregar_planilha", "carregar_planilha (snapshot)"):
+            for tipo in ("PF", "PJ"):
+                filename, tab_name, _, _ = autodocs.PLANILHAS_POR_TIPO[tipo]
+                colunas = autodocs.colunas_usadas(tipo, autodocs.placeholders_dos_templates(tipo)) if autodocs.PROJETAR_COLUNAS else None
+                with medidor.etapa(nome_etapa, _por_tipo(n_registros)[tipo]):
+                    abas[tipo] = autodocs.carregar_planilha(cliente, filename, tab_name, colunas, tipo)
+        for tipo in ("PF", "PJ"):
+            with medidor.etapa("carregar_fonte_local (CSV)", _por_tipo(n_registros)[tipo]):
+                fontes_csv[tipo] = autodocs.carregar_fonte_local(csvs[tipo], autodocs.PLANILHAS_POR_TIPO[tipo][1], None, tipo)[0]
+
+        buffer = autodocs.BufferEscrita()
+        registros = {}
+        for tipo, (sheet, headers, dados) in abas.items():
+            _, _, id_col_trigger, id_col_comparison = autodocs.PLANILHAS_POR_TIPO[tipo]
+            with medidor.etapa("preencher_e_atualizar_planilha", len(dados)):
+                dados = autodocs.preencher_e_atualizar_planilha(sheet, headers, dados, id_col_trigger, id_col_comparison,
+                                                                autodocs.COL_CADASTRO, autodocs.TRIGGER_VALUE, buffer)
+            registros[tipo] = dados # Registros com 'tipo' e 'linha', como na sessão
+        with medidor.etapa("envio do pré-preenchimento", n_registros):
+            autodocs.enviar_pre_preenchimento(buffer) # Também grava o estado incremental
+        buffer = autodocs.BufferEscrita()
+        for tipo in ("PF", "PJ"):
+            filename, tab_name, id_col_trigger, id_col_comparison = autodocs.PLANILHAS_POR_TIPO[tipo]
+            colunas = autodocs.colunas_usadas(tipo, autodocs.placeholders_dos_templates(tipo)) if autodocs.PROJETAR_COLUNAS else None
+            sheet, headers, dados = autodocs.carregar_planilha(cliente, filename, tab_name, colunas, tipo) # Nova carga (snapshot)
+            with medidor.etapa("pré-preenchimento incremental", len(dados)):
+                autodocs.preencher_e_atualizar_planilha(sheet, headers, dados, id_col_trigger, id_col_comparison,
+                                                        autodocs.COL_CADASTRO, autodocs.TRIGGER_VALUE, buffer)
+        autodocs.enviar_pre_preenchimento(buffer)
+
+        # --- Documentos (amostra) ---
+        limite = min(n_registros, args.max_docs)
+        amostra = registros["PF"][:limite - limite // 2] + registros["PJ"][:limite // 2]
+        bytes_templates = {}
+        for pessoa in amostra:
+            tipo = pessoa["tipo"]
+            with medidor.etapa("contexto de render", 1):
+                dados_pessoa = pessoa.contexto()
+            template_docx = getattr(autodocs, f"TEMPLATE_{tipo}_DOCX")[0]
+            template_xlsx = getattr(autodocs, f"TEMPLATE_{tipo}_XLSX")[0]
+            for template in (template_docx, template_xlsx):
+                if template not in bytes_templates: bytes_templates[template] = template.read_bytes()
+
+            with medidor.etapa("abrir DOCX (python-docx)", 1):
+                documento = autodocs.docx.Document(io.BytesIO(bytes_templates[template_docx]))
+            with medidor.etapa("substituir_placeholders", 1):
+                autodocs.substituir_placeholders(documento, dados_pessoa)
+            with medidor.etapa("salvar DOCX (python-docx)", 1):
+                documento.save(io.BytesIO())
+
+            with medidor.etapa("abrir XLSX (openpyxl)", 1):
+                workbook = autodocs.openpyxl.load_workbook(io.BytesIO(bytes_templates[template_xlsx]))
+            with medidor.etapa("substituir_placeholders_excel", 1):
+                autodocs.substituir_placeholders_excel(workbook, dados_pessoa)
+            with medidor.etapa("salvar XLSX (openpyxl)", 1):
+                workbook.save(io.BytesIO())
+
+        autodocs.USAR_MANIFESTO = False # Mede a geração, não o pulo de arquivos já gerados
+        for motor in ("python-docx", "zip"):
+            autodocs.MOTOR_DOCX = motor
+            autodocs.aquecer_cache_templates() # Fora da medição, como no início de cada worker
+            for pessoa in amostra:
+                with medidor.etapa(f"gerar_documentos_registro ({motor})", 1):
+                    autodocs.gerar_documentos_registro(pessoa)
+
+        for nome_etapa, fontes in (("envio do status em lote", {tipo: aba[0] for tipo, aba in abas.items()}),
+                                   ("envio do status em lote (CSV local)", fontes_csv)):
+            status = autodocs.BufferEscrita()
+            for tipo, fonte in fontes.items():
+                coluna_status = abas[tipo][1].index(autodocs.STATUS_COL) + 1
+                for pessoa in registros[tipo]: status.adicionar(fonte, pessoa["linha"], coluna_status, "GERADO")
+            with medidor.etapa(nome_etapa, n_registros):
+                status.enviar()
+
+        for tipo, (fonte, _, _) in abas.items(): # Um bloco contíguo (10% do fim da aba) vai para a aba de excluídos
+            linhas = [pessoa["linha"] for pessoa in registros[tipo][-max(1, len(registros[tipo]) // 10):]]
+            with medidor.etapa("arquivar_linhas (bloco contíguo)", len(linhas)):
+                fonte.arquivar_linhas(linhas)
+
+        if autodocs._conexao_snapshot is not None: autodocs._conexao_snapshot.close()
+        autodocs._conexao_snapshot = None
+        return medidor.resultado()
+
+
+def _commit_atual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=Path(__file__).resolve().parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _imprimir_tabela(resultado, anterior=None):
+    """Tabela legível no stderr; com `anterior`, a variação do tempo de cada etapa."""
+    for tamanho, etapas in resultado["resultados"].items():
+        print(f"\n=== {tamanho} registros ===", file=sys.stderr)
+        etapas_antes = (anterior or {}).get("resultados", {}).get(tamanho, {})
+        for nome, etapa in etapas.items():
+            linha = f" {nome:<40} {etapa['segundos']:9.3f} s  {etapa['ms_por_registro'] or 0:9.3f} ms/reg  {etapa['requisicoes']:4d} req"
+            antes = etapas_antes.get(nome)
+            if antes and antes.get("ms_por_registro"):
+                linha += f"  ({(etapa['ms_por_registro'] / antes['ms_por_registro'] - 1) * 100:+.1f}%)"
+            print(linha, file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tamanhos", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--colunas", type=int, default=40, help="Colunas extras na planilha (além das de controle)")
+    parser.add_argument("--paragrafos", type=int, default=120, help="Parágrafos por template DOCX")
+    parser.add_argument("--densidade", type=float, default=0.3, help="Fração de parágrafos/células com placeholders")
+    parser.add_argument("--max-docs", type=int, default=200, help="Registros da amostra nas etapas de documento")
+    parser.add_argument("--latencia-ms", type=float, default=0.0, help="Latência simulada por requisição à planilha")
+    parser.add_argument("--saida", help="Grava o JSON neste arquivo (padrão: stdout)")
+    parser.add_argument("--comparar", help="JSON de uma execução anterior para comparar")
+    args = parser.parse_args()
+
+    anterior = json.loads(Path(args.comparar).read_text(encoding="utf-8")) if args.comparar else None
+    autodocs.USAR_CACHE_METADADOS = False
+    autodocs.NUM_WORKERS = 1
+    resultado = {"commit": _commit_atual(), "data": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+                 "plataforma": platform.platform(), "parametros": vars(args), "resultados": {}}
+    with tempfile.TemporaryDirectory() as pasta_templates:
+        sinteticos.gerar_templates(pasta_templates, args.colunas, args.paragrafos, args.densidade)
+        for tamanho in args.tamanhos:
+            print(f"Medindo {tamanho} registros...", file=sys.stderr)
+            with open(os.devnull, "w", encoding="utf-8") as nulo, contextlib.redirect_stdout(nulo): # Logs do autodocs
+                resultado["resultados"][str(tamanho)] = medir_tamanho(tamanho, args)
+
+    _imprimir_tabela(resultado, anterior)
+    texto = json.dumps(resultado, ensure_ascii=False, indent=1)
+    if args.saida: Path(args.saida).write_text(texto, encoding="utf-8")
+    else: print(texto)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark da substituição de placeholders.
+
+Compara o laço antigo (um str.replace por placeholder, para cada texto) com a
+varredura única de `substituir_texto`. Não precisa de credenciais nem templates.
+
+Uso:
+    python benchmarks/bench_placeholders.py [--colunas 80] [--textos 400] [--repeticoes 20]
+"""
+import argparse
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import autodocs  # noqa: E402
+
+
+def substituir_legado(texto, placeholders):
+    """Reprodução do laço original: um replace por placeholder."""
+    if not any(ph in texto for ph in placeholders):
+        return texto, False
+    modificado = False
+    for ph, val in placeholders.items():
+        novo = texto.replace(ph, str(val))
+        if novo != texto:
+            modificado = True
+            texto = novo
+    return texto, modificado
+
+
+def gerar_cenario(n_colunas, n_textos):
+    """Cria um registro sintético e textos de template com ~1/3 dos trechos contendo placeholders."""
+    dados = {f"CAMPO {i:03d}": f"valor do campo {i}" for i in range(n_colunas)}
+    dados[autodocs.COL_PF_ID_COMPARISON] = "12345678901"
+    placeholders = autodocs._criar_dicionario_placeholders(dados)
+    chaves = list(placeholders)
+    textos = []
+    for i in range(n_textos):
+        if i % 3 == 0:
+            textos.append(f"Declaro que {chaves[i % len(chaves)]}, residente em {chaves[(i * 7) % len(chaves)]}, {{SEM COLUNA}}.")
+        else:
+            textos.append("Texto fixo do modelo, sem nenhum campo a substituir nesta linha. " * 2)
+    return placeholders, textos
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--colunas", type=int, default=80)
+    parser.add_argument("--textos", type=int, default=400)
+    parser.add_argument("--repeticoes", type=int, default=20)
+    args = parser.parse_args()
+
+    placeholders, textos = gerar_cenario(args.colunas, args.textos)
+
+    # Confere que as duas implementações produzem o mesmo resultado antes de medir
+    nao_resolvidos = set()
+    for texto in textos:
+        assert substituir_legado(texto, placeholders) == autodocs.substituir_texto(texto, placeholders, nao_resolvidos)
+
+    t_legado = min(timeit.repeat(lambda: [substituir_legado(t, placeholders) for t in textos], number=1, repeat=args.repeticoes))
+    t_novo = min(timeit.repeat(lambda: [autodocs.substituir_texto(t, placeholders) for t in textos], number=1, repeat=args.repeticoes))
+
+    print(f"Placeholders: {len(placeholders)} | Textos: {len(textos)} | Repetições: {args.repeticoes}")
+    print(f" Laço str.replace (legado): {t_legado * 1000:8.2f} ms")
+    print(f" Varredura única (regex):   {t_novo * 1000:8.2f} ms")
+    print(f" Ganho: {t_legado / t_novo:.1f}x")
+    print(f" Tokens não resolvidos reportados: {sorted(nao_resolvidos)}")
+
+
+if __name__ == "__main__":
+    main()
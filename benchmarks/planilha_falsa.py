@@ -0,0 +1,201 @@
+# -*- coding: utf-8 -*-
+"""
+Backend falso do Google Sheets, em memória, com a parte do gspread que o autodocs usa.
+
+Cliente (`open`), planilha (`worksheet`, `add_worksheet`, `values_batch_update`, `batch_update` com addSheet,
+deleteDimension, appendDimension e copyPaste de linhas inteiras, tudo ou nada como na API) e aba (`batch_get`,
+`row_count`, `col_count`, `title`, `id`).
+Os valores ficam como strings, como a API devolve, e as respostas cortam células e linhas vazias do fim.
+Cada requisição é contada (e pode esperar `latencia_s`), para os benchmarks medirem o número de chamadas sem
+rede nem credenciais.
+"""
+import json
+import re
+import time
+
+from gspread.exceptions import SpreadsheetNotFound, WorksheetNotFound
+
+_PADRAO_A1 = re.compile(r"^([A-Z]*)(\d*)$")
+
+
+def _coluna(letras):
+    """Índice 0-based da coluna A1 (A -> 0, AA -> 26)."""
+    indice = 0
+    for letra in letras: indice = indice * 26 + ord(letra) - 64
+    return indice - 1
+
+
+def _sem_vazios_finais(linha):
+    linha = list(linha)
+    while linha and linha[-1] == "": linha.pop()
+    return linha
+
+
+class ContadorRequisicoes:
+    """Requisições e bytes enviados ao backend falso, por tipo de chamada."""
+    def __init__(self, latencia_s=0.0):
+        self.latencia_s = latencia_s
+        self.chamadas = {}
+        self.bytes_enviados = 0
+
+    def registrar(self, tipo, corpo=None):
+        self.chamadas[tipo] = self.chamadas.get(tipo, 0) + 1
+        if corpo is not None: self.bytes_enviados += len(json.dumps(corpo, ensure_ascii=False).encode("utf-8"))
+        if self.latencia_s: time.sleep(self.latencia_s)
+
+    def total(self):
+        return sum(self.chamadas.values())
+
+    def zerar(self):
+        self.chamadas = {}
+        self.bytes_enviados = 0
+
+
+class AbaFalsa:
+    """Worksheet em memória: `linhas` inclui o cabeçalho (linha 1)."""
+    def __init__(self, planilha, titulo, linhas, id_aba, linhas_grade=None, colunas_grade=26):
+        self.spreadsheet = planilha
+        self.title = titulo
+        self.id = id_aba
+        self.linhas = [[str(v) for v in linha] for linha in linhas]
+        self._linhas_grade = linhas_grade
+        self._colunas_grade = colunas_grade
+
+    @property
+    def row_count(self):
+        """Tamanho da grade: como numa aba de formulário, sempre há linhas vazias sobrando depois da última resposta."""
+        return max(len(self.linhas), self._linhas_grade or 0) or 1000
+
+    @property
+    def col_count(self):
+        return max([len(linha) for linha in self.linhas] + [self._colunas_grade])
+
+    def _ler(self, intervalo):
+        inicio, _, fim = intervalo.partition(":")
+        coluna_ini, linha_ini = _PADRAO_A1.match(inicio).groups()
+        coluna_fim, linha_fim = _PADRAO_A1.match(fim or inicio).groups()
+        primeira = int(linha_ini) if linha_ini else 1
+        ultima = int(linha_fim) if linha_fim else len(self.linhas)
+        c0 = _coluna(coluna_ini) if coluna_ini else 0
+        c1 = _coluna(coluna_fim) + 1 if coluna_fim else None
+        valores = [_sem_vazios_finais(linha[c0:c1]) for linha in self.linhas[primeira - 1:ultima]]
+        while valores and not valores[-1]: valores.pop()
+        return valores
+
+    def batch_get(self, intervalos, **kwargs):
+        self.spreadsheet.contador.registrar("values.batchGet")
+        return [self._ler(intervalo) for intervalo in intervalos]
+
+    def _gravar(self, intervalo, valores):
+        inicio = intervalo.partition(":")[0]
+        coluna, linha = _PADRAO_A1.match(inicio).groups()
+        l0, c0 = int(linha) - 1, _coluna(coluna)
+        for i, linha_valores in enumerate(valores):
+            while len(self.linhas) <= l0 + i: self.linhas.append([])
+            destino = self.linhas[l0 + i]
+            for j, valor in enumerate(linha_valores):
+                destino.extend([""] * (c0 + j + 1 - len(destino)))
+                destino[c0 + j] = str(valor)
+
+    def _excluir_linhas(self, inicio, fim):
+        del self.linhas[inicio:fim]
+        if self._linhas_grade: self._linhas_grade -= fim - inicio
+
+    def _acrescentar(self, dimensao, quantidade):
+        if dimensao == "ROWS": self._linhas_grade = self.row_count + quantidade
+        else: self._colunas_grade = self.col_count + quantidade
+
+    def _copiar_linhas(self, inicio, fim, destino, inicio_destino):
+        if fim > self.row_count or inicio_destino + fim - inicio > destino.row_count: raise ValueError("copyPaste fora da grade")
+        copia = [list(linha) for linha in self.linhas[inicio:fim]]
+        for i, linha in enumerate(copia):
+            while len(destino.linhas) <= inicio_destino + i: destino.linhas.append([])
+            destino.linhas[inicio_destino + i] = linha
+
+
+class PlanilhaFalsa:
+    """Spreadsheet em memória com uma ou mais abas."""
+    def __init__(self, titulo, id_planilha, contador):
+        self.title = titulo
+        self.id = id_planilha
+        self.contador = contador
+        self.abas = {}
+
+    def adicionar_aba(self, titulo, linhas, linhas_grade=None, id_aba=None, colunas_grade=26):
+        aba = AbaFalsa(self, titulo, linhas, id_aba or len(self.abas) + 1, linhas_grade, colunas_grade)
+        self.abas[titulo] = aba
+        return aba
+
+    def add_worksheet(self, title, rows, cols):
+        self.contador.registrar("batchUpdate", {"addSheet": title})
+        return self.adicionar_aba(title, [], linhas_grade=rows)
+
+    def worksheet(self, titulo):
+        if titulo not in self.abas: raise WorksheetNotFound(titulo)
+        return self.abas[titulo]
+
+    def _aba_por_nome(self, nome_intervalo):
+        titulo, _, intervalo = nome_intervalo.rpartition("!")
+        titulo = titulo[1:-1].replace("''", "'") if titulo.startswith("'") else titulo
+        return self.abas[titulo], intervalo
+
+    def values_batch_update(self, corpo):
+        self.contador.registrar("values.batchUpdate", corpo)
+        for dado in corpo["data"]:
+            aba, intervalo = self._aba_por_nome(dado["range"])
+            aba._gravar(intervalo, dado["values"])
+        return {"totalUpdatedCells": sum(len(v) for d in corpo["data"] for v in d["values"])}
+
+    def batch_update(self, corpo):
+        self.contador.registrar("batchUpdate", corpo)
+        # Tudo ou nada: se uma requisição falhar, a planilha volta ao estado anterior
+        estado = {titulo: ([list(linha) for linha in aba.linhas], aba._linhas_grade, aba._colunas_grade) for titulo, aba in self.abas.items()}
+        abas = dict(self.abas)
+        try:
+            for requisicao in corpo["requests"]: # Aplicadas em ordem, como na API
+                self._aplicar(requisicao)
+        except Exception:
+            self.abas = abas
+            for titulo, (linhas, linhas_grade, colunas_grade) in estado.items():
+                aba = abas[titulo]
+                aba.linhas, aba._linhas_grade, aba._colunas_grade = linhas, linhas_grade, colunas_grade
+            raise
+        return {"replies": [{} for _ in corpo["requests"]]}
+
+    def _aplicar(self, requisicao):
+        abas_por_id = {aba.id: aba for aba in self.abas.values()}
+        if "addSheet" in requisicao:
+            propriedades = requisicao["addSheet"]["properties"]
+            if propriedades["title"] in self.abas or propriedades.get("sheetId") in abas_por_id:
+                raise ValueError(f"addSheet: aba já existe ({propriedades['title']})")
+            grade = propriedades.get("gridProperties", {})
+            self.adicionar_aba(propriedades["title"], [], grade.get("rowCount", 1000), propriedades.get("sheetId"), grade.get("columnCount", 26))
+        elif "deleteDimension" in requisicao:
+            faixa = requisicao["deleteDimension"]["range"]
+            abas_por_id[faixa["sheetId"]]._excluir_linhas(faixa["startIndex"], faixa["endIndex"])
+        elif "appendDimension" in requisicao:
+            dados = requisicao["appendDimension"]
+            abas_por_id[dados["sheetId"]]._acrescentar(dados["dimension"], dados["length"])
+        elif "copyPaste" in requisicao:
+            origem, destino = requisicao["copyPaste"]["source"], requisicao["copyPaste"]["destination"]
+            abas_por_id[origem["sheetId"]]._copiar_linhas(origem["startRowIndex"], origem["endRowIndex"],
+                                                          abas_por_id[destino["sheetId"]], destino["startRowIndex"])
+        else:
+            raise NotImplementedError(list(requisicao))
+
+
+class ClienteFalso:
+    """Substitui o cliente gspread: `open(titulo)` devolve a planilha cadastrada."""
+    def __init__(self, latencia_s=0.0):
+        self.contador = ContadorRequisicoes(latencia_s)
+        self.planilhas = {}
+
+    def criar_planilha(self, titulo):
+        planilha = PlanilhaFalsa(titulo, f"planilha-falsa-{len(self.planilhas) + 1}", self.contador)
+        self.planilhas[titulo] = planilha
+        return planilha
+
+    def open(self, titulo):
+        self.contador.registrar("drive.files.list")
+        if titulo not in self.planilhas: raise SpreadsheetNotFound(titulo)
+        return self.planilhas[titulo]
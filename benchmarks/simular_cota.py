@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Simulação offline do agendador de chamadas à API (cota, retry e backoff).
+
+Um servidor HTTP falso, no lugar da sessão do google-auth, aplica uma cota de N requisições por janela de 60 s.
+Ao estourar a cota, ele responde 429 com Retry-After, como a Sheets API. Também pode devolver 503 ocasionais.
+O relógio é virtual: as esperas não dormem de verdade, e a simulação roda em milissegundos.
+
+Com --exclusao-503, simula uma deleteDimension (batchUpdate estrutural, não idempotente) cujo servidor aplica a
+exclusão e responde 503: ela deve ser enviada uma única vez (o erro sobe), enquanto uma values:batchUpdate com o
+mesmo 503 é repetida. Sai com código 1 se a exclusão for reenviada.
+
+Uso:
+    python benchmarks/simular_cota.py [--chamadas 300] [--cota-servidor 60] [--cota-cliente 60] [--falhas-503 0.05]
+    python benchmarks/simular_cota.py --exclusao-503
+"""
+import argparse
+import contextlib
+import json
+import random
+import sys
+from pathlib import Path
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import autodocs  # noqa: E402
+
+
+class RelogioVirtual:
+    """Relógio monotônico simulado: dormir() só avança o tempo."""
+    def __init__(self):
+        self.agora = 0.0
+
+    def __call__(self):
+        return self.agora
+
+    def dormir(self, segundos):
+        self.agora += segundos
+
+
+class SessaoHTTPFalsa:
+    """Substituto da AuthorizedSession: responde como a Sheets API, com cota por minuto e erros 503 aleatórios."""
+    def __init__(self, relogio, cota_por_minuto, taxa_503=0.0, semente=0):
+        self.relogio = relogio
+        self.cota = cota_por_minuto
+        self.taxa_503 = taxa_503
+        self.aleatorio = random.Random(semente)
+        self.janelas = {}  # (classe, minuto) -> requisições aceitas
+        self.respostas = {}  # código HTTP -> quantidade
+
+    def _resposta(self, codigo, corpo, cabecalhos=None):
+        resposta = requests.Response()
+        resposta.status_code = codigo
+        resposta._content = json.dumps(corpo).encode("utf-8")
+        resposta.headers.update(cabecalhos or {})
+        self.respostas[codigo] = self.respostas.get(codigo, 0) + 1
+        return resposta
+
+    def request(self, method, url, **_):
+        classe = "leitura" if method.upper() == "GET" else "escrita"
+        minuto = int(self.relogio() // 60)
+        if self.aleatorio.random() < self.taxa_503:
+            return self._resposta(503, {"error": {"code": 503, "message": "Backend Error", "status": "UNAVAILABLE"}})
+        if self.janelas.get((classe, minuto), 0) >= self.cota:
+            restante = 60 - self.relogio() % 60
+            return self._resposta(429, {"error": {"code": 429, "message": "Quota exceeded", "status": "RESOURCE_EXHAUSTED"}},
+                                  {"Retry-After": str(int(restante) + 1)})
+        self.janelas[(classe, minuto)] = self.janelas.get((classe, minuto), 0) + 1
+        return self._resposta(200, {"range": "A1", "values": [["ok"]]})
+
+
+def simular(chamadas, cota_servidor, cota_cliente, taxa_503):
+    relogio = RelogioVirtual()
+    sessao = SessaoHTTPFalsa(relogio, cota_servidor, taxa_503)
+    autodocs.agendador_api = autodocs.AgendadorAPI(
+        cotas={"leitura": (cota_cliente, 60.0), "escrita": (cota_cliente, 60.0)},
+        max_tentativas=10, relogio=relogio, dormir=relogio.dormir, aleatorio=random.Random(1).random)
+    cliente = autodocs.classe_cliente_http()(None, session=sessao)
+    falhas = 0
+    for i in range(chamadas):
+        metodo = "GET" if i % 3 else "PUT"  # values.get / values.update
+        try:
+            cliente.request(metodo, "https://sheets.googleapis.com/v4/spreadsheets/falsa/values/A1")
+        except autodocs.gspread.exceptions.APIError:
+            falhas += 1
+    return {"chamadas_logicas": chamadas, "falhas": falhas, "tempo_simulado_s": round(relogio.agora, 1),
+            "respostas_http": sessao.respostas, "agendador": autodocs.agendador_api.resumo()}
+
+
+class SessaoAplicaE503:
+    """Servidor que aplica cada requisição (conta os corpos recebidos) e responde 503 nas `falhas` primeiras."""
+    def __init__(self, falhas=1):
+        self.falhas = falhas
+        self.recebidas = []  # (método, url, corpo)
+
+    def request(self, method, url, **kwargs):
+        self.recebidas.append((method, url, kwargs.get("json")))
+        resposta = requests.Response()
+        resposta.status_code = 503 if len(self.recebidas) <= self.falhas else 200
+        corpo = {"error": {"code": 503, "message": "Backend Error", "status": "UNAVAILABLE"}} if resposta.status_code == 503 else {"replies": [{}]}
+        resposta._content = json.dumps(corpo).encode("utf-8")
+        return resposta
+
+
+def simular_exclusao_503():
+    """deleteDimension com 503 (já aplicada no servidor) não é reenviada; values:batchUpdate com 503 é repetida."""
+    relogio = RelogioVirtual()
+    resultado = {}
+    for nome, url, corpo in (
+            ("deleteDimension", "https://sheets.googleapis.com/v4/spreadsheets/falsa:batchUpdate",
+             {"requests": [{"deleteDimension": {"range": {"sheetId": 1, "dimension": "ROWS", "startIndex": 9, "endIndex": 309}}}]}),
+            ("values:batchUpdate", "https://sheets.googleapis.com/v4/spreadsheets/falsa/values:batchUpdate",
+             {"valueInputOption": "RAW", "data": [{"range": "A2", "values": [["GERADO"]]}]})):
+        autodocs.agendador_api = autodocs.AgendadorAPI(max_tentativas=6, relogio=relogio, dormir=relogio.dormir,
+                                                       aleatorio=random.Random(1).random)
+        sessao = SessaoAplicaE503()
+        cliente = autodocs.classe_cliente_http()(None, session=sessao)
+        try:
+            cliente.request("post", url, json=corpo)
+            erro = None
+        except autodocs.gspread.exceptions.APIError as e:
+            erro = e.code
+        resultado[nome] = {"enviadas": len(sessao.recebidas), "erro": erro}
+    resultado["ok"] = resultado["deleteDimension"] == {"enviadas": 1, "erro": 503} and resultado["values:batchUpdate"]["enviadas"] == 2
+    return resultado
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chamadas", type=int, default=300)
+    parser.add_argument("--cota-servidor", type=int, default=60, help="Requisições por minuto aceitas pelo servidor falso, por classe")
+    parser.add_argument("--cota-cliente", type=int, default=60, help="Capacidade do balde de tokens do agendador, por minuto")
+    parser.add_argument("--falhas-503", type=float, default=0.05, help="Fração de respostas 503 aleatórias")
+    parser.add_argument("--exclusao-503", action="store_true", help="Cenário: exclusão de linhas com 503 não pode ser reenviada")
+    args = parser.parse_args()
+    if args.exclusao_503:
+        with contextlib.redirect_stdout(sys.stderr):
+            resultado = simular_exclusao_503()
+        print(json.dumps(resultado, ensure_ascii=False, indent=2))
+        sys.exit(0 if resultado["ok"] else 1)
+    with contextlib.redirect_stdout(sys.stderr):  # Avisos de retentativa no stderr; o resultado JSON no stdout
+        resultado = simular(args.chamadas, args.cota_servidor, args.cota_cliente, args.falhas_503)
+    print(json.dumps(resultado, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""
+Dados e templates sintéticos para os benchmarks (sem planilhas nem modelos reais).
+
+- `gerar_aba(tipo, ...)`: cabeçalho + linhas de uma aba de respostas PF/PJ, com as colunas de controle do
+  autodocs, N colunas extras e uma fração de linhas de "veículo adicional" (alvos do pré-preenchimento).
+- `gerar_template_docx` / `gerar_template_xlsx`: modelos com densidade de placeholders configurável; parte
+  dos placeholders do DOCX é quebrada em vários runs, como o Word costuma gravar.
+"""
+import random
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import autodocs  # noqa: E402
+
+COLUNAS_TIPO = {
+    "PF": (autodocs.COL_PF_ID_TRIGGER, autodocs.COL_PF_ID_COMPARISON, "NOME COMPLETO", 11),
+    "PJ": (autodocs.COL_PJ_ID_TRIGGER, autodocs.COL_PJ_ID_COMPARISON, "RAZÃO SOCIAL", 14),
+}
+
+
+def colunas_extras(n_colunas):
+    return [f"CAMPO {i:03d}" for i in range(n_colunas)]
+
+
+def gerar_aba(tipo, n_registros, n_colunas=40, fracao_veiculos=0.2, semente=1):
+    """Linhas (strings, linha 1 = cabeçalho) de uma aba de respostas sintética."""
+    col_trigger, col_comparacao, col_nome, digitos = COLUNAS_TIPO[tipo]
+    extras = colunas_extras(n_colunas)
+    cabecalho = ["Carimbo de data/hora", autodocs.COL_CADASTRO, col_trigger, col_comparacao, col_nome, "PLACA"] + extras + [autodocs.STATUS_COL]
+    aleatorio = random.Random(semente)
+    linhas = [cabecalho]
+    documentos = [] # IDs das linhas de cadastro completo (fontes do pré-preenchimento)
+    for i in range(n_registros):
+        placa = f"ABC{i:04d}"[-7:]
+        if documentos and aleatorio.random() < fracao_veiculos:
+            # Veículo adicional: só o ID da linha fonte e a placa; o resto vem do pré-preenchimento
+            linha = ["01/01/2025 10:00:00", autodocs.TRIGGER_VALUE, aleatorio.choice(documentos), "", "", placa] + [""] * n_colunas + [""]
+        else:
+            documento = str(10 ** (digitos - 1) + i)
+            documentos.append(documento)
+            linha = (["01/01/2025 10:00:00", "PRIMEIRO CADASTRO", "", documento, f"{tipo} SINTÉTICO {i}", placa]
+                     + [f"valor {i}-{c}" for c in range(n_colunas)] + [""])
+        linhas.append(linha)
+    return linhas
+
+
+def _placeholders_do_texto(aleatorio, nomes, quantidade):
+    return [f"{{{aleatorio.choice(nomes)}}}" for _ in range(quantidade)]
+
+
+def gerar_template_docx(caminho, nomes_colunas, n_paragrafos=120, densidade=0.3, semente=1):
+    """DOCX com `n_paragrafos` parágrafos (+ uma tabela); `densidade` = fração dos parágrafos com placeholders."""
+    aleatorio = random.Random(semente)
+    documento = autodocs.docx.Document()
+    documento.sections[0].header.paragraphs[0].text = "Cadastro de {NOME COMPLETO}"
+    for i in range(n_paragrafos):
+        paragrafo = documento.add_paragraph()
+        if aleatorio.random() >= densidade:
+            paragrafo.add_run("Texto fixo do modelo, sem campos a substituir nesta linha do documento.")
+            continue
+        for j, token in enumerate(_placeholders_do_texto(aleatorio, nomes_colunas, aleatorio.randint(1, 3))):
+            paragrafo.add_run(" Declaro que ")
+            if (i + j) % 4 == 0: # Placeholder quebrado entre runs
+                meio = len(token) // 2
+                paragrafo.add_run(token[:meio]); paragrafo.add_run(token[meio:]).bold = True
+            else:
+                paragrafo.add_run(token)
+    tabela = documento.add_table(rows=4, cols=2)
+    for linha, nome in zip(tabela.rows, nomes_colunas[:4]):
+        linha.cells[0].text = nome
+        linha.cells[1].text = f"{{{nome}}}"
+    documento.save(caminho)
+
+
+def gerar_template_xlsx(caminho, nomes_colunas, n_linhas=60, densidade=0.3, semente=1):
+    """XLSX com uma aba de `n_linhas` x 4 células de texto; `densidade` = fração das células com placeholders."""
+    aleatorio = random.Random(semente)
+    workbook = autodocs.openpyxl.Workbook()
+    aba = workbook.active
+    for linha in range(1, n_linhas + 1):
+        for coluna in range(1, 5):
+            if aleatorio.random() < densidade:
+                aba.cell(linha, coluna, "Campo: " + " ".join(_placeholders_do_texto(aleatorio, nomes_colunas, 1)))
+            else:
+                aba.cell(linha, coluna, f"Rótulo fixo {linha}.{coluna}")
+    workbook.save(caminho)
+
+
+def gerar_templates(pasta, n_colunas=40, n_paragrafos=120, densidade=0.3):
+    """Cria os templates PF/PJ (4 DOCX + 1 XLSX por tipo) em `pasta` e aponta as listas TEMPLATE_* do autodocs para eles."""
+    pasta = Path(pasta)
+    pasta.mkdir(parents=True, exist_ok=True)
+    for tipo in ("PF", "PJ"):
+        _, col_comparacao, col_nome, _ = COLUNAS_TIPO[tipo]
+        nomes = [col_nome.upper(), col_comparacao.upper(), "PLACA"] + colunas_extras(n_colunas)
+        docx_tipo = [pasta / f"{tipo}{i}- MODELO {i}.docx" for i in range(1, 5)]
+        for i, caminho in enumerate(docx_tipo): gerar_template_docx(caminho, nomes, n_paragrafos, densidade, semente=i)
+        xlsx_tipo = [pasta / f"{tipo} - FORMULARIO.xlsx"]
+        gerar_template_xlsx(xlsx_tipo[0], nomes, densidade=densidade)
+        setattr(autodocs, f"TEMPLATE_{tipo}_DOCX", docx_tipo)
+        setattr(autodocs, f"TEMPLATE_{tipo}_XLSX", xlsx_tipo)
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+"""Fixtures comuns: autodocs com cache/saída em pasta temporária e a planilha falsa dos benchmarks."""
+import sys
+from pathlib import Path
+
+import pytest
+
+RAIZ = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(RAIZ))
+sys.path.insert(0, str(RAIZ / "benchmarks"))
+import autodocs  # noqa: E402
+from planilha_falsa import ClienteFalso  # noqa: E402
+
+
+@pytest.fixture
+def pasta(tmp_path, monkeypatch):
+    """PASTA_CACHE e PASTA_SAIDA temporárias, snapshot novo e sem cache de metadados (nada vaza entre testes)."""
+    monkeypatch.setattr(autodocs, "PASTA_CACHE", str(tmp_path / "cache"))
+    monkeypatch.setattr(autodocs, "PASTA_SAIDA", str(tmp_path / "saida"))
+    monkeypatch.setattr(autodocs, "USAR_CACHE_METADADOS", False)
+    monkeypatch.setattr(autodocs, "FORCAR_RESYNC", False)
+    monkeypatch.setattr(autodocs, "_conexao_snapshot", None)
+    yield tmp_path
+    if autodocs._conexao_snapshot is not None: autodocs._conexao_snapshot.close()
+    autodocs._conexao_snapshot = None
+
+
+@pytest.fixture
+def cliente():
+    return ClienteFalso()
+
+
+def criar_aba_pf(cliente, linhas):
+    """Aba PF (nome configurado no autodocs) na planilha falsa; `linhas` inclui o cabeçalho."""
+    filename, tab_name, _, _ = autodocs.PLANILHAS_POR_TIPO["PF"]
+    return cliente.criar_planilha(filename).adicionar_aba(tab_name, linhas, linhas_grade=len(linhas) + 100)
+
+
+def carregar_pf(cliente, colunas=None):
+    """carregar_planilha da aba PF: (fonte, headers, registros)."""
+    filename, tab_name, _, _ = autodocs.PLANILHAS_POR_TIPO["PF"]
+    return autodocs.carregar_planilha(cliente, filename, tab_name, colunas, "PF")
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Buffer de escrita (seção 5.3): células agrupadas em retângulos e uma values.batchUpdate por planilha."""
+import random
+
+import pytest
+
+import autodocs
+
+
+def celulas(*linhas):
+    """{(linha, coluna): valor} a partir de (linha, [colunas]); o valor é 'L<linha>C<coluna>'."""
+    return {(linha, coluna): f"L{linha}C{coluna}" for linha, colunas in linhas for coluna in colunas}
+
+
+def matriz(linha, colunas, quantidade=1):
+    return [[f"L{l}C{c}" for c in colunas] for l in range(linha, linha + quantidade)]
+
+
+def expandir(retangulos):
+    return {(linha + i, coluna + j): valor for linha, coluna, valores in retangulos
+            for i, valores_linha in enumerate(valores) for j, valor in enumerate(valores_linha)}
+
+
+@pytest.mark.parametrize("entrada, retangulos", [
+    (celulas(), []),
+    (celulas((2, [3])), [(2, 3, matriz(2, [3]))]),
+    (celulas((2, [1, 2, 3])), [(2, 1, matriz(2, [1, 2, 3]))]),
+    # Lacuna na linha: dois trechos
+    (celulas((2, [1, 2, 5])), [(2, 1, matriz(2, [1, 2])), (2, 5, matriz(2, [5]))]),
+    # Mesmo trecho em linhas seguidas: um retângulo
+    (celulas((2, [1, 2]), (3, [1, 2]), (4, [1, 2])), [(2, 1, matriz(2, [1, 2], 3))]),
+    # Lacuna entre linhas: o retângulo não atravessa
+    (celulas((2, [4]), (4, [4])), [(2, 4, matriz(2, [4])), (4, 4, matriz(4, [4]))]),
+    # Linhas irregulares: trechos diferentes não se juntam, e a linha 4 não volta a estender o da linha 2
+    (celulas((2, [1, 2, 3]), (3, [1, 2]), (4, [1, 2, 3])),
+     [(2, 1, matriz(2, [1, 2, 3])), (3, 1, matriz(3, [1, 2])), (4, 1, matriz(4, [1, 2, 3]))]),
+    (celulas((2, [1, 5]), (3, [5]), (4, [1, 5])),
+     [(2, 1, matriz(2, [1])), (2, 5, matriz(2, [5], 3)), (4, 1, matriz(4, [1]))]),
+    # Colunas em ordem qualquer no dicionário
+    ({(3, 2): "b", (3, 1): "a", (2, 2): "y", (2, 1): "x"}, [(2, 1, [["x", "y"], ["a", "b"]])]),
+])
+def test_coalescer_celulas(entrada, retangulos):
+    assert autodocs.coalescer_celulas(entrada) == retangulos
+
+
+@pytest.mark.parametrize("semente", range(20))
+def test_coalescer_celulas_cobre_cada_celula_uma_vez(semente):
+    sorteio = random.Random(semente)
+    entrada = {(sorteio.randint(2, 12), sorteio.randint(1, 8)): str(sorteio.random()) for _ in range(40)}
+    retangulos = autodocs.coalescer_celulas(entrada)
+    assert all(len(set(map(len, valores))) == 1 for _, _, valores in retangulos) # Retângulos de verdade
+    assert sum(len(valores) * len(valores[0]) for _, _, valores in retangulos) == len(entrada)
+    assert expandir(retangulos) == entrada
+
+
+@pytest.mark.parametrize("limite, requisicoes", [(2_000_000, 1), (1, 2)]) # Limite mínimo: um intervalo por requisição
+def test_buffer_envia_uma_requisicao_por_planilha(pasta, cliente, capsys, monkeypatch, limite, requisicoes):
+    monkeypatch.setattr(autodocs, "LIMITE_BYTES_REQUISICAO", limite)
+    planilha = cliente.criar_planilha("Respostas")
+    pf = autodocs.FonteGoogleSheets(planilha.adicionar_aba("PF", [["A", "B", "C"], ["1"], ["2"]]))
+    pj = autodocs.FonteGoogleSheets(planilha.adicionar_aba("PJ", [["A", "B"], ["1"]]))
+    buffer = autodocs.BufferEscrita()
+    for linha in (2, 3):
+        buffer.adicionar(pf, linha, 2, "x"); buffer.adicionar(pf, linha, 3, "y")
+    buffer.adicionar(pj, 2, 2, "velho"); buffer.adicionar(pj, 2, 2, "z") # A última gravação prevalece
+    assert len(buffer) == 5
+
+    relatorio = buffer.enviar()
+    assert (relatorio["celulas"], relatorio["intervalos"], relatorio["requisicoes"]) == (5, 2, requisicoes)
+    assert cliente.contador.chamadas == {"values.batchUpdate": requisicoes}
+    assert pf.worksheet.linhas[1:] == [["1", "x", "y"], ["2", "x", "y"]] and pj.worksheet.linhas[1:] == [["1", "z"]]
+    assert not relatorio["erros"] and not len(buffer)
@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""Retomada de um lote interrompido pelo diário (seção 5.7): queda entre os eventos 'registro' e 'status'."""
+import pytest
+
+import autodocs
+import sinteticos
+from conftest import carregar_pf, criar_aba_pf
+
+
+class Queda(BaseException):
+    """Processo interrompido (não é tratado por gerar_documentos, como um kill)."""
+
+
+@pytest.fixture
+def sessao(pasta, cliente, monkeypatch):
+    """Aba PF sintética carregada como na sessão, templates sintéticos e geração sequencial no processo."""
+    for nome in ("TEMPLATE_PF_DOCX", "TEMPLATE_PF_XLSX", "TEMPLATE_PJ_DOCX", "TEMPLATE_PJ_XLSX"):
+        monkeypatch.setattr(autodocs, nome, getattr(autodocs, nome)) # gerar_templates troca as listas; restauradas no fim
+    sinteticos.gerar_templates(pasta / "templates", n_colunas=3, n_paragrafos=6)
+    aba = criar_aba_pf(cliente, sinteticos.gerar_aba("PF", 4, n_colunas=3, fracao_veiculos=0))
+    sheet, headers, registros = carregar_pf(cliente)
+    monkeypatch.setattr(autodocs, "sheet_pf", sheet)
+    monkeypatch.setattr(autodocs, "col_index_status_pf", headers.index(autodocs.STATUS_COL) + 1)
+    monkeypatch.setattr(autodocs, "dados_pf_processados", registros)
+    monkeypatch.setattr(autodocs, "NUM_WORKERS", 1)
+    monkeypatch.setattr(autodocs, "MODO_SAIDA", "pastas")
+    monkeypatch.setattr(autodocs, "STATUS_LOTE_REGISTROS", 1000) # Todo o status no fim do lote
+    return aba, headers, registros
+
+
+def status_na_planilha(aba, headers):
+    coluna = headers.index(autodocs.STATUS_COL)
+    return [linha[coluna] if coluna < len(linha) else "" for linha in aba.linhas[1:]]
+
+
+def test_queda_antes_do_status_retoma_so_o_status_e_regera_o_registro_alterado(sessao, cliente, monkeypatch):
+    aba, headers, registros = sessao
+    enviar = autodocs.BufferEscrita.enviar
+    def cair(self): raise Queda()
+    monkeypatch.setattr(autodocs.BufferEscrita, "enviar", cair)
+    with pytest.raises(Queda):
+        autodocs.gerar_documentos(registros)
+    monkeypatch.setattr(autodocs.BufferEscrita, "enviar", enviar)
+
+    diario = autodocs.ler_diario()
+    assert len(diario["concluidos"]) == 4 and not diario["status_gravados"]
+    assert status_na_planilha(aba, headers) == [""] * 4
+
+    # Na nova sessão, a linha 3 foi editada na planilha: a impressão não bate e ela é gerada de novo
+    registros[1]["PLACA"] = "ZZZ9999"
+    gerados = []
+    gerar_registro = autodocs._gerar_registro_protegido
+    def contar_geracao(pessoa):
+        gerados.append(pessoa["linha"])
+        return gerar_registro(pessoa)
+    monkeypatch.setattr(autodocs, "_gerar_registro_protegido", contar_geracao)
+    cliente.contador.zerar()
+
+    relatorio = autodocs.gerar_documentos(registros)
+    assert gerados == [3]
+    assert relatorio["retomados"] == 3 and relatorio["status_atualizados"] == 4
+    assert cliente.contador.chamadas == {"values.batchUpdate": 1} # Só o envio do status
+    assert status_na_planilha(aba, headers) == ["GERADO"] * 4
+    assert autodocs.ler_diario() is None # Todo status gravado: o diário foi apagado
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""Exclusão de linhas no Google Sheets (seção 5.8): trechos contíguos, exclusão definitiva e aba de excluídos."""
+import pytest
+
+import autodocs
+from planilha_falsa import AbaFalsa
+
+CABECALHO = ["Carimbo", "NOME", autodocs.STATUS_COL]
+
+
+def criar_fonte(cliente, quantidade=8):
+    linhas = [CABECALHO] + [[f"c{linha}", f"NOME {linha}", ""] for linha in range(2, quantidade + 2)]
+    aba = cliente.criar_planilha("Respostas").adicionar_aba("Form", linhas, linhas_grade=len(linhas) + 10)
+    return autodocs.FonteGoogleSheets(aba)
+
+
+def nomes(aba):
+    return [linha[1] for linha in aba.linhas[1:]]
+
+
+@pytest.mark.parametrize("linhas, faixas", [
+    ([], []),
+    ([5], [(5, 1)]),
+    ([9, 8, 7, 3], [(7, 3), (3, 1)]),
+    ([9, 7, 5], [(9, 1), (7, 1), (5, 1)]),
+    ([6, 5, 4, 3, 2], [(2, 5)]),
+    ([12, 11, 4, 3, 2], [(11, 2), (2, 3)]),
+])
+def test_faixas_decrescentes(linhas, faixas):
+    assert autodocs._faixas_decrescentes(linhas) == faixas
+
+
+CASOS = [[2], [9], [3, 4, 5], [2, 9], [4, 2, 7, 8, 3], [5, 5, 6], list(range(2, 10))]
+
+
+@pytest.mark.parametrize("linhas", CASOS)
+def test_exclusao_definitiva_mantem_a_ordem(pasta, cliente, linhas):
+    fonte = criar_fonte(cliente)
+    restantes = [f"NOME {linha}" for linha in range(2, 10) if linha not in linhas]
+    fonte.excluir_linhas(linhas)
+    assert nomes(fonte.worksheet) == restantes
+    assert cliente.contador.chamadas == {"batchUpdate": 1}
+
+
+@pytest.mark.parametrize("linhas", CASOS)
+def test_arquivamento_move_as_linhas_na_ordem_da_planilha(pasta, cliente, linhas):
+    fonte = criar_fonte(cliente)
+    fonte.arquivar_linhas(linhas)
+    arquivo = fonte.worksheet.spreadsheet.worksheet("Form" + autodocs.SUFIXO_ARQUIVO_EXCLUIDOS)
+    assert arquivo.linhas[0] == CABECALHO
+    assert nomes(arquivo) == [f"NOME {linha}" for linha in sorted(set(linhas))]
+    assert nomes(fonte.worksheet) == [f"NOME {linha}" for linha in range(2, 10) if linha not in linhas]
+    assert cliente.contador.chamadas == {"batchUpdate": 1} # Criação da aba, cópias e exclusões juntas
+
+
+def test_arquivamento_seguinte_acrescenta_no_fim(pasta, cliente):
+    fonte = criar_fonte(cliente)
+    fonte.arquivar_linhas([5, 3])
+    fonte.worksheet.linhas[0].append("COLUNA NOVA") # Aba de respostas ganhou uma coluna depois do primeiro arquivamento
+    fonte.worksheet.linhas[1].append("extra")
+    fonte.worksheet._colunas_grade = 30
+    fonte.arquivar_linhas([2, 7]) # NOME 2 e NOME 9 (as linhas já subiram duas posições)
+    arquivo = fonte.worksheet.spreadsheet.worksheet("Form" + autodocs.SUFIXO_ARQUIVO_EXCLUIDOS)
+    assert nomes(arquivo) == ["NOME 3", "NOME 5", "NOME 2", "NOME 9"]
+    assert arquivo.linhas[3] == ["c2", "NOME 2", "", "extra"] and arquivo.col_count == 30
+    assert nomes(fonte.worksheet) == ["NOME 4", "NOME 6", "NOME 7", "NOME 8"]
+
+
+def test_falha_no_arquivamento_nao_deixa_aba_sem_cabecalho(pasta, cliente, monkeypatch):
+    fonte = criar_fonte(cliente)
+    excluir = AbaFalsa._excluir_linhas
+    def recusar(self, inicio, fim): raise ValueError("batchUpdate recusada")
+    monkeypatch.setattr(AbaFalsa, "_excluir_linhas", recusar) # Última requisição da batchUpdate
+    with pytest.raises(ValueError):
+        fonte.arquivar_linhas([3, 4])
+    assert "Form" + autodocs.SUFIXO_ARQUIVO_EXCLUIDOS not in fonte.worksheet.spreadsheet.abas
+    assert nomes(fonte.worksheet) == [f"NOME {linha}" for linha in range(2, 10)]
+
+    monkeypatch.setattr(AbaFalsa, "_excluir_linhas", excluir)
+    fonte.arquivar_linhas([3, 4]) # Nova tentativa cria a aba normalmente
+    arquivo = fonte.worksheet.spreadsheet.worksheet("Form" + autodocs.SUFIXO_ARQUIVO_EXCLUIDOS)
+    assert arquivo.linhas[0] == CABECALHO and nomes(arquivo) == ["NOME 3", "NOME 4"]
+
+
+@pytest.mark.parametrize("excluidas", [[3], [2, 3, 4], [9, 2, 5, 5], list(range(2, 10))])
+def test_exclusao_em_memoria_desloca_os_registros(monkeypatch, excluidas):
+    monkeypatch.setattr(autodocs, "dados_pf_processados", [{"linha": linha, "NOME": f"NOME {linha}"} for linha in range(2, 10)])
+    autodocs.aplicar_exclusao_em_memoria("PF", excluidas)
+    restantes = [f"NOME {linha}" for linha in range(2, 10) if linha not in excluidas]
+    # Mesma numeração que a planilha terá depois da exclusão
+    assert [(r["linha"], r["NOME"]) for r in autodocs.dados_pf_processados] == list(zip(range(2, 2 + len(restantes)), restantes))
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""Cache de metadados (seção 5.5): token só com REAPROVEITAR_TOKEN e gravação segura com PF e PJ em paralelo."""
+import datetime
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+import autodocs
+
+
+@pytest.fixture
+def metadados(pasta, monkeypatch):
+    monkeypatch.setattr(autodocs, "USAR_CACHE_METADADOS", True)
+    monkeypatch.setattr(autodocs, "_metadados", None)
+    return Path(autodocs.PASTA_CACHE) / autodocs.ARQUIVO_METADADOS
+
+
+def cliente_com_token(minutos):
+    expira = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None) + datetime.timedelta(minutes=minutos)
+    credenciais = SimpleNamespace(service_account_email="conta@projeto", token="tk", expiry=expira)
+    return SimpleNamespace(http_client=SimpleNamespace(auth=credenciais))
+
+
+@pytest.mark.parametrize("minutos, reaproveitado", [(30, True), (2, False), (-10, False)])
+def test_token_reaproveitado_enquanto_valer(metadados, monkeypatch, minutos, reaproveitado):
+    monkeypatch.setattr(autodocs, "REAPROVEITAR_TOKEN", True)
+    autodocs.salvar_token(cliente_com_token(minutos))
+    monkeypatch.setattr(autodocs, "_metadados", None) # Nova execução: relê o arquivo
+    credenciais = SimpleNamespace(service_account_email="conta@projeto", token=None, expiry=None)
+    assert autodocs.reaproveitar_token(credenciais) is reaproveitado
+    assert credenciais.token == ("tk" if reaproveitado else None)
+
+
+def test_token_desligado_nao_e_gravado_e_o_antigo_e_descartado(metadados, monkeypatch):
+    monkeypatch.setattr(autodocs, "REAPROVEITAR_TOKEN", True)
+    autodocs.salvar_token(cliente_com_token(30))
+    assert "token" in json.loads(metadados.read_text("utf-8"))
+
+    monkeypatch.setattr(autodocs, "REAPROVEITAR_TOKEN", False)
+    autodocs.salvar_token(cliente_com_token(30))
+    assert "token" not in json.loads(metadados.read_text("utf-8"))
+    credenciais = SimpleNamespace(service_account_email="conta@projeto", token=None, expiry=None)
+    assert autodocs.reaproveitar_token(credenciais) is False
+
+
+def test_gravacoes_paralelas_nao_corrompem_o_arquivo(metadados, monkeypatch, capsys):
+    substituir = os.replace
+    def substituir_devagar(origem, destino):
+        time.sleep(0.01); substituir(origem, destino)
+    monkeypatch.setattr(autodocs.os, "replace", substituir_devagar) # Alarga a janela entre gravar o temporário e trocar
+
+    def abrir(tipo): # Como abrir_aba de PF e PJ na primeira execução
+        with autodocs._trava_metadados:
+            autodocs._ler_metadados()["planilhas"][tipo] = {"chave": f"chave-{tipo}"}
+        autodocs._salvar_metadados()
+    threads = [threading.Thread(target=abrir, args=(f"T{i}",)) for i in range(8)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+
+    assert "Aviso" not in capsys.readouterr().out
+    assert set(json.loads(metadados.read_text("utf-8"))["planilhas"]) == {f"T{i}" for i in range(8)}
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+"""Pré-preenchimento incremental (seções 4 e 4.1) sobre a planilha falsa: estado, marca d'água e volta à conferência completa."""
+import json
+from pathlib import Path
+
+import pytest
+
+import autodocs
+from conftest import carregar_pf, criar_aba_pf
+
+CABECALHO = ["Carimbo de data/hora", autodocs.COL_CADASTRO, autodocs.COL_PF_ID_TRIGGER, autodocs.COL_PF_ID_COMPARISON,
+             "NOME COMPLETO", "ENDERECO", "PLACA", autodocs.STATUS_COL]
+NOME, ENDERECO = CABECALHO.index("NOME COMPLETO"), CABECALHO.index("ENDERECO")
+
+
+def fonte(carimbo, cpf, nome, endereco="rua 1", placa="AAA0001"):
+    return [carimbo, "PRIMEIRO CADASTRO", "", cpf, nome, endereco, placa, ""]
+
+
+def alvo(carimbo, cpf, placa="BBB0001"):
+    return [carimbo, autodocs.TRIGGER_VALUE, cpf, "", "", "", placa, ""]
+
+
+def valor(aba, linha, coluna):
+    valores = aba.linhas[linha - 1]
+    return valores[coluna] if coluna < len(valores) else ""
+
+
+def preencher(cliente, capsys):
+    """Uma carga com pré-preenchimento (envia as células e grava o estado). Retorna (registros, log)."""
+    sheet, headers, dados = carregar_pf(cliente)
+    dados = autodocs.preencher_e_atualizar_planilha(sheet, headers, dados, autodocs.COL_PF_ID_TRIGGER, autodocs.COL_PF_ID_COMPARISON,
+                                                    autodocs.COL_CADASTRO, autodocs.TRIGGER_VALUE)
+    return dados, capsys.readouterr().out
+
+
+def estado_salvo(pasta):
+    return next(iter(json.loads(Path(autodocs.PASTA_CACHE, autodocs.ARQUIVO_PRE_PREENCHIMENTO).read_text("utf-8"))["estados"].values()))
+
+
+def test_alvo_novo_resolvido_com_fonte_antiga(pasta, cliente, capsys):
+    aba = criar_aba_pf(cliente, [CABECALHO, fonte("c1", "111", "ANA"), fonte("c2", "222", "BIA", "rua 2")])
+    preencher(cliente, capsys)
+    assert estado_salvo(pasta)["marca_agua"] == 3 # Próximo registro a processar (1-based)
+
+    aba.linhas.append(alvo("c3", "111"))
+    _, log = preencher(cliente, capsys)
+    assert "Pré-preenchimento incremental: 1 linha(s) nova(s), 0 alvo(s) pendente(s)." in log
+    assert (valor(aba, 4, NOME), valor(aba, 4, ENDERECO), valor(aba, 4, 3)) == ("ANA", "rua 1", "111")
+    estado = estado_salvo(pasta)
+    assert estado["marca_agua"] == 4 and estado["alvos"] == {"111": [4]}
+
+
+def test_alvo_pendente_resolvido_depois(pasta, cliente, capsys):
+    aba = criar_aba_pf(cliente, [CABECALHO, fonte("c1", "111", "ANA"), alvo("c2", "333")])
+    preencher(cliente, capsys)
+    assert estado_salvo(pasta)["pendentes"] == [3]
+    assert valor(aba, 3, NOME) == ""
+
+    aba.linhas.append(fonte("c3", "333", "CAIO", "rua 3"))
+    _, log = preencher(cliente, capsys)
+    assert "1 linha(s) nova(s), 1 alvo(s) pendente(s)" in log
+    assert (valor(aba, 3, NOME), valor(aba, 3, ENDERECO)) == ("CAIO", "rua 3")
+    assert estado_salvo(pasta)["pendentes"] == []
+
+
+def test_exclusao_pelo_app_desloca_o_estado(pasta, cliente, capsys):
+    aba = criar_aba_pf(cliente, [CABECALHO, fonte("c1", "111", "ANA"), fonte("c2", "", "SEM CPF"), fonte("c3", "222", "BIA", "rua 2"),
+                                 alvo("c4", "222")])
+    preencher(cliente, capsys)
+    assert estado_salvo(pasta)["fontes"] == {"111": 2, "222": 4}
+
+    sheet, _, _ = carregar_pf(cliente)
+    sheet.excluir_linhas([3]) # Como excluir_registros: planilha, snapshot e estado
+    autodocs.pre_preenchimento_remover_linhas(sheet, [3])
+    estado = estado_salvo(pasta)
+    assert estado["fontes"] == {"111": 2, "222": 3}
+    assert estado["alvos"] == {"222": [4]} and estado["marca_agua"] == 4
+
+    aba.linhas.append(alvo("c5", "222", "CCC0001"))
+    _, log = preencher(cliente, capsys)
+    assert "Pré-preenchimento incremental: 1 linha(s) nova(s)" in log and "desatualizado" not in log
+    assert (valor(aba, 5, NOME), valor(aba, 5, ENDERECO)) == ("BIA", "rua 2")
+
+
+@pytest.mark.parametrize("alteracao", ["insercao", "exclusao"])
+def test_alteracao_fora_do_app_volta_a_conferir_tudo(pasta, cliente, capsys, alteracao):
+    aba = criar_aba_pf(cliente, [CABECALHO, fonte("c1", "111", "ANA"), fonte("c2", "222", "BIA", "rua 2"), alvo("c3", "111")])
+    preencher(cliente, capsys)
+
+    if alteracao == "insercao": aba.linhas.insert(2, alvo("c9", "222")) # Linha inserida no meio, direto na planilha
+    else: del aba.linhas[1] # Fonte 111 excluída direto na planilha (o alvo dela continua preenchido)
+    _, log = preencher(cliente, capsys)
+    assert "Pré-preenchimento incremental" not in log # Estado descartado: conferência completa
+    if alteracao == "insercao": assert (valor(aba, 3, NOME), valor(aba, 3, ENDERECO)) == ("BIA", "rua 2")
+    _, log = preencher(cliente, capsys)
+    assert "Pré-preenchimento incremental: 0 linha(s) nova(s)" in log # O estado novo vale na carga seguinte
+
+
+def test_indice_desatualizado_desfaz_a_passada_incremental(pasta, cliente, capsys, monkeypatch):
+    monkeypatch.setattr(autodocs, "USAR_SNAPSHOT", False) # A troca abaixo também engana o snapshot; aqui só o estado do pré-preenchimento
+    linhas = [CABECALHO, fonte("c1", "111", "ANA"), fonte("c2", "", "SEM CPF"), fonte("c3", "222", "BIA", "rua 2"), alvo("c4", "111")]
+    aba = criar_aba_pf(cliente, linhas)
+    preencher(cliente, capsys)
+
+    # Fora do app: exclui uma linha e repete a última, então a conferência da marca d'água ainda bate,
+    # mas o índice aponta 222 para a linha 4, que agora é um alvo
+    ultima = list(aba.linhas[-1])
+    del aba.linhas[2]
+    aba.linhas += [ultima, alvo("c5", "111", "CCC0001"), alvo("c6", "222", "DDD0001")]
+    dados, log = preencher(cliente, capsys)
+    assert "desatualizado" in log
+    assert (valor(aba, 6, NOME), valor(aba, 7, NOME), valor(aba, 7, ENDERECO)) == ("ANA", "BIA", "rua 2")
+    assert dados[5]["NOME COMPLETO"] == "BIA" # Em memória, o mesmo que foi gravado
+
+
+def test_verificacao_repropaga_sem_sobrescrever_o_digitado_no_alvo(pasta, cliente, capsys, monkeypatch):
+    aba = criar_aba_pf(cliente, [CABECALHO, fonte("c1", "111", "ANA", "rua 1"), alvo("c2", "111"), alvo("c3", "111", "CCC0001")])
+    preencher(cliente, capsys)
+    aba.linhas[3][ENDERECO] = "rua digitada" # Editado no próprio alvo
+    aba.linhas[1][ENDERECO] = "rua nova"; aba.linhas[1][NOME] = "ANA MARIA" # Fonte editada
+
+    _, log = preencher(cliente, capsys)
+    assert valor(aba, 3, ENDERECO) == "rua 1" # Sem --verify-prefill, as linhas antigas não são conferidas
+
+    monkeypatch.setattr(autodocs, "VERIFICAR_PRE_PREENCHIMENTO", True)
+    _, log = preencher(cliente, capsys)
+    assert "1 editada(s), 3 célula(s) repropagada(s)" in log
+    assert (valor(aba, 3, NOME), valor(aba, 3, ENDERECO)) == ("ANA MARIA", "rua nova")
+    assert (valor(aba, 4, NOME), valor(aba, 4, ENDERECO)) == ("ANA MARIA", "rua digitada")
+
+
+def test_carga_com_estado_limpa_as_linhas_antigas_como_a_completa(pasta, cliente, capsys):
+    criar_aba_pf(cliente, [CABECALHO, fonte("c1", "111", " ANA ", " rua 1 "), alvo("c2", "111")])
+    frio, _ = preencher(cliente, capsys)
+    quente, log = preencher(cliente, capsys)
+    assert "Pré-preenchimento incremental" in log
+    assert [r.contexto() for r in quente] == [r.contexto() for r in frio]
+    assert [autodocs.impressao_registro(r) for r in quente] == [autodocs.impressao_registro(r) for r in frio]
+    assert quente[0]["NOME COMPLETO"] == "ANA"
+
+
+def test_projecao_nao_restringe_as_colunas_copiadas(pasta, cliente, capsys, monkeypatch):
+    digitado = alvo("c3", "111", "CCC0001"); digitado[ENDERECO] = "rua digitada"
+    aba = criar_aba_pf(cliente, [CABECALHO, fonte("c1", "111", "ANA", "rua 1"), alvo("c2", "111"), digitado])
+    # Só NOME COMPLETO vem dos templates (mais as colunas de controle): ENDERECO fica fora da projeção
+    colunas = autodocs.colunas_usadas("PF", {"modelo.docx": {"{NOME COMPLETO}"}})
+    assert "ENDERECO" not in colunas
+
+    def preencher_projetado():
+        sheet, headers, dados = carregar_pf(cliente, colunas)
+        cliente.contador.zerar()
+        dados = autodocs.preencher_e_atualizar_planilha(sheet, headers, dados, autodocs.COL_PF_ID_TRIGGER, autodocs.COL_PF_ID_COMPARISON,
+                                                        autodocs.COL_CADASTRO, autodocs.TRIGGER_VALUE, colunas=colunas)
+        return dados, capsys.readouterr().out, cliente.contador.chamadas.get("values.batchGet", 0)
+
+    dados, log, leituras = preencher_projetado()
+    assert (valor(aba, 3, NOME), valor(aba, 3, ENDERECO)) == ("ANA", "rua 1") # Coluna fora dos templates também é copiada
+    assert (valor(aba, 4, NOME), valor(aba, 4, ENDERECO)) == ("ANA", "rua digitada") # O digitado no alvo não é sobrescrito
+    assert dados[1]["ENDERECO"] == "rua 1"
+    assert "3 linha(s) completa(s) lida(s)" in log and leituras == 1 # Fonte e alvos envolvidos, numa só leitura
+
+    aba.linhas.append(alvo("c4", "111", "DDD0001"))
+    _, log, leituras = preencher_projetado()
+    assert "Pré-preenchimento incremental: 1 linha(s) nova(s)" in log
+    assert "2 linha(s) completa(s) lida(s)" in log and leituras == 1 # Só o alvo novo e a fonte dele
+    assert valor(aba, 5, ENDERECO) == "rua 1"
+
+    aba.linhas[1][ENDERECO] = "rua nova" # Fonte editada numa coluna fora da projeção
+    monkeypatch.setattr(autodocs, "VERIFICAR_PRE_PREENCHIMENTO", True)
+    _, log, _ = preencher_projetado()
+    assert "1 editada(s), 2 célula(s) repropagada(s)" in log
+    assert [valor(aba, linha, ENDERECO) for linha in (3, 4, 5)] == ["rua nova", "rua digitada", "rua nova"]
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+"""Snapshot local das respostas (seção 5.2): junção dos blocos, linhas editadas/acrescentadas/excluídas e a marca d'água."""
+import pytest
+
+import autodocs
+
+CABECALHO = ["Carimbo", "NOME", "CPF", "PLACA", autodocs.STATUS_COL]
+STATUS = CABECALHO.index(autodocs.STATUS_COL)
+
+
+def linhas_iniciais():
+    return [CABECALHO] + [[f"c{i}", f"NOME {i}", f"{i:03d}", f"AAA000{i}", ""] for i in range(1, 5)]
+
+
+def criar_aba(cliente, linhas):
+    return cliente.criar_planilha("Respostas").adicionar_aba("Form", linhas, linhas_grade=len(linhas) + 50)
+
+
+def na_planilha(aba, colunas=None):
+    """Linhas da aba (sem o cabeçalho) como a API devolve; com `colunas`, só elas (as demais vazias)."""
+    linhas = [[v if colunas is None or i in colunas else "" for i, v in enumerate(linha)] for linha in aba.linhas[1:]]
+    return [autodocs._sem_vazios_finais(linha) for linha in linhas]
+
+
+def sincronizar(aba, capsys, projetar=None):
+    """Retorna (linhas, log, chamadas values.batchGet)."""
+    aba.spreadsheet.contador.zerar()
+    _, linhas = autodocs.sincronizar_aba(aba, projetar)
+    return [autodocs._sem_vazios_finais(linha) for linha in linhas], capsys.readouterr().out, aba.spreadsheet.contador.chamadas.get("values.batchGet", 0)
+
+
+@pytest.mark.parametrize("colunas, blocos", [
+    (set(), []),
+    ({3}, [(3, 3)]),
+    ({0, 1, 2}, [(0, 2)]),
+    ({0, 1, 2, 5, 7, 8}, [(0, 2), (5, 5), (7, 8)]),
+    ({8, 0, 7}, [(0, 0), (7, 8)]),
+])
+def test_blocos_colunas(colunas, blocos):
+    assert autodocs._blocos_colunas(colunas) == blocos
+
+
+@pytest.mark.parametrize("blocos, respostas, linhas", [
+    (None, [[["a", "b"], ["c"]]], [["a", "b"], ["c"]]),
+    ([(0, 1), (3, 3)], [[["a", "b"], ["c", "d"]], [["x"], ["y"]]], [["a", "b", "", "x"], ["c", "d", "", "y"]]),
+    # Blocos irregulares: a API omite as vazias do fim de cada trecho e as linhas vazias do fim de cada intervalo
+    ([(0, 1), (3, 4)], [[["a"], ["c", "d"], ["e"]], [["x", "z"]]], [["a", "", "", "x", "z"], ["c", "d"], ["e"]]),
+    ([(0, 0), (2, 2)], [[], [[], ["y"]]], [[], ["", "", "y"]]),
+    ([(1, 1)], [[]], []),
+])
+def test_montar_linhas_junta_os_blocos(blocos, respostas, linhas):
+    assert autodocs._montar_linhas(blocos, respostas) == linhas
+
+
+def acrescentar(aba):
+    aba.linhas += [["c5", "NOME 5", "005", "AAA0005"], ["c6", "NOME 6", "006"]]
+
+def editar_status(aba):
+    aba.linhas[2][STATUS] = "GERADO"; aba.linhas[4][STATUS] = "ERRO"
+
+def editar_e_acrescentar(aba):
+    editar_status(aba); acrescentar(aba)
+
+def excluir_no_meio(aba):
+    del aba.linhas[2]
+
+def excluir_a_ultima(aba):
+    del aba.linhas[-1]
+
+def inserir_no_meio(aba):
+    aba.linhas.insert(2, ["c9", "NOME 9", "009", "AAA0009", ""])
+
+def mudar_cabecalho(aba):
+    aba.linhas[0][1] = "NOME COMPLETO"
+
+
+@pytest.mark.parametrize("alterar, log, chamadas", [
+    (acrescentar, "4 linha(s) em cache, 2 nova(s), 0 status atualizado(s)", 1),
+    (editar_status, "4 linha(s) em cache, 0 nova(s), 2 status atualizado(s)", 1),
+    (editar_e_acrescentar, "4 linha(s) em cache, 2 nova(s), 2 status atualizado(s)", 1),
+    # A linha da marca d'água não bate: exclusão/inserção fora do app, a aba inteira é relida
+    (excluir_no_meio, "excluídas/inseridas fora do app", 2),
+    (excluir_a_ultima, "excluídas/inseridas fora do app", 2),
+    (inserir_no_meio, "excluídas/inseridas fora do app", 2),
+    (mudar_cabecalho, "cabeçalho de 'Form' mudou", 2),
+])
+def test_sincronizacao_incremental(pasta, cliente, capsys, alterar, log, chamadas):
+    aba = criar_aba(cliente, linhas_iniciais())
+    linhas, saida, _ = sincronizar(aba, capsys)
+    assert linhas == na_planilha(aba) and "baixada por completo" in saida
+
+    alterar(aba)
+    linhas, saida, lidas = sincronizar(aba, capsys)
+    assert log in saida and lidas == chamadas
+    assert linhas == na_planilha(aba)
+    linhas, saida, lidas = sincronizar(aba, capsys) # O snapshot gravado vale na abertura seguinte
+    assert linhas == na_planilha(aba) and "0 nova(s), 0 status atualizado(s)" in saida and lidas == 1
+
+
+def test_celulas_gravadas_pelo_app_entram_no_snapshot(pasta, cliente, capsys):
+    aba = criar_aba(cliente, linhas_iniciais())
+    fonte = autodocs.FonteGoogleSheets(aba)
+    sincronizar(aba, capsys)
+    # Colunas além do fim da linha e uma linha ainda não sincronizada (ignorada pelo snapshot, vem como nova)
+    fonte.gravar_celulas({(2, STATUS + 1): "GERADO", (3, 2): "OUTRO NOME", (3, 7): "extra", (6, 1): "c5"})
+    linhas, saida, _ = sincronizar(aba, capsys)
+    assert "4 linha(s) em cache, 1 nova(s), 0 status atualizado(s)" in saida
+    assert linhas == na_planilha(aba)
+    assert linhas[1] == ["c2", "OUTRO NOME", "002", "AAA0002", "", "", "extra"]
+
+
+@pytest.mark.parametrize("excluidas", [[2], [3, 4], [5], [2, 5], [2, 3, 4, 5]])
+def test_exclusao_pelo_app_desloca_o_snapshot(pasta, cliente, capsys, excluidas):
+    aba = criar_aba(cliente, linhas_iniciais())
+    sincronizar(aba, capsys)
+    autodocs.FonteGoogleSheets(aba).excluir_linhas(excluidas) # Planilha e snapshot
+    acrescentar(aba)
+    linhas, saida, lidas = sincronizar(aba, capsys)
+    assert "fora do app" not in saida and lidas == 1
+    assert f"{4 - len(excluidas)} linha(s) em cache, 2 nova(s)" in saida
+    assert linhas == na_planilha(aba)
+
+
+def test_projecao_baixa_so_as_colunas_pedidas(pasta, cliente, capsys):
+    aba = criar_aba(cliente, linhas_iniciais())
+    projetar = lambda cabecalho: {cabecalho.index("CPF"), cabecalho.index(autodocs.STATUS_COL)}
+    linhas, saida, lidas = sincronizar(aba, capsys, projetar)
+    assert linhas == na_planilha(aba, {2, STATUS}) and "2 de 5 colunas" in saida and lidas == 2 # Cabeçalho antes
+
+    acrescentar(aba); editar_status(aba)
+    linhas, saida, lidas = sincronizar(aba, capsys, projetar)
+    assert linhas == na_planilha(aba, {2, STATUS}) and "2 nova(s) (2 de 5 colunas), 2 status" in saida and lidas == 1
+
+    del aba.linhas[1] # Marca d'água conferida só nas colunas projetadas
+    linhas, saida, _ = sincronizar(aba, capsys, projetar)
+    assert "fora do app" in saida and linhas == na_planilha(aba, {2, STATUS})
+
+    # Template novo pede uma coluna que não está no cache: relê tudo com a projeção nova
+    linhas, saida, _ = sincronizar(aba, capsys, lambda cabecalho: {1, 2, STATUS})
+    assert "não estão no cache" in saida and linhas == na_planilha(aba, {1, 2, STATUS})
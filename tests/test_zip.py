@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""Motor zip (seção 3.2): a saída é um pacote válido e os membros sem placeholders saem idênticos aos do template."""
+import zipfile
+
+import pytest
+
+import autodocs
+import sinteticos
+
+COLUNAS = ["NOME COMPLETO", "CPF", "PLACA", "CIDADE"]
+DADOS = {"NOME COMPLETO": "ANA SOUZA", "CPF": "111.222.333-44", "PLACA": "ABC1D23", "CIDADE": "RECIFE"}
+
+
+@pytest.fixture(params=["bruta", "api-publica"])
+def copia(request, monkeypatch):
+    """Cópia bruta (versão suportada) ou a alternativa pela API pública do zipfile (versão fora da faixa)."""
+    if request.param == "api-publica": monkeypatch.setattr(autodocs, "VERSOES_PYTHON_COPIA_BRUTA", ((0, 0), (0, 0)))
+    return request.param
+
+
+def conferir_pacote(template, saida, copia):
+    """testzip sem erros e, para cada membro copiado bruto, mesmo CRC (e mesmos bytes comprimidos, na cópia bruta)."""
+    with zipfile.ZipFile(saida) as zip_saida: assert zip_saida.testzip() is None
+    with zipfile.ZipFile(template) as zt, zipfile.ZipFile(saida) as zs:
+        assert zs.namelist() == zt.namelist()
+        conteudo_template, conteudo_saida = template.read_bytes(), saida.read_bytes()
+        copiados = 0
+        for info in zt.infolist():
+            novo = zs.getinfo(info.filename)
+            if zs.read(info.filename) != zt.read(info.filename): continue # Parte reescrita com os dados
+            copiados += 1
+            assert (novo.CRC, novo.file_size, novo.date_time) == (info.CRC, info.file_size, info.date_time)
+            if copia == "bruta":
+                assert autodocs._bytes_comprimidos(conteudo_saida, novo) == autodocs._bytes_comprimidos(conteudo_template, info)
+        assert copiados >= len(zt.infolist()) - 3 # Só corpo/cabeçalho (ou strings) mudam
+
+
+def test_docx_ida_e_volta(tmp_path, copia, monkeypatch):
+    monkeypatch.setattr(autodocs, "MOTOR_DOCX", "zip")
+    template, saida = tmp_path / "modelo.docx", tmp_path / "saida.docx"
+    sinteticos.gerar_template_docx(template, COLUNAS, n_paragrafos=20, densidade=0.5)
+    autodocs.renderizar_docx(template, DADOS, saida)
+
+    conferir_pacote(template, saida, copia)
+    documento = autodocs.docx.Document(saida)
+    assert documento.sections[0].header.paragraphs[0].text == "Cadastro de ANA SOUZA"
+    assert [linha.cells[1].text for linha in documento.tables[0].rows] == [DADOS[c] for c in COLUNAS]
+    assert "{" not in "".join(p.text for p in documento.paragraphs)
+
+
+def test_xlsx_ida_e_volta(tmp_path, copia, monkeypatch):
+    monkeypatch.setattr(autodocs, "MOTOR_XLSX", "zip")
+    template, saida = tmp_path / "modelo.xlsx", tmp_path / "saida.xlsx"
+    sinteticos.gerar_template_xlsx(template, COLUNAS, n_linhas=20, densidade=0.5)
+    autodocs.renderizar_xlsx(template, DADOS, saida)
+
+    conferir_pacote(template, saida, copia)
+    valores = [c.value for linha in autodocs.openpyxl.load_workbook(saida).active.iter_rows() for c in linha]
+    assert valores and not any("{" in str(v) for v in valores)
+    assert any(str(v).startswith("Campo: ") for v in valores)